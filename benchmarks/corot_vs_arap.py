@@ -0,0 +1,79 @@
+'''
+Build and per-step cost of the linearized corotational model against the ARAP local-global solver, on a rig
+animation clip. Only timings are compared: fast_cd_corot_sim has no density (its inertia is unscaled) while
+fast_cd_arap_sim scales it by rho, so their trajectories don't simulate the same creature and their difference
+isn't an accuracy measure.
+
+    python benchmarks/corot_vs_arap.py [--msh-file ...] [--rig-file ...] [--anim-file ...] [--json out.json]
+'''
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+import fast_cody as fcd
+
+
+def run(sim, Prel, m):
+    st = fcd.fast_cd_state(np.zeros((m, 1)), Prel[:, [0]])
+    z = np.zeros((m, 1))
+    times = np.zeros(Prel.shape[1])
+    for i in range(Prel.shape[1]):
+        p = Prel[:, [i]]
+        start = time.perf_counter()
+        sim.step_into(p, st, out=z)
+        times[i] = time.perf_counter() - start
+        st.update(z, p)
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark fast_cd_sim model=\"corot\" against model=\"arap\"")
+    parser.add_argument("--msh-file", default=fcd.get_data("cd_fish.msh"))
+    parser.add_argument("--rig-file", default=fcd.get_data("cd_fish_rig.json"))
+    parser.add_argument("--anim-file", default=fcd.get_data("cd_fish_rig_anim__swim.json"))
+    parser.add_argument("--num-modes", type=int, default=16)
+    parser.add_argument("--num-clusters", type=int, default=100)
+    parser.add_argument("--mu", type=float, default=1e4)
+    parser.add_argument("--lam", type=float, default=0.0)
+    parser.add_argument("--cache-dir", default="./cache/")
+    parser.add_argument("--json", default=None, help="where to write the results")
+    args = parser.parse_args(argv)
+
+    pre = fcd.build(msh_file=args.msh_file, rig_file=args.rig_file, num_modes=args.num_modes,
+                    num_clusters=args.num_clusters, mu=args.mu, cache_dir=args.cache_dir, read_cache=True,
+                    build_sim=False)
+    [V, T, B, l, J] = [pre["V"], pre["T"], pre["B"], pre["l"], pre["J"]]
+    Prel = fcd.rig_anim_to_prel(args.anim_file, pre["rig"][3], pre["so"], pre["to"])
+    frames = Prel.shape[1]
+    m = B.shape[1]
+
+    results = {}
+    for model in ["arap", "corot"]:
+        start = time.perf_counter()
+        sim = fcd.fast_cd_sim(V, T, B, l, J, mu=args.mu, model=model, lam=args.lam)
+        build_time = time.perf_counter() - start
+        times = run(sim, Prel, m)
+        results[model] = dict(build_time=build_time, mean_step_time=float(times.mean()),
+                              p95_step_time=float(np.percentile(times, 95)), max_step_time=float(times.max()))
+
+    results["speedup"] = results["arap"]["mean_step_time"] / results["corot"]["mean_step_time"]
+
+    print("%-8s %10s %10s %10s %10s" % ("model", "build s", "mean ms", "p95 ms", "max ms"))
+    for model in ["arap", "corot"]:
+        r = results[model]
+        print("%-8s %10.3f %10.3f %10.3f %10.3f" % (model, r["build_time"], 1e3 * r["mean_step_time"],
+                                                    1e3 * r["p95_step_time"], 1e3 * r["max_step_time"]))
+    print("corot speedup: %.2fx over %d frames" % (results["speedup"], frames))
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(dict(msh_file=args.msh_file, anim_file=args.anim_file, frames=int(frames), num_modes=m,
+                           **results), f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
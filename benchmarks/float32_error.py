@@ -0,0 +1,83 @@
+'''
+Error and cost of single precision against double precision, on a rig animation clip:
+    - the reduced state, simulating the clip with linear_cd_sim in float64 and float32
+    - the reconstruction J p + B z of the full space positions, with float64 and float32 J, B and z
+    - the footprint of the dense B, J, Wp and Ws the reconstruction and viewer read
+Errors are relative to the float64 result, in the norm of the largest frame.
+
+    python benchmarks/float32_error.py [--msh-file ...] [--rig-file ...] [--anim-file ...] [--json out.json]
+'''
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+import fast_cody as fcd
+
+
+def rel_error(X, X64):
+    return float(np.abs(X.astype(np.float64) - X64).max() / max(np.abs(X64).max(), 1e-12))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark float32 against float64 simulation and reconstruction")
+    parser.add_argument("--msh-file", default=fcd.get_data("cd_fish.msh"))
+    parser.add_argument("--rig-file", default=fcd.get_data("cd_fish_rig.json"))
+    parser.add_argument("--anim-file", default=fcd.get_data("cd_fish_rig_anim__swim.json"))
+    parser.add_argument("--num-modes", type=int, default=16)
+    parser.add_argument("--num-clusters", type=int, default=100)
+    parser.add_argument("--mu", type=float, default=1e4)
+    parser.add_argument("--cache-dir", default="./cache/")
+    parser.add_argument("--json", default=None, help="where to write the results")
+    args = parser.parse_args(argv)
+
+    pre = fcd.build(msh_file=args.msh_file, rig_file=args.rig_file, num_modes=args.num_modes,
+                    num_clusters=args.num_clusters, mu=args.mu, cache_dir=args.cache_dir, read_cache=True,
+                    build_sim=False)
+    [V, T, B, J, Wp, Ws] = [pre["V"], pre["T"], pre["B"], pre["J"], pre["Wp"], pre["Ws"]]
+    Prel = fcd.rig_anim_to_prel(args.anim_file, pre["rig"][3], pre["so"], pre["to"])
+    frames = Prel.shape[1]
+
+    results = dict(frames=int(frames), num_vertices=int(V.shape[0]), num_modes=int(B.shape[1]))
+    Z = {}
+    for dtype in [np.float64, np.float32]:
+        name = np.dtype(dtype).name
+        sim = fcd.linear_cd_sim(V, T, B, J, mu=args.mu, dtype=dtype)
+        start = time.perf_counter()
+        Z[name] = sim.step_sequence(Prel.astype(dtype))
+        step_time = (time.perf_counter() - start) / frames
+
+        Bd = B.astype(dtype)
+        Jd = J.astype(dtype)
+        start = time.perf_counter()
+        U = Jd @ Prel.astype(dtype) + Bd @ Z[name].astype(dtype)
+        reconstruct_time = (time.perf_counter() - start) / frames
+        nbytes = sum(x.astype(dtype).nbytes for x in (B, J, Wp, Ws))
+        results[name] = dict(step_time=step_time, reconstruct_time=reconstruct_time, dense_bytes=int(nbytes),
+                             condition_number=float(np.linalg.cond(sim.A.astype(np.float64))))
+        if name == "float64":
+            U64 = U
+        else:
+            results[name].update(z_rel_error=rel_error(Z[name], Z["float64"]), u_rel_error=rel_error(U, U64),
+                                 u_max_abs_error=float(np.abs(U.astype(np.float64) - U64).max()))
+
+    r32 = results["float32"]
+    print("%d frames, %d vertices, %d modes" % (frames, V.shape[0], B.shape[1]))
+    print("%-8s %12s %16s %14s" % ("dtype", "step us", "reconstruct us", "dense MB"))
+    for name in ["float64", "float32"]:
+        r = results[name]
+        print("%-8s %12.2f %16.2f %14.2f" % (name, 1e6 * r["step_time"], 1e6 * r["reconstruct_time"],
+                                             r["dense_bytes"] / 2 ** 20))
+    print("float32 relative error: z %.2e, positions %.2e (max abs %.2e, cond %.2e)"
+          % (r32["z_rel_error"], r32["u_rel_error"], r32["u_max_abs_error"], r32["condition_number"]))
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(dict(msh_file=args.msh_file, anim_file=args.anim_file, **results), f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
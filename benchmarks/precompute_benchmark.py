@@ -0,0 +1,149 @@
+'''
+Wall time and peak memory of every precompute stage, on each tet mesh of the data directory:
+    read_msh, laplacian, momentum_leaking_matrix, complementary_constraint_matrix,
+    lbs_weight_space_constraint, eigs, skinning_clusters and fast_cd_sim construction
+Every creature gets the single affine handle rig, so the meshes are comparable. The eigs stage is
+laplacian_eigenmodes, so it also rebuilds the laplacian. Memory is measured with fcd.enable_profiling(memory=True):
+the tracemalloc peak of the stage above what was allocated before it, which covers numpy and scipy arrays, and
+the peak resident set size above the one before it, sampled by a background thread, which also covers the
+allocations of native extensions (eigs solvers, fast_cd_pyb). --no-memory turns both off for cleaner timings.
+
+Results are written as JSON, and compared against a --baseline JSON from an earlier run. A stage regresses if
+it is slower or uses more memory than the baseline by more than --tolerance (plus --min-time seconds and
+--min-rss MB of slack for noise), in which case the script exits with 1.
+
+    python benchmarks/precompute_benchmark.py [--data-dir data] [--meshes cd_fish dolphin] [--json out.json]
+                                              [--baseline base.json] [--tolerance 0.25]
+'''
+import os
+import gc
+import sys
+import glob
+import json
+import time
+import argparse
+
+import igl
+import numpy as np
+
+import fast_cody as fcd
+
+def measure(results, name, memory, func, *args, **kwargs):
+    gc.collect()
+    with fcd.profile_span(name):
+        start = time.perf_counter()
+        out = func(*args, **kwargs)
+        duration = time.perf_counter() - start
+    results[name] = dict(time=duration)
+    if memory:
+        # spans nested in the stage finish before it, so its own span is the last one
+        span = fcd.profiling_spans()[-1]
+        assert (span["name"] == name and "the stage span isn't the last one recorded")
+        results[name]["peak_bytes"] = span["memory"]["peak_bytes"]
+        results[name]["rss_peak_bytes"] = span["memory"]["rss_peak_bytes"]
+    return out
+
+
+def benchmark_mesh(msh_file, args):
+    memory = not args.no_memory
+    stages = {}
+    [V, F, T] = measure(stages, "read_msh", memory, fcd.read_msh, msh_file)
+    V = fcd.normalize_height_and_center(V, 1, np.zeros((1, 3)))
+    J = fcd.lbs_jacobian(V, np.ones((V.shape[0], 1)))
+    M = igl.massmatrix(V, T)
+
+    measure(stages, "laplacian", memory, fcd.laplacian, V, T)
+    D = measure(stages, "momentum_leaking_matrix", memory, fcd.momentum_leaking_matrix, V, T)
+    C = measure(stages, "complementary_constraint_matrix", memory, fcd.complementary_constraint_matrix,
+                V, T, J, M=M, D=D)
+    A = measure(stages, "lbs_weight_space_constraint", memory, fcd.lbs_weight_space_constraint, V, C)
+    del C
+    [W, E] = measure(stages, "eigs", memory, fcd.laplacian_eigenmodes, V, T, args.num_modes, J=A,
+                     constraint_enforcement="optimal")
+    l = measure(stages, "skinning_clusters", memory, fcd.skinning_clusters, W, E, T, args.num_clusters, l=2,
+                num_clustering_features=args.num_modes)
+    B = fcd.lbs_jacobian(V, W)
+    measure(stages, "fast_cd_sim", memory, fcd.fast_cd_sim, V, T, B, l, J, mu=args.mu)
+    return dict(num_vertices=int(V.shape[0]), num_tets=int(T.shape[0]), stages=stages)
+
+
+def compare(results, baseline, tolerance, min_time, min_rss):
+    failures = []
+    for [mesh, r] in results["meshes"].items():
+        if mesh not in baseline["meshes"]:
+            continue
+        base = baseline["meshes"][mesh]["stages"]
+        for [stage, s] in r["stages"].items():
+            if stage not in base:
+                continue
+            b = base[stage]
+            if s["time"] > b["time"] * (1 + tolerance) + min_time:
+                failures.append("%s %s time: %.3fs > %.3fs" % (mesh, stage, s["time"], b["time"]))
+            if "peak_bytes" in s and "peak_bytes" in b and s["peak_bytes"] > b["peak_bytes"] * (1 + tolerance):
+                failures.append("%s %s peak memory: %.1fMB > %.1fMB" % (mesh, stage, s["peak_bytes"] / 2 ** 20,
+                                                                       b["peak_bytes"] / 2 ** 20))
+            if "rss_peak_bytes" in s and "rss_peak_bytes" in b and \
+                    s["rss_peak_bytes"] > b["rss_peak_bytes"] * (1 + tolerance) + min_rss:
+                failures.append("%s %s peak rss: %.1fMB > %.1fMB" % (mesh, stage, s["rss_peak_bytes"] / 2 ** 20,
+                                                                    b["rss_peak_bytes"] / 2 ** 20))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every precompute stage on the bundled creatures")
+    parser.add_argument("--data-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data"))
+    parser.add_argument("--meshes", nargs="*", default=None, help="names of the meshes to run, default all")
+    parser.add_argument("--num-modes", type=int, default=16)
+    parser.add_argument("--num-clusters", type=int, default=100)
+    parser.add_argument("--mu", type=float, default=1e4)
+    parser.add_argument("--no-memory", action="store_true", help="don't measure memory, for cleaner timings")
+    parser.add_argument("--json", default=None, help="where to write the results")
+    parser.add_argument("--baseline", default=None, help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression (default=0.25)")
+    parser.add_argument("--min-time", type=float, default=0.05, help="absolute time slack in seconds (default=0.05)")
+    parser.add_argument("--min-rss", type=float, default=16, help="absolute rss slack in MB (default=16)")
+    args = parser.parse_args(argv)
+
+    msh_files = sorted(glob.glob(os.path.join(args.data_dir, "*", "*.msh")))
+    if args.meshes is not None:
+        msh_files = [f for f in msh_files if os.path.splitext(os.path.basename(f))[0] in args.meshes]
+    assert (len(msh_files) > 0 and "no .msh files to benchmark")
+
+    if not args.no_memory:
+        fcd.enable_profiling(memory=True, top_allocations=0)
+    results = dict(num_modes=args.num_modes, num_clusters=args.num_clusters, meshes={},
+                   peak_bytes_note="tracemalloc peak, excludes memory allocated by native extensions",
+                   rss_peak_bytes_note="sampled resident set size peak, includes native extensions")
+    for msh_file in msh_files:
+        name = os.path.splitext(os.path.basename(msh_file))[0]
+        print("Benchmarking " + name + "...")
+        r = benchmark_mesh(msh_file, args)
+        results["meshes"][name] = r
+        print("%-32s %10s %12s %12s" % (name + " (%d verts, %d tets)" % (r["num_vertices"], r["num_tets"]),
+                                        "time s", "peak MB", "rss peak MB"))
+        for [stage, s] in r["stages"].items():
+            print("    %-28s %10.3f %12s %12s" % (stage, s["time"],
+                                                  "%.1f" % (s["peak_bytes"] / 2 ** 20) if "peak_bytes" in s else "-",
+                                                  "%.1f" % (s["rss_peak_bytes"] / 2 ** 20)
+                                                  if "rss_peak_bytes" in s else "-"))
+    if not args.no_memory:
+        fcd.disable_profiling()
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = compare(results, baseline, args.tolerance, args.min_time, args.min_rss * 2 ** 20)
+        for failure in failures:
+            print("REGRESSION: " + failure)
+        if failures:
+            return 1
+        print("no regression against " + args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
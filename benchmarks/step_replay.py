@@ -0,0 +1,162 @@
+'''
+Deterministic record/replay of fast_cd_sim steps, to catch step latency regressions across releases.
+
+record - steps a rig animation clip (by default the cd_fish swim clip) with recording on, and saves the
+         trajectory it produced as the golden one. Recordings also come from the apps' record_file argument.
+replay - feeds a recording through a freshly built sim, and reports the p50/p95/p99 step latency, the
+         local-global iterations per step and the max deviation of z from the golden trajectory. Exits
+         with 1 if it is slower than a --baseline result by more than --tolerance, or off the golden trajectory.
+
+The sim is rebuilt from the same mesh and rig arguments, which must match the recording's, with the subspace,
+material and solver configuration stored in the recording.
+
+    python benchmarks/step_replay.py record [--recording benchmarks/fixtures/cd_fish_swim.fcdrec]
+    python benchmarks/step_replay.py replay [--recording ...] [--golden ...] [--json out.json] [--baseline base.json]
+'''
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+import fast_cody as fcd
+
+
+# fast_cd_sim arguments stored in a recording's configuration
+SIM_KEYS = ["model", "mu", "rho", "lam", "h", "max_iters", "threshold", "warm_start", "time_budget",
+            "carry_unconverged"]
+
+
+def build_sim(args, config):
+    # precomputes the subspace and builds the sim of a recording's configuration, falling back to the command
+    # line for the subspace arguments the recording doesn't have
+    pre = fcd.build(msh_file=args.msh_file, rig_file=args.rig_file, num_modes=config["num_modes"],
+                    num_clusters=config.get("num_clusters", args.num_clusters),
+                    constraint_enforcement=config.get("constraint_enforcement", args.constraint_enforcement),
+                    cache_dir=args.cache_dir, read_cache=True, build_sim=False)
+    sim = fcd.fast_cd_sim(pre["V"], pre["T"], pre["B"], pre["l"], pre["J"], cache_dir=args.cache_dir,
+                          read_cache=True, **{k: config[k] for k in SIM_KEYS if k in config})
+    return pre, sim
+
+
+def golden_file(args):
+    return args.golden if args.golden is not None else args.recording + ".golden.npy"
+
+
+def record(args):
+    config = dict(num_modes=args.num_modes, num_clusters=args.num_clusters,
+                  constraint_enforcement=args.constraint_enforcement, mu=args.mu)
+    [pre, sim] = build_sim(args, config)
+    Prel = fcd.rig_anim_to_prel(args.anim_file, pre["rig"][3], pre["so"], pre["to"])
+    frames = Prel.shape[1]
+
+    m = pre["B"].shape[1]
+    st = fcd.fast_cd_state(np.zeros((m, 1)), Prel[:, [0]])
+    z = np.zeros((m, 1))
+    Z = np.zeros((m, frames))
+    sim.start_recording(args.recording, config=dict(num_clusters=args.num_clusters,
+                                                    constraint_enforcement=args.constraint_enforcement))
+    for i in range(frames):
+        p = Prel[:, [i]]
+        sim.step_into(p, st, out=z)
+        st.update(z, p)
+        Z[:, i] = z[:, 0]
+    sim.stop_recording()
+    np.save(golden_file(args), Z)
+    print("recorded %d steps to %s, golden trajectory in %s" % (frames, args.recording, golden_file(args)))
+    return 0
+
+
+def replay(args):
+    recording = fcd.read_step_recording(args.recording)
+    [P, F, bc] = [recording["P"], recording["F"], recording["bc"]]
+    [pre, sim] = build_sim(args, recording["config"])
+    m = sim._f_ext0.shape[0]
+    assert (recording["states"][0][1][0].shape[0] == m and "the recording was made with a different number of modes")
+    resets = dict(recording["states"])
+
+    frames = P.shape[1]
+    z = np.zeros((m, 1))
+    Z = np.zeros((m, frames))
+    times = np.zeros(frames)
+    iters = np.zeros(frames, dtype=int)
+    st = None
+    for i in range(frames):
+        if i in resets:
+            st = fcd.fast_cd_state(*resets[i])
+        p = P[:, [i]]
+        f_ext = None if F is None else F[:, i]
+        bc_i = None if bc is None else bc[:, i]
+        start = time.perf_counter()
+        sim.step_into(p, st, out=z, f_ext=f_ext, bc=bc_i)
+        times[i] = time.perf_counter() - start
+        iters[i] = sim.last_solve[0]
+        st.update(z, p)
+        Z[:, i] = z[:, 0]
+
+    results = dict(recording=args.recording, frames=int(frames), num_modes=int(m),
+                   p50_step_time=float(np.percentile(times, 50)), p95_step_time=float(np.percentile(times, 95)),
+                   p99_step_time=float(np.percentile(times, 99)), mean_iters=float(iters.mean()),
+                   max_iters=int(iters.max()), max_z_deviation=None)
+    try:
+        golden = np.load(golden_file(args))
+        assert (golden.shape == Z.shape and "golden trajectory doesn't match the recording")
+        results["max_z_deviation"] = float(np.abs(Z - golden).max())
+    except FileNotFoundError:
+        print("no golden trajectory at " + golden_file(args) + ", skipping the deviation check")
+
+    print("%d steps, %d modes" % (frames, m))
+    print("step latency: p50 %.1f us, p95 %.1f us, p99 %.1f us" % (1e6 * results["p50_step_time"],
+                                                                    1e6 * results["p95_step_time"],
+                                                                    1e6 * results["p99_step_time"]))
+    print("iterations per step: mean %.2f, max %d" % (results["mean_iters"], results["max_iters"]))
+    if results["max_z_deviation"] is not None:
+        print("max deviation from golden z: %.3e" % results["max_z_deviation"])
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = []
+    if results["max_z_deviation"] is not None and results["max_z_deviation"] > args.max_deviation:
+        failures.append("z deviates from golden by %.3e > %.3e" % (results["max_z_deviation"], args.max_deviation))
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            base = json.load(f)
+        for key in ["p50_step_time", "p95_step_time", "p99_step_time", "mean_iters"]:
+            if results[key] > base[key] * (1 + args.tolerance):
+                failures.append("%s regressed: %.4g > %.4g (+%d%%)" % (key, results[key], base[key],
+                                                                        round(100 * args.tolerance)))
+    for failure in failures:
+        print("REGRESSION: " + failure)
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record and replay fast_cd_sim steps")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--recording", default="benchmarks/fixtures/cd_fish_swim.fcdrec")
+    parser.add_argument("--golden", default=None, help="golden trajectory, default <recording>.golden.npy")
+    parser.add_argument("--msh-file", default=fcd.get_data("cd_fish.msh"))
+    parser.add_argument("--rig-file", default=fcd.get_data("cd_fish_rig.json"))
+    parser.add_argument("--anim-file", default=fcd.get_data("cd_fish_rig_anim__swim.json"))
+    parser.add_argument("--num-modes", type=int, default=16, help="record only, replay uses the recording's")
+    parser.add_argument("--num-clusters", type=int, default=100,
+                        help="record, or replay if the recording doesn't have it")
+    parser.add_argument("--constraint-enforcement", default="optimal",
+                        help="record, or replay if the recording doesn't have it")
+    parser.add_argument("--mu", type=float, default=1e4, help="record only, replay uses the recording's")
+    parser.add_argument("--cache-dir", default="./cache/")
+    parser.add_argument("--json", default=None, help="where to write the replay results")
+    parser.add_argument("--baseline", default=None, help="replay results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (default=0.2)")
+    parser.add_argument("--max-deviation", type=float, default=1e-8, help="allowed max |z - golden|")
+    args = parser.parse_args(argv)
+    if args.mode == "record":
+        return record(args)
+    return replay(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -39,6 +39,17 @@ using namespace std;
 void bind_viewer(py::module& m);
 void bind_igl(py::module& m);
 
+// The step bindings release the GIL around the native solve so independent sims can run on python threads.
+// Eigen arguments are already converted into their own buffers by then, but a cd_sim_state is a python-owned
+// object another thread could update mid-step, so it is captured first, while still holding the GIL. The
+// per-thread buffer is reassigned with same-sized vectors every step, so this doesn't allocate.
+static const cd_sim_state& capture_state(const cd_sim_state& state)
+{
+    static thread_local cd_sim_state captured;
+    captured = state;
+    return captured;
+}
+
 void bind_fast_cd_arap_sim(py::module& m)
 {
     py::class_<fast_cd_arap_local_global_solver>(m, "fast_cd_arap_local_global_solver")
@@ -73,14 +84,18 @@ void bind_fast_cd_arap_sim(py::module& m)
     py::class_<cd_arap_sim>(m, "cd_arap_sim")
         .def(py::init<>())
         .def(py::init<cd_sim_params&, local_global_solver_params&>())
-        .def("step", static_cast<VectorXd(cd_arap_sim::*)(
-            const VectorXd&, const VectorXd&, const cd_sim_state&,
-            const  VectorXd&, const  VectorXd&)>
-            (&cd_arap_sim::step))
-        .def("step", static_cast<VectorXd(cd_arap_sim::*)(
-            const VectorXd&, const cd_sim_state&,
-            const  VectorXd&, const  VectorXd&)>
-            (&cd_arap_sim::step))
+        .def("step", [](cd_arap_sim& sim, const VectorXd& z, const VectorXd& p, const cd_sim_state& state,
+            const VectorXd& f_ext, const VectorXd& bc) {
+                const cd_sim_state& s = capture_state(state);
+                py::gil_scoped_release release;
+                return sim.step(z, p, s, f_ext, bc);
+            })
+        .def("step", [](cd_arap_sim& sim, const VectorXd& p, const cd_sim_state& state,
+            const VectorXd& f_ext, const VectorXd& bc) {
+                const cd_sim_state& s = capture_state(state);
+                py::gil_scoped_release release;
+                return sim.step(p, s, f_ext, bc);
+            })
         .def("set_equality_constraint", &cd_arap_sim::set_equality_constraint)
         .def("params", &cd_arap_sim::parameters)
         ;
@@ -115,10 +130,12 @@ void bind_fast_cd_arap_sim(py::module& m)
             read_cache - (bool) \n \
             write_cache - (bool)\
             ")
-        .def("step", static_cast<VectorXd(fast_cd_arap_sim::*)(
-            const VectorXd&, const VectorXd&, const cd_sim_state&,
-            const  VectorXd&, const  VectorXd&)>
-            (&fast_cd_arap_sim::step), " \ \
+        .def("step", [](fast_cd_arap_sim& sim, const VectorXd& z, const VectorXd& p, const cd_sim_state& state,
+            const VectorXd& f_ext, const VectorXd& bc) {
+                const cd_sim_state& s = capture_state(state);
+                py::gil_scoped_release release;
+                return sim.step(z, p, s, f_ext, bc);
+            }, " \ \
 	        Advances the pre-configured simulation one step  \n \
             Inputs : \n \
                 z:  m x 1 current guess for z(maybe shouldn't expose this) \n \
@@ -134,7 +151,7 @@ void bind_fast_cd_arap_sim(py::module& m)
             const VectorXd&, const VectorXd&, const VectorXd&, const VectorXd&,
             const VectorXd&, const VectorXd&,
             const  VectorXd&, const  VectorXd&)>
-            (&fast_cd_arap_sim::step), " \n \
+            (&fast_cd_arap_sim::step), py::call_guard<py::gil_scoped_release>(), " \n \
             Advances the pre - configured simulation one step \n \
             Inputs : \n \
                 z:  m x 1 current guess for z(maybe shouldn't expose this) \n \
@@ -149,22 +166,102 @@ void bind_fast_cd_arap_sim(py::module& m)
             Outputs :  \n \
                 z_next: m x 1 next timestep degrees of freedom  \n \
             ")
+        .def("step_into", [](fast_cd_arap_sim& sim, Eigen::Ref<VectorXd> out,
+            const VectorXd& z, const VectorXd& p, const cd_sim_state& state,
+            const VectorXd& f_ext, const VectorXd& bc) {
+                // sim.step takes const VectorXd& and returns z_next by value, so the inputs are converted to
+                // VectorXd either way (Ref<const VectorXd> would only move that copy into the call) and the
+                // returned vector is one native allocation per step. What this saves is the numpy array.
+                const cd_sim_state& s = capture_state(state);
+                py::gil_scoped_release release;
+                out = sim.step(z, p, s, f_ext, bc);
+            }, py::arg("out").noconvert(), py::arg("z"), py::arg("p"), py::arg("state"),
+            py::arg("f_ext"), py::arg("bc"), " \n \
+            Same as step, but writes z_next into a preallocated array instead of returning a new one \n \
+            Inputs : \n \
+                out : m x 1 contiguous float64 array that receives z_next \n \
+                z:  m x 1 current guess for z \n \
+                p : p x 1 flattened rig parameters \n \
+                state : sim_cd_state that contains info like z_curr, z_prev, p_currand p_prev \n \
+                f_ext : used to specify excternal forces like gravity. \n \
+                bc : rhs of equality constraint if some are configured in system \n \
+            ")
+        .def("step_sequence", [](fast_cd_arap_sim& sim, Eigen::Ref<const MatrixXd> P,
+            cd_sim_state& state, Eigen::Ref<MatrixXd> Z,
+            const VectorXd& f_ext, const VectorXd& bc) {
+                // The whole clip runs natively: one binding call, no python objects per frame.
+                // Arguments are converted before the GIL is released, and nothing below touches python.
+                VectorXd z, p;
+                for (Eigen::Index i = 0; i < P.cols(); i++)
+                {
+                    p = P.col(i);
+                    z = sim.step(state.z_curr, p, state, f_ext, bc);
+                    Z.col(i) = z;
+                    state.z_prev.swap(state.z_curr);
+                    state.p_prev.swap(state.p_curr);
+                    state.z_curr = z;
+                    state.p_curr = p;
+                }
+            }, py::arg("P"), py::arg("state"), py::arg("Z").noconvert(),
+            py::arg("f_ext"), py::arg("bc"), py::call_guard<py::gil_scoped_release>(), " \n \
+            Advances the simulation through a whole clip of rig parameters, with the GIL released \n \
+            Inputs : \n \
+                P : p x frames rig parameters, one column per frame \n \
+                state : sim_cd_state, advanced in place to the last frame of the clip \n \
+                Z : m x frames column-major (Fortran ordered) float64 array that receives z for every frame \n \
+                f_ext : used to specify excternal forces like gravity, constant over the clip \n \
+                bc : rhs of equality constraint if some are configured in system, constant over the clip \n \
+            ")
+        .def("step_batch", [](fast_cd_arap_sim& sim, Eigen::Ref<const MatrixXd> P,
+            Eigen::Ref<const MatrixXd> Z_curr, Eigen::Ref<const MatrixXd> Z_prev,
+            Eigen::Ref<const MatrixXd> P_curr, Eigen::Ref<const MatrixXd> P_prev,
+            Eigen::Ref<MatrixXd> Z, const VectorXd& f_ext, const VectorXd& bc) {
+                // Every column is an independent instance sharing this sim's precomputation and factorization.
+                // The library's solver takes one right hand side at a time, so the global solve is one
+                // backsubstitution per column; batching them into one multi right hand side solve needs
+                // the solver internals, which aren't exposed. Column buffers are reused across instances.
+                VectorXd p, zc, zp, pc, pp;
+                for (Eigen::Index i = 0; i < P.cols(); i++)
+                {
+                    p = P.col(i);
+                    zc = Z_curr.col(i);
+                    zp = Z_prev.col(i);
+                    pc = P_curr.col(i);
+                    pp = P_prev.col(i);
+                    Z.col(i) = sim.step(zc, p, zc, zp, pc, pp, f_ext, bc);
+                }
+            }, py::arg("P"), py::arg("Z_curr"), py::arg("Z_prev"), py::arg("P_curr"), py::arg("P_prev"),
+            py::arg("Z").noconvert(), py::arg("f_ext"), py::arg("bc"),
+            py::call_guard<py::gil_scoped_release>(), " \n \
+            Advances N independent instances of the simulation one step, with the GIL released \n \
+            Inputs : \n \
+                P : p x N next rig parameters of every instance \n \
+                Z_curr : m x N current d.o.f.s of every instance, also the first guess of the solver \n \
+                Z_prev : m x N previous d.o.f.s of every instance \n \
+                P_curr : p x N current rig parameters of every instance \n \
+                P_prev : p x N previous rig parameters of every instance \n \
+                Z : m x N column-major (Fortran ordered) float64 array that receives the next d.o.f.s \n \
+                f_ext : used to specify excternal forces like gravity, shared by every instance \n \
+                bc : rhs of equality constraint if some are configured in system, shared by every instance \n \
+            ")
+        // the getters hand out members owned by the sim: without reference_internal, python would take
+        // ownership of the raw pointer and free it when the returned object is collected
         .def("params", [](fast_cd_arap_sim& sim) {
         fast_cd_arap_sim_params* p = (fast_cd_arap_sim_params*)sim.params;
     return p;
-            })
+            }, py::return_value_policy::reference_internal)
         .def("sp", [](fast_cd_arap_sim& sim) {
         fast_cd_arap_static_precomp* p = (fast_cd_arap_static_precomp*)sim.sp;
         return p;
-        })
+        }, py::return_value_policy::reference_internal)
         .def("dp", [](fast_cd_arap_sim& sim) {
         fast_cd_arap_dynamic_precomp* p = (fast_cd_arap_dynamic_precomp*)sim.dp;
         return p;
-        })
+        }, py::return_value_policy::reference_internal)
         .def("sol", [](fast_cd_arap_sim& sim) {
         fast_cd_arap_local_global_solver* p = (fast_cd_arap_local_global_solver*)sim.sol;
         return p;
-        })
+        }, py::return_value_policy::reference_internal)
         .def("set_equality_constraint", &fast_cd_arap_sim::set_equality_constraint)
         ;
 
@@ -226,10 +323,12 @@ void bind_fast_cd_corot_sim(py::module& m)
         //.def(py::init<std::string&, fast_cd_corot_sim_params&,
         //    local_global_solver_params&, bool, bool>())
         .def(py::init<fast_cd_corot_sim_params&, local_global_solver_params&>())
-        .def("step", static_cast<VectorXd(fast_cd_corot_sim::*)(
-            const VectorXd&, const VectorXd&, const cd_sim_state&,
-            const  VectorXd&, const  VectorXd&)>
-            (&fast_cd_corot_sim::step), " \ \
+        .def("step", [](fast_cd_corot_sim& sim, const VectorXd& z, const VectorXd& p, const cd_sim_state& state,
+            const VectorXd& f_ext, const VectorXd& bc) {
+                const cd_sim_state& s = capture_state(state);
+                py::gil_scoped_release release;
+                return sim.step(z, p, s, f_ext, bc);
+            }, " \ \
 	        Advances the pre-configured simulation one step  \n \
             Inputs : \n \
                 z:  m x 1 current guess for z(maybe shouldn't expose this) \n \
@@ -241,22 +340,52 @@ void bind_fast_cd_corot_sim(py::module& m)
             Outputs : \n \
                 z_next: m x 1 next timestep degrees of freedom \n \
             ")
+        .def("step_into", [](fast_cd_corot_sim& sim, Eigen::Ref<VectorXd> out,
+            const VectorXd& z, const VectorXd& p, const cd_sim_state& state,
+            const VectorXd& f_ext, const VectorXd& bc) {
+                // see fast_cd_arap_sim.step_into
+                const cd_sim_state& s = capture_state(state);
+                py::gil_scoped_release release;
+                out = sim.step(z, p, s, f_ext, bc);
+            }, py::arg("out").noconvert(), py::arg("z"), py::arg("p"), py::arg("state"),
+            py::arg("f_ext"), py::arg("bc"), " \n \
+            Same as step, but writes z_next into a preallocated array instead of returning a new one \n \
+            ")
+        .def("step_sequence", [](fast_cd_corot_sim& sim, Eigen::Ref<const MatrixXd> P,
+            cd_sim_state& state, Eigen::Ref<MatrixXd> Z,
+            const VectorXd& f_ext, const VectorXd& bc) {
+                VectorXd z, p;
+                for (Eigen::Index i = 0; i < P.cols(); i++)
+                {
+                    p = P.col(i);
+                    z = sim.step(state.z_curr, p, state, f_ext, bc);
+                    Z.col(i) = z;
+                    state.z_prev.swap(state.z_curr);
+                    state.p_prev.swap(state.p_curr);
+                    state.z_curr = z;
+                    state.p_curr = p;
+                }
+            }, py::arg("P"), py::arg("state"), py::arg("Z").noconvert(),
+            py::arg("f_ext"), py::arg("bc"), py::call_guard<py::gil_scoped_release>(), " \n \
+            Advances the simulation through a whole clip of rig parameters, with the GIL released. \n \
+            See fast_cd_arap_sim.step_sequence \n \
+            ")
         .def("params", [](fast_cd_corot_sim& sim) {
         fast_cd_corot_sim_params* p = (fast_cd_corot_sim_params*)sim.params;
     return p;
-            })
+            }, py::return_value_policy::reference_internal)
         .def("sp", [](fast_cd_corot_sim& sim) {
                 fast_cd_corot_static_precomp* p = (fast_cd_corot_static_precomp*)sim.sp;
             return p;
-            })
+            }, py::return_value_policy::reference_internal)
         .def("dp", [](fast_cd_corot_sim& sim) {
         fast_cd_corot_dynamic_precomp* p = (fast_cd_corot_dynamic_precomp*)sim.dp;
         return p;
-        })
+        }, py::return_value_policy::reference_internal)
         .def("sol", [](fast_cd_corot_sim& sim) {
         fast_cd_corot_local_global_solver* p = (fast_cd_corot_local_global_solver*)sim.sol;
         return p;
-        })
+        }, py::return_value_policy::reference_internal)
         .def("set_equality_constraint", &fast_cd_corot_sim::set_equality_constraint)
         ;
 
@@ -375,6 +504,21 @@ PYBIND11_MODULE(fast_cd_pyb, m) {
         .def("init", static_cast<void (cd_sim_state::*)(const VectorXd&, const VectorXd&)>(&cd_sim_state::init))
         .def("update", static_cast<void (cd_sim_state::*)(const VectorXd&, const VectorXd&)>(&cd_sim_state::update))
         .def("update", static_cast<void (cd_sim_state::*)(const VectorXd&)>(&cd_sim_state::update))
+        .def("swap_update", [](cd_sim_state& s, Eigen::Ref<const VectorXd> z, Eigen::Ref<const VectorXd> p) {
+            // z_prev/z_curr and p_prev/p_curr are double buffers: swapping only exchanges their
+            // data pointers, and the same-size assignment reuses the old previous buffer. Taking
+            // Eigen::Ref means contiguous float64 numpy inputs are read in place, not copied.
+            s.z_prev.swap(s.z_curr);
+            s.p_prev.swap(s.p_curr);
+            s.z_curr = z;
+            s.p_curr = p;
+            }, " \n \
+            Advances the state in place without allocating: \n \
+            z_prev <- z_curr, z_curr <- z, p_prev <- p_curr, p_curr <- p \n \
+            Inputs : \n \
+                z : m x 1 next reduced degrees of freedom \n \
+                p : p x 1 next rig parameters \n \
+            ")
         .def_readwrite("z_curr", &cd_sim_state::z_curr)
         .def_readwrite("z_prev", &cd_sim_state::z_prev)
         .def_readwrite("p_curr", &cd_sim_state::p_curr)
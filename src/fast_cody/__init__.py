@@ -10,6 +10,7 @@ from .deformation_jacobian import  deformation_jacobian
 from .laplacian import laplacian
 from .laplacian_eigenmodes import laplacian_eigenmodes
 from .lbs_jacobian import lbs_jacobian
+from .lbs_reconstruct import lbs_reconstruct
 from .lbs_weight_space_constraint import lbs_weight_space_constraint
 from .linear_elasticity_hessian import linear_elasticity_hessian
 from .normalize_height_and_center import normalize_height_and_center
@@ -28,24 +29,48 @@ from .project_out_subspace import project_out_subspace
 from .diffuse_weights import diffuse_weights
 from .momentum_leaking_matrix import momentum_leaking_matrix
 from .complementary_constraint_matrix import complementary_constraint_matrix
+from .sparse_solver import sparse_solve, sparse_factorize, register_sparse_solver, sparse_solver_timings
 from .umfpack_lu_solve import umfpack_lu_solve
 from .eigs import eigs
-from .fast_cd_sim import fast_cd_sim, fast_cd_state
 from .one_euro_filter import OneEuroFilter
 from .mediapipe_face_captor import mediapipe_face_captor
 from .world2rel import world2rel
-from .read_msh import read_msh
+from .rig_anim_to_prel import rig_anim_to_prel
+from .linear_cd_sim import linear_cd_sim, linear_cd_state
+from .export_deformed_meshes import export_deformed_meshes
+from .solver_telemetry import solver_telemetry
+from .parallel_step import parallel_step
+from .sim_scheduler import sim_scheduler
+from .step_recorder import step_recorder, read_step_recording
+from .profiling import profile_span, profiled, enable_profiling, disable_profiling, profiling_enabled, \
+    reset_profiling, profiling_spans, export_chrome_trace, profiling_table, profiling_memory_table
 
-#Apps
-from .apps.interactive_cd_rig_anim import interactive_cd_rig_anim
-from .apps.interactive_cd_face_tracking import interactive_cd_face_tracking
-from .apps.interactive_cd_affine_handle import interactive_cd_affine_handle
+# everything below needs the compiled fast_cd_pyb extension. Without it, the pure numpy/scipy parts
+# (subspace construction, linear_cd_sim, ...) still import, for headless machines without a build
+try:
+    import fast_cd_pyb as _fast_cd_pyb
+except ImportError:
+    _fast_cd_pyb = None
 
-#Viewers
-from .viewers.WeightsViewer import WeightsViewer
-from .viewers.ClustersViewer import ClustersViewer
-from .viewers.interactive_handle_subspace_viewer import interactive_handle_subspace_viewer
-# from .viewers.interactive_handle_viewer import interactive_handle_viewer
+if _fast_cd_pyb is not None:
+    from .fast_cd_sim import fast_cd_sim, fast_cd_state
+    from .sim_cache import sim_cache_key, load_sim_cache, read_sim_cache_manifest, SIM_CACHE_VERSION
+    from .fast_cd_crowd_sim import fast_cd_crowd_sim
+    from .fast_cd_lod_sim import fast_cd_lod_sim
+    from .precompute import build, precompute_graph, precompute_stage
+    from .bake_secondary_motion import bake_secondary_motion
+    from .read_msh import read_msh
+
+    #Apps
+    from .apps.interactive_cd_rig_anim import interactive_cd_rig_anim
+    from .apps.interactive_cd_face_tracking import interactive_cd_face_tracking
+    from .apps.interactive_cd_affine_handle import interactive_cd_affine_handle
+
+    #Viewers
+    from .viewers.WeightsViewer import WeightsViewer
+    from .viewers.ClustersViewer import ClustersViewer
+    from .viewers.interactive_handle_subspace_viewer import interactive_handle_subspace_viewer
+    # from .viewers.interactive_handle_viewer import interactive_handle_viewer
 
 # set data path and shaders path
 import os
@@ -14,7 +14,8 @@ def interactive_cd_affine_handle(msh_file=None, V=None, T=None, Ws=None, l=None,
                                  num_modes=16, num_clusters=100,
                                  constraint_enforcement="optimal",
                                  cache_dir=None, results_dir=None, read_cache=False,
-                                 texture_png=None, texture_obj=None):
+                                 texture_png=None, texture_obj=None, threaded_sim=False,
+                                 record_file=None):
     """
     Runs a standard interactive fast CD simulation, where the user can manipulate a single affine
     handle with a Guizmo and observe secondary effects in real-time.
@@ -48,6 +49,12 @@ def interactive_cd_affine_handle(msh_file=None, V=None, T=None, Ws=None, l=None,
     texture_png : str
         directory pointing towards a .png file of the surface texture.
         if None and if texture_obj is None, then no texturing is applied.
+    threaded_sim : bool
+        whether to run the simulation on its own thread at a fixed timestep, independently of the
+        render frame rate (default=False). See sim_scheduler.
+    record_file : str
+        if not None, records the rig parameters of every simulation step to this file, for replay with
+        benchmarks/step_replay.py (default=None)
 
 
     Examples
@@ -56,13 +63,10 @@ def interactive_cd_affine_handle(msh_file=None, V=None, T=None, Ws=None, l=None,
     >>> fcd.apps.interactive_cd_affine_handle()
     """
 
-    if msh_file is not None:
-        [V, F, T] = fcd.readMSH(msh_file)
-    elif msh_file is None and (V is None and T is None):
+    if msh_file is None and (V is None and T is None):
         msh_file = fc.get_data("./cd_fish.msh")
-        [V, F, T] = fcd.readMSH(msh_file)
     else:
-        assert(V is not None and T is not None and "Must provide either msh_file or V and T")
+        assert((msh_file is not None or (V is not None and T is not None)) and "Must provide either msh_file or V and T")
 
     if texture_png is None or texture_obj is None:
         if msh_file ==  fc.get_data("./cd_fish.msh"):
@@ -73,42 +77,56 @@ def interactive_cd_affine_handle(msh_file=None, V=None, T=None, Ws=None, l=None,
         cache_dir = "./cache/"
     os.makedirs(cache_dir, exist_ok=True)
 
-    [V, so, to] = fcd.scale_and_center_geometry(V, 1, np.array([[0, 0,  0.]])) #center to unit height and about origin
-
-    Wp = np.ones((V.shape[0], 1)) #single handle skinning weight
-    J = fc.lbs_jacobian(V, Wp)
-
-
-    if Ws is None or l is None:
-        C = fc.complementary_constraint_matrix(V, T, J, dt=1e-3)
-        C2 = fc.lbs_weight_space_constraint(V, C)
-        [B, l, Ws] = fc.skinning_subspace(V, T, num_modes, num_clusters, C=C2, read_cache=read_cache,
-                                         cache_dir=cache_dir, constraint_enforcement=constraint_enforcement);
-    else:
+    if Ws is not None or l is not None:
         assert (Ws is not None and l is not None and "Secondary skinning weights and clusters need both be specified")
         num_modes = Ws.shape[1]
         num_clusters = l.max() + 1
 
-    sim = fc.fast_cd_sim(V, T, B, l, J, mu=mu, rho=rho, h=1e-2, cache_dir=cache_dir, read_cache=read_cache)
+    # single affine handle rig, geometry is scaled and centered to unit height about the origin
+    pre = fc.build(msh_file=msh_file, V=V, T=T, Ws=Ws, l=l, num_modes=num_modes, num_clusters=num_clusters,
+                   constraint_enforcement=constraint_enforcement, mu=mu, rho=rho, h=1e-2,
+                   cache_dir=cache_dir, read_cache=read_cache)
+    [V, T, so, to] = [pre["V"], pre["T"], pre["so"], pre["to"]]
+    [Wp, J, B, l, Ws, sim] = [pre["Wp"], pre["J"], pre["B"], pre["l"], pre["Ws"], pre["sim"]]
 
     # set sim state and initial rig parameters
     z0 = np.zeros((num_modes*12, 1))
     T0 = np.identity(4).astype( dtype=np.float32, order="F");
     p0 = T0[0:3, :].reshape((12, 1))
     st = fc.fast_cd_state(z0, p0)
+    z = np.zeros((B.shape[1], 1))
+
+    if record_file is not None:
+        sim.start_recording(record_file, config=dict(num_clusters=int(num_clusters),
+                                                     constraint_enforcement=constraint_enforcement))
+
+    scheduler = None
+    if threaded_sim:
+        scheduler = fc.sim_scheduler(sim, st, p0, h=1e-2)
 
     step = 0
     def pre_draw_callback():
          nonlocal J, B, T0, sim, st, step
          p = viewer.T0[0:3, :].reshape( (12, 1))
-         z = sim.step( p, st)
+         if scheduler is not None:
+             scheduler.set_input(p)
+             [zs, ps, step] = scheduler.latest()
+             viewer.update_subspace_coefficients(zs, ps)
+             return
+         sim.step_into(p, st, out=z)
          st.update(z, p)
-         # U = np.reshape(J @ p + B @ z, (J.shape[0]//3, 3), order="F") # full positions
+         # U = fc.lbs_reconstruct(V, Wp, Ws, p, z) # full positions, same as J @ p + B @ z without the dense J and B
          viewer.update_subspace_coefficients(z, p)
          step += 1
 
     viewer = fc.viewers.interactive_handle_subspace_viewer(V, T, Wp, Ws,  pre_draw_callback,T0=T0,
                                                   texture_png=texture_png, texture_obj=texture_obj,
                                                   t0=to, s0=so, init_guizmo=True)
+    if scheduler is not None:
+        scheduler.start()
     viewer.launch()
+    if scheduler is not None:
+        scheduler.stop()
+        print("simulated %d steps, %d ticks missed" % (scheduler.latest()[2], scheduler.missed_ticks))
+    sim.stop_recording()
 
@@ -11,7 +11,7 @@ def interactive_cd_face_tracking(msh_file=None, V=None, T=None, Wp=None, bI=0, W
                                  constraint_enforcement="optimal",
                                  cache_dir=None, read_cache=False,
                                  texture_png=None, texture_obj=None,
-                                 draw_landmarks=False):
+                                 draw_landmarks=False, record_file=None):
     """
     Runs a standard interactive fast CD simulation, where the user can manipulate a single affine
     handle with a mediapipe face tracker in real time.
@@ -53,6 +53,9 @@ def interactive_cd_face_tracking(msh_file=None, V=None, T=None, Wp=None, bI=0, W
         if None and if texture_obj is None, then no texturing is applied. (default=None)
     draw_landmarks : bool
         whether to draw the face landmarks on the screen (default=False). This slows down the app if true
+    record_file : str
+        if not None, records the rig parameters of every simulation step to this file, for replay with
+        benchmarks/step_replay.py (default=None)
 
 
     Examples
@@ -63,13 +66,10 @@ def interactive_cd_face_tracking(msh_file=None, V=None, T=None, Wp=None, bI=0, W
     ```
     """
 
-    if msh_file is not None:
-        [V, F, T] = fcd.readMSH(msh_file)
-    elif msh_file is None and (V is None and T is None):
+    if msh_file is None and (V is None and T is None):
         msh_file = fc.get_data("./cd_fish.msh")
-        [V, F, T] = fcd.readMSH(msh_file)
     else:
-        assert(V is not None and T is not None and "Must provide either msh_file or V and T")
+        assert((msh_file is not None or (V is not None and T is not None)) and "Must provide either msh_file or V and T")
     if cache_dir is None:
         cache_dir = "./cache/"
     os.makedirs(cache_dir, exist_ok=True)
@@ -79,25 +79,17 @@ def interactive_cd_face_tracking(msh_file=None, V=None, T=None, Wp=None, bI=0, W
             texture_png = fc.get_data("./cd_fish_tex.png")
             texture_obj = fc.get_data("./cd_fish_tex.obj")
 
-    [V, so, to] = fcd.scale_and_center_geometry(V, 1, np.array([[0, 0, 0.]]))  # center to unit height and about origin
-
-    if Wp is None:
-        #assume affine handle
-        Wp = np.ones((V.shape[0], 1))
-    J = fc.lbs_jacobian(V, Wp)
-
-    if Ws is None or l is None:
-        C = fc.complementary_constraint_matrix(V, T, J, dt=1e-3)
-        C2 = fc.lbs_weight_space_constraint(V, C)
-        [B, l, Ws] = fc.skinning_subspace(V, T, num_modes, num_clusters, C=C2, read_cache=read_cache,
-                                          cache_dir=cache_dir, constraint_enforcement=constraint_enforcement);
-    else:
+    if Ws is not None or l is not None:
         assert (Ws is not None and l is not None and "Secondary skinning weights and clusters need both be specified")
         num_modes = Ws.shape[1]
         num_clusters = l.max() + 1
-    # cd_obj = fish_cd();
-    sim = fc.fast_cd_sim(V, T, B, l, J, mu=mu, rho=rho, h=1e-2, cache_dir="./results", read_cache=read_cache)
 
+    # if Wp is None, assumes a single affine handle. Geometry is scaled and centered to unit height about the origin
+    pre = fc.build(msh_file=msh_file, V=V, T=T, Wp=Wp, Ws=Ws, l=l, num_modes=num_modes, num_clusters=num_clusters,
+                   constraint_enforcement=constraint_enforcement, mu=mu, rho=rho, h=1e-2,
+                   cache_dir=cache_dir, read_cache=read_cache)
+    [V, T, so, to] = [pre["V"], pre["T"], pre["so"], pre["to"]]
+    [Wp, J, B, l, Ws, sim] = [pre["Wp"], pre["J"], pre["B"], pre["l"], pre["Ws"], pre["sim"]]
 
     # set sim initial state. z0 is full of 0, while p0 is the identity for all rig handles
     z0 = np.zeros((B.shape[1], 1))
@@ -108,6 +100,10 @@ def interactive_cd_face_tracking(msh_file=None, V=None, T=None, Wp=None, bI=0, W
 
 
     st = fc.fast_cd_state(z0, p0)
+    z = np.zeros((B.shape[1], 1))
+    if record_file is not None:
+        sim.start_recording(record_file, config=dict(num_clusters=int(num_clusters),
+                                                     constraint_enforcement=constraint_enforcement))
 
     def user_callback():
         nonlocal T0
@@ -115,7 +111,7 @@ def interactive_cd_face_tracking(msh_file=None, V=None, T=None, Wp=None, bI=0, W
         [R, info] = face_captor.query_rotation()
         T0[4 * bI:4 * bI + 3, :] = R
         p = np.reshape(T0, ( J.shape[1], 1), order="F")
-        z = sim.step(p,  st).reshape((B.shape[1], 1), order="F")
+        sim.step_into(p, st, out=z)
         st.update(z, p)
         viewer.update_subspace_coefficients(z, p)
 
@@ -129,4 +125,5 @@ def interactive_cd_face_tracking(msh_file=None, V=None, T=None, Wp=None, bI=0, W
 
     viewer.launch()
     face_captor.release()
+    sim.stop_recording()
 
@@ -10,7 +10,7 @@ def interactive_cd_rig_anim(msh_file=None, V=None, T=None, rig_file=None, Wp=Non
                                  mu=1e4, rho=1e3, num_modes=16, num_clusters=100,
                                  constraint_enforcement="optimal",
                                  cache_dir=None, read_cache=False,
-                                 texture_png=None, texture_obj=None):
+                                 texture_png=None, texture_obj=None, record_file=None):
     """
     Runs a standard interactive fast CD simulation, where the user can play back rig animations
     and observe secondary effects in real-time
@@ -58,6 +58,9 @@ def interactive_cd_rig_anim(msh_file=None, V=None, T=None, rig_file=None, Wp=Non
     texture_png : str
         directory pointing towards a .png file of the surface texture.
         if None and if texture_obj is None, then no texturing is applied.
+    record_file : str
+        if not None, records the rig parameters of every simulation step to this file, for replay with
+        benchmarks/step_replay.py (default=None)
 
 
     Examples
@@ -81,22 +84,12 @@ def interactive_cd_rig_anim(msh_file=None, V=None, T=None, rig_file=None, Wp=Non
             texture_png = fcd.get_data("./cd_fish_tex.png")
             texture_obj = fcd.get_data("./cd_fish_tex.obj")
 
-    if rig_file is not None:
-        # read rig from json
-        [Vpsurf, Fpsurf, Wpsurface, P0, lengths, pI] = fcd.read_rig_from_json(rig_file)
-        aI = np.arange(V.shape[0])
-        [D2, bI, CP] = igl.point_mesh_squared_distance(Vpsurf, V, aI)
-        Wp = fcd.diffuse_weights(V, T, Wpsurface, bI, dt=10000)
-    elif Wp is None and P0 is None:
+    if rig_file is None and Wp is None and P0 is None:
         [Vfish, F, Tfish] = fcd.read_msh(fcd.get_data("./cd_fish.msh"))
 
         if msh_file ==  fcd.get_data("./cd_fish.msh") or (np.allclose(Vfish, V) and np.allclose(Tfish, T)):
             # resort to default fish if absolutely nothing is provided
             rig_file = fcd.get_data("./cd_fish_rig.json")
-            [Vpsurf, Fpsurf, Wpsurface, P0, lengths, pI] = fcd.read_rig_from_json(rig_file)
-            aI = np.arange(V.shape[0])
-            [D2, bI, CP] = igl.point_mesh_squared_distance(Vpsurf, V, aI)
-            Wp = fcd.diffuse_weights(V, T, Wpsurface, bI, dt=10000)
         else:
             ValueError("Must provide either rig_file or Wp and P0")
 
@@ -115,66 +108,32 @@ def interactive_cd_rig_anim(msh_file=None, V=None, T=None, rig_file=None, Wp=Non
         cache_dir = "./cache/"
     os.makedirs(cache_dir, exist_ok=True)
 
-
-    # if msh_file is None and V is None and T is None:
-    #     msh_file = fcd.get_data("./cd_fish.msh")
-    #     if texture_png is None or texture_obj is None:
-    #         texture_png = fcd.get_data("./cd_fish_tex.png")
-    #         texture_obj = fcd.get_data("./cd_fish_tex.obj")
-    #     if rig_file is None:
-    #         rig_file = fcd.get_data("./cd_fish_rig.json")
-    #     if anim_file is None:
-    #         anim_file = fcd.get_data("./cd_fish_rig_anim__swim.json")
-    #     [V, F, T] = fcdp.readMSH(msh_file)
-
-
-
-
-
-    # if rig_file is not None:
-    #     [Vpsurf, Fpsurf, Wpsurface, P0, lengths, pI] = fcd.read_rig_from_json(rig_file)
-    #     aI = np.arange(V.shape[0])
-    #     [D2, bI, CP] = igl.point_mesh_squared_distance(Vpsurf, V, aI)
-    #     Wp = fcd.diffuse_weights(V, T, Wpsurface, bI, dt=10000)
-    #     # fcd.WeightsViewer(V, T, Wp, period=0.01)
-    # elif Wp is None:
-    #     Wp = np.ones((V.shape[0], 1))
-
-    [V, so, to] = fcdp.scale_and_center_geometry(V, 1, np.array([[0, 0, 0.]]))  # center to unit height and about origin
-    # so = 1
-    # to = 0
-    P0= P0 * so
-    P0[:, :, 3] = P0[:, :, 3] - to
-
-    J = fcd.lbs_jacobian(V, Wp)
-
-    P = P * so
-    P[:, :, :, 3] = P[:, :, :, 3] - to
-    Prel = fcd.world2rel(P, P0)
-
-    d = V.shape[1]
-    k = Wp.shape[1]
-    frames = P.shape[0]
-    Prel = np.transpose(Prel, [3, 1, 2, 0])
-    Prel = Prel.reshape(((d + 1) * d * k, frames), order='F')
-
-
-    if Ws is None or l is None:
-        C = fcd.complementary_constraint_matrix(V, T, J, dt=1e-3)
-        C2 = fcd.lbs_weight_space_constraint(V, C)
-        [B, l, Ws] = fcd.skinning_subspace(V, T, num_modes, num_clusters, C=C2, read_cache=read_cache,
-                                          cache_dir=cache_dir, constraint_enforcement=constraint_enforcement);
-    else:
+    if Ws is not None or l is not None:
         assert (Ws is not None and l is not None and "Secondary skinning weights and clusters need both be specified")
         num_modes = Ws.shape[1]
         num_clusters = l.max() + 1
-    # cd_obj = fish_cd();
-    sim = fcd.fast_cd_sim(V, T, B, l, J, mu=mu, rho=rho, h=1e-2, cache_dir="./results", read_cache=read_cache)
+
+    # rig weights are diffused from the rig surface on the input mesh, which is then scaled and centered
+    # to unit height about the origin
+    pre = fcd.build(V=V, T=T, rig_file=rig_file, Wp=None if rig_file is not None else Wp, Ws=Ws, l=l,
+                    num_modes=num_modes, num_clusters=num_clusters, constraint_enforcement=constraint_enforcement,
+                    mu=mu, rho=rho, h=1e-2, cache_dir=cache_dir, read_cache=read_cache)
+    [V, T, so, to] = [pre["V"], pre["T"], pre["so"], pre["to"]]
+    [Wp, J, B, l, Ws, sim] = [pre["Wp"], pre["J"], pre["B"], pre["l"], pre["Ws"], pre["sim"]]
+    if pre["rig"] is not None:
+        [Vpsurf, Fpsurf, Wpsurface, P0, lengths, pI] = pre["rig"]
+
+    Prel = fcd.rig_anim_to_prel(P, P0, so, to)
+    frames = Prel.shape[1]
 
     # set  sim initial state. z0 is full of 0, while p0 is the identity for all rig handles
     z0 = np.zeros((B.shape[1], 1))
     p0 = Prel[:, [0]]
     st = fcd.fast_cd_state(z0, p0)
+    z = np.zeros((B.shape[1], 1))
+    if record_file is not None:
+        sim.start_recording(record_file, config=dict(num_clusters=int(num_clusters),
+                                                     constraint_enforcement=constraint_enforcement))
     step = 0
     def user_callback():
         nonlocal step, st
@@ -183,7 +142,7 @@ def interactive_cd_rig_anim(msh_file=None, V=None, T=None, rig_file=None, Wp=Non
             st = fcd.fast_cd_state(z0, p0)
 
         p = Prel[:, step % frames]
-        z = sim.step(p,  st).reshape((B.shape[1], 1), order="F")
+        sim.step_into(p, st, out=z)
         st.update(z, p)
         viewer.update_subspace_coefficients(z, p)
 
@@ -193,4 +152,5 @@ def interactive_cd_rig_anim(msh_file=None, V=None, T=None, rig_file=None, Wp=Non
                                                            texture_png=texture_png, texture_obj=texture_obj,
                                                            t0=to, s0=so, init_guizmo=False, max_fps=100)
     viewer.launch()
+    sim.stop_recording()
 
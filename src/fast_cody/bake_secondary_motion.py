@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import argparse
+import concurrent.futures
+
+import numpy as np
+import igl
+
+from .precompute import build
+from .rig_anim_to_prel import rig_anim_to_prel
+from .fast_cd_sim import fast_cd_state
+
+# precompute of the worker process, loaded once by _init_worker and reused by every clip the worker bakes
+_worker = None
+
+
+def _init_worker(build_args):
+    global _worker
+    _worker = build(**build_args)
+
+
+def _bake_clip(anim_file, out_dir, surface, chunk_size=256):
+    pre = _worker
+    start = time.time()
+    name = os.path.splitext(os.path.basename(anim_file))[0]
+    Prel = rig_anim_to_prel(anim_file, pre["rig"][3], pre["so"], pre["to"])
+    frames = Prel.shape[1]
+    m = pre["B"].shape[1]
+
+    z_file = os.path.join(out_dir, name + "_z.npy")
+    Z = np.lib.format.open_memmap(z_file, mode="w+", dtype=np.float64, shape=(m, frames), fortran_order=True)
+    st = fast_cd_state(np.zeros((m, 1)), Prel[:, [0]])
+    pre["sim"].step_sequence(Prel, st, out=Z)
+    Z.flush()
+    np.save(os.path.join(out_dir, name + "_p.npy"), Prel)
+    report = dict(clip=name, anim_file=anim_file, frames=int(frames), z_file=z_file)
+
+    if surface:
+        F = igl.boundary_facets(pre["T"])
+        [I, Fs] = np.unique(F, return_inverse=True)
+        Fs = Fs.reshape(F.shape)
+        n = pre["V"].shape[0]
+        # rows of the surface vertices in the coordinate-major 3n ordering of J and B
+        rows = np.concatenate([I + c * n for c in range(3)])
+        Js = pre["J"][rows, :]
+        Bs = pre["B"][rows, :]
+
+        surface_file = os.path.join(out_dir, name + "_surface.npy")
+        U = np.lib.format.open_memmap(surface_file, mode="w+", dtype=np.float64, shape=(frames, I.shape[0], 3))
+        for i in range(0, frames, chunk_size):
+            j = min(i + chunk_size, frames)
+            Uc = Js @ Prel[:, i:j] + Bs @ Z[:, i:j]
+            # back to the frame of the input mesh
+            U[i:j] = (Uc.reshape(3, I.shape[0], j - i).transpose(2, 1, 0) + pre["to"]) / pre["so"]
+        U.flush()
+        np.save(os.path.join(out_dir, name + "_faces.npy"), Fs)
+        report["surface_file"] = surface_file
+
+    report["seconds"] = time.time() - start
+    return report
+
+
+def bake_secondary_motion(msh_file, rig_file, anim_files, out_dir, surface=False, max_workers=None,
+                          cache_dir=None, num_modes=16, num_clusters=100, constraint_enforcement="optimal",
+                          mu=1e4, rho=1e3, h=1e-2):
+    """
+    Headless bake of the secondary motion of one or more rig animation clips. Clips are simulated in a
+    process pool, each worker loading the precompute once and baking every clip it is handed with
+    fast_cd_sim.step_sequence. For every clip <name>.json, writes to out_dir
+    ```
+        <name>_z.npy        (m, frames) reduced secondary motion
+        <name>_p.npy        (12b, frames) rig parameters the clip was simulated with
+        <name>_surface.npy  (frames, s, 3) surface vertex positions, in the frame of the input mesh (if surface)
+        <name>_faces.npy    (f, 3) surface triangles indexing into those positions (if surface)
+    ```
+    and a bake.json summary.
+
+    Parameters
+    ----------
+    msh_file : str
+        Path to the tet mesh .msh file
+    rig_file : str
+        Path to the rig .json file the clips animate
+    anim_files : list of str
+        Paths to the rig animation .json clips
+    out_dir : str
+        Directory receiving the baked trajectories
+    surface : bool
+        Whether to also bake surface vertex positions (default=False)
+    max_workers : int
+        Number of worker processes (default=None, number of cores, capped to the number of clips)
+    cache_dir : str
+        Directory the precompute is memoized in and shared with the workers through (default=out_dir/cache)
+    num_modes : int
+        Number of skinning modes (default=16)
+    num_clusters : int
+        Number of skinning clusters (default=100)
+    constraint_enforcement : str
+        "project" or "optimal" (default="optimal")
+    mu : float
+        First lame parameter (default=1e4)
+    rho : float
+        Density (default=1e3)
+    h : float
+        Timestep (default=1e-2)
+
+    Returns
+    -------
+    reports : list of dict
+        One report per clip with its frame count, output files and bake time
+
+    Examples
+    --------
+    ```
+    >>> import glob
+    >>> import fast_cody as fcd
+    >>> fcd.bake_secondary_motion(fcd.get_data("cd_fish.msh"), fcd.get_data("cd_fish_rig.json"),
+    >>>                           [fcd.get_data("cd_fish_rig_anim__swim.json")], "./bake/cd_fish", surface=True)
+    ```
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if cache_dir is None:
+        cache_dir = os.path.join(out_dir, "cache")
+    build_args = dict(msh_file=msh_file, rig_file=rig_file, num_modes=num_modes, num_clusters=num_clusters,
+                      constraint_enforcement=constraint_enforcement, mu=mu, rho=rho, h=h, cache_dir=cache_dir)
+
+    # warm the cache once, so the workers only read it instead of all recomputing the subspace
+    print("precomputing " + msh_file)
+    build(read_cache=True, write_cache=True, build_sim=True, **build_args)
+    worker_args = dict(build_args, read_cache=True, executor=None)
+
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    max_workers = max(1, min(max_workers, len(anim_files)))
+
+    reports = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                                initargs=(worker_args,)) as pool:
+        futures = [pool.submit(_bake_clip, anim_file, out_dir, surface) for anim_file in anim_files]
+        for future in concurrent.futures.as_completed(futures):
+            r = future.result()
+            print("%-32s %6d frames %8.2f s" % (r["clip"], r["frames"], r["seconds"]))
+            reports.append(r)
+
+    reports = sorted(reports, key=lambda r: r["clip"])
+    with open(os.path.join(out_dir, "bake.json"), "w") as f:
+        json.dump(dict(msh_file=msh_file, rig_file=rig_file, mu=mu, rho=rho, h=h, num_modes=num_modes,
+                       num_clusters=num_clusters, clips=reports), f, indent=2)
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless bake of fast CD secondary motion for rig animation clips")
+    parser.add_argument("msh_file", help="tet mesh .msh file")
+    parser.add_argument("rig_file", help="rig .json file")
+    parser.add_argument("anim_files", nargs="+", help="rig animation .json clips")
+    parser.add_argument("--out-dir", default="./bake", help="directory receiving the baked trajectories")
+    parser.add_argument("--surface", action="store_true", help="also bake surface vertex positions")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--cache-dir", default=None, help="precompute cache (default <out-dir>/cache)")
+    parser.add_argument("--num-modes", type=int, default=16)
+    parser.add_argument("--num-clusters", type=int, default=100)
+    parser.add_argument("--constraint-enforcement", default="optimal", choices=["optimal", "project"])
+    parser.add_argument("--mu", type=float, default=1e4)
+    parser.add_argument("--rho", type=float, default=1e3)
+    parser.add_argument("--h", type=float, default=1e-2)
+    args = parser.parse_args(argv)
+
+    bake_secondary_motion(args.msh_file, args.rig_file, args.anim_files, args.out_dir, surface=args.surface,
+                          max_workers=args.workers, cache_dir=args.cache_dir, num_modes=args.num_modes,
+                          num_clusters=args.num_clusters, constraint_enforcement=args.constraint_enforcement,
+                          mu=args.mu, rho=args.rho, h=args.h)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
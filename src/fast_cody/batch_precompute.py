@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import glob
+import time
+import hashlib
+import argparse
+import traceback
+import concurrent.futures
+
+import numpy as np
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+from .precompute import build, hash_file, PRECOMPUTE_VERSION
+from .read_rig_anim_from_json import read_rig_anim_from_json
+
+
+def find_assets(data_dir):
+    """
+    Walks an asset tree laid out like the bundled data directory,
+    ```
+        <data_dir>/<creature>/<creature>.msh
+        <data_dir>/<creature>/rigs/<rig>/<rig>.json
+        <data_dir>/<creature>/rigs/<rig>/anim/*.json
+    ```
+    and lists one asset per (mesh, rig) pair, or a single rig-less asset for meshes without rigs.
+
+    Parameters
+    ----------
+    data_dir : str
+        Root of the asset tree
+
+    Returns
+    -------
+    assets : list of dict
+        Each with "name", "msh_file", "rig_file" (or None) and "anim_files"
+    """
+    assets = []
+    for creature_dir in sorted(glob.glob(os.path.join(data_dir, "*", ""))):
+        creature = os.path.basename(os.path.normpath(creature_dir))
+        msh_files = sorted(glob.glob(os.path.join(creature_dir, "*.msh")))
+        msh_file = msh_files[0] if len(msh_files) > 0 else None
+
+        rigs = sorted(glob.glob(os.path.join(creature_dir, "rigs", "*", "*.json")))
+        if len(rigs) == 0:
+            assets.append(dict(name=creature, msh_file=msh_file, rig_file=None, anim_files=[]))
+        for rig_file in rigs:
+            rig = os.path.basename(os.path.dirname(rig_file))
+            anim_files = sorted(glob.glob(os.path.join(os.path.dirname(rig_file), "anim", "*.json")))
+            assets.append(dict(name=creature + "/" + rig, msh_file=msh_file, rig_file=rig_file,
+                               anim_files=anim_files))
+    return assets
+
+
+def bundle_key(msh_file, rig_file, params):
+    """
+    Content address of a precompute bundle: a hash of the mesh and rig file contents and of the precompute
+    parameters, independent of where the files live.
+
+    Parameters
+    ----------
+    msh_file : str
+        Path to the .msh file
+    rig_file : str
+        Path to the rig .json file or None
+    params : dict
+        Precompute parameters (num_modes, num_clusters, mu, ...)
+
+    Returns
+    -------
+    key : str
+        sha1 hex digest
+    """
+    h = hashlib.sha1(str(PRECOMPUTE_VERSION).encode())
+    h.update(hash_file(msh_file).encode())
+    if rig_file is not None:
+        h.update(hash_file(rig_file).encode())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def precompute_asset(asset, cache_dir, params, read_cache=True):
+    """
+    Builds the subspace and simulator precompute of one asset into its content addressed bundle
+    cache_dir/<key>. Meant to run in a fresh worker process so that the peak memory is that of the asset.
+
+    Parameters
+    ----------
+    asset : dict
+        As returned by find_assets
+    cache_dir : str
+        Root directory of the bundles
+    params : dict
+        Keyword arguments forwarded to build (num_modes, num_clusters, constraint_enforcement, mu, rho, h)
+    read_cache : bool
+        Whether to reuse an existing bundle (default=True)
+
+    Returns
+    -------
+    report : dict
+        Name, status, bundle directory, wall time, peak memory and per-animation frame counts of the asset
+    """
+    report = dict(name=asset["name"], msh_file=asset["msh_file"], rig_file=asset["rig_file"])
+    start = time.time()
+    try:
+        if asset["msh_file"] is None:
+            report["status"] = "skipped (no .msh file)"
+            return report
+        key = bundle_key(asset["msh_file"], asset["rig_file"], params)
+        bundle_dir = os.path.join(cache_dir, key)
+        report["bundle"] = bundle_dir
+
+        pre = build(msh_file=asset["msh_file"], rig_file=asset["rig_file"], cache_dir=bundle_dir,
+                    read_cache=read_cache, write_cache=True, executor=None, **params)
+        for name in ["B", "Ws", "l", "Wp"]:
+            np.save(os.path.join(bundle_dir, name + ".npy"), pre[name])
+
+        num_bones = pre["Wp"].shape[1]
+        anims = {}
+        for anim_file in asset["anim_files"]:
+            P = read_rig_anim_from_json(anim_file)
+            assert (P.shape[1] == num_bones and "animation does not match rig")
+            anims[os.path.basename(anim_file)] = dict(file=anim_file, frames=int(P.shape[0]))
+        report["anims"] = anims
+        report["num_vertices"] = int(pre["V"].shape[0])
+        report["num_tets"] = int(pre["T"].shape[0])
+
+        manifest = dict(key=key, version=PRECOMPUTE_VERSION, params=params, **report)
+        with open(os.path.join(bundle_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+        report["status"] = "ok"
+    except Exception as e:
+        report["status"] = "failed"
+        report["error"] = "".join(traceback.format_exception_only(type(e), e)).strip()
+    finally:
+        report["seconds"] = time.time() - start
+        report["peak_rss_bytes"] = _peak_rss_bytes()
+    return report
+
+
+def batch_precompute(data_dir, cache_dir, max_workers=None, read_cache=True, report_file=None,
+                     num_modes=16, num_clusters=100, constraint_enforcement="optimal",
+                     mu=1e4, rho=1e3, h=1e-2):
+    """
+    Headless precompute of every asset under data_dir in a bounded process pool, writing one content
+    addressed bundle per (mesh, rig) pair and a summary report with per-asset timing and peak memory.
+
+    Parameters
+    ----------
+    data_dir : str
+        Root of the asset tree, see find_assets
+    cache_dir : str
+        Root directory of the bundles
+    max_workers : int
+        Number of worker processes (default=None, number of cores)
+    read_cache : bool
+        Whether to reuse existing bundles (default=True)
+    report_file : str
+        Where to write the JSON summary. If None, writes cache_dir/report.json (default=None)
+    num_modes : int
+        Number of skinning modes (default=16)
+    num_clusters : int
+        Number of skinning clusters (default=100)
+    constraint_enforcement : str
+        "project" or "optimal" (default="optimal")
+    mu : float
+        First lame parameter (default=1e4)
+    rho : float
+        Density (default=1e3)
+    h : float
+        Timestep (default=1e-2)
+
+    Returns
+    -------
+    reports : list of dict
+        One report per asset, see precompute_asset
+    """
+    params = dict(num_modes=num_modes, num_clusters=num_clusters, constraint_enforcement=constraint_enforcement,
+                  mu=mu, rho=rho, h=h)
+    os.makedirs(cache_dir, exist_ok=True)
+    assets = find_assets(data_dir)
+
+    try:
+        # fresh process per asset, so peak memory is attributed to the right asset
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=1)
+    except TypeError:  # python < 3.11
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+
+    reports = []
+    with pool:
+        futures = [pool.submit(precompute_asset, a, cache_dir, params, read_cache) for a in assets]
+        for future in concurrent.futures.as_completed(futures):
+            r = future.result()
+            peak = "" if r["peak_rss_bytes"] is None else "%10.1f MB" % (r["peak_rss_bytes"] / 2 ** 20)
+            print("%-32s %-8s %8.2f s %s" % (r["name"], r["status"], r["seconds"], peak))
+            reports.append(r)
+
+    reports = sorted(reports, key=lambda r: r["name"])
+    if report_file is None:
+        report_file = os.path.join(cache_dir, "report.json")
+    with open(report_file, "w") as f:
+        json.dump(dict(data_dir=data_dir, params=params, assets=reports), f, indent=2)
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless batch precompute of fast CD subspaces and "
+                                                 "simulations over an asset tree")
+    parser.add_argument("data_dir", help="asset tree, e.g. data/")
+    parser.add_argument("--cache-dir", default="./cache", help="root directory of the precompute bundles")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--report", default=None, help="summary report path (default <cache-dir>/report.json)")
+    parser.add_argument("--no-read-cache", action="store_true", help="recompute existing bundles")
+    parser.add_argument("--num-modes", type=int, default=16)
+    parser.add_argument("--num-clusters", type=int, default=100)
+    parser.add_argument("--constraint-enforcement", default="optimal", choices=["optimal", "project"])
+    parser.add_argument("--mu", type=float, default=1e4)
+    parser.add_argument("--rho", type=float, default=1e3)
+    parser.add_argument("--h", type=float, default=1e-2)
+    args = parser.parse_args(argv)
+
+    reports = batch_precompute(args.data_dir, args.cache_dir, max_workers=args.workers,
+                               read_cache=not args.no_read_cache, report_file=args.report,
+                               num_modes=args.num_modes, num_clusters=args.num_clusters,
+                               constraint_enforcement=args.constraint_enforcement,
+                               mu=args.mu, rho=args.rho, h=args.h)
+    return 0 if all(r["status"] != "failed" for r in reports) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,9 +2,11 @@ import igl
 import scipy as sp
 
 import fast_cody as fc
+from .profiling import profiled
 
 
-def complementary_constraint_matrix(V, T, J, dt=None):
+@profiled
+def complementary_constraint_matrix(V, T, J, dt=None, M=None, D=None):
     """ Computes the complementarity constraint matrix
         ```
         C = J D M
@@ -22,6 +24,10 @@ def complementary_constraint_matrix(V, T, J, dt=None):
         Rig jacobian matrix
     dt : float
         Timestep used for momentum leaking matrix, (default=1/l^2)
+    M : (n, n) scipy sparse matrix
+        Precomputed mass matrix. If None, computed from V and T (default=None)
+    D : (3n, 3n) scipy sparse matrix
+        Precomputed momentum leaking matrix. If None, computed from V, T and dt (default=None)
 
     Returns
     --------
@@ -29,9 +35,11 @@ def complementary_constraint_matrix(V, T, J, dt=None):
         Complementarity constraint matrix
 
     """
-    M = igl.massmatrix(V, T)
+    if M is None:
+        M = igl.massmatrix(V, T)
     Me = sp.sparse.kron(sp.sparse.identity(3), M)
-    D = fc.momentum_leaking_matrix(V, T, dt=dt)
+    if D is None:
+        D = fc.momentum_leaking_matrix(V, T, dt=dt)
 
     C =  (Me @ D @ J).T
 
@@ -3,10 +3,12 @@
 import numpy as np
 import igl
 
-import fast_cody
 from .laplacian import laplacian
+from .sparse_solver import sparse_solve
+from .profiling import profiled
 
 
+@profiled
 def diffuse_weights(Vv, Tv, phi, bI,  dt=None, normalize=True):
     """ Performs a diffusion on the tet mesh Vv, Tv at nodes bI for time dt.
 
@@ -45,7 +47,7 @@ def diffuse_weights(Vv, Tv, phi, bI,  dt=None, normalize=True):
     Qii = Q[ii, :][:, ii]
     Qib = Q[ii, :][:, bI]
 
-    Wii = fast_cody.umfpack_lu_solve(Qii, -Qib @ phi)
+    Wii = sparse_solve(Qii, -Qib @ phi, matrix_class="spd")
     W = np.zeros((L.shape[0], Wii.shape[1]))
     W[ii, :] = Wii
     W[bI, :] = phi
@@ -2,38 +2,23 @@ import scipy as sp
 from scipy.sparse import hstack, vstack
 from scipy.sparse.linalg import LinearOperator
 import numpy as np
-import cvxopt
 
+from .sparse_solver import sparse_factorize
+from .profiling import profiled
 
-from .umfpack_lu_solve import umfpack_lu_solve
 
-
-#Overrides scipy's defualt LU factorization,
-# which uses https://portal.nersc.gov/project/sparse/superlu/
-# and instead use LU decopmosition from UMFPACK
-class umfpack_LU_LinearOperator(LinearOperator):
-    def __init__(self, A):
-        self.A = A
-        self.shape = A.shape
-        self.dtype = A.dtype
-        self.A = A
-
-        [I, J] = A.nonzero()
-        v = A.data
-        Ac = cvxopt.spmatrix(v, I, J, A.shape)
-        F = cvxopt.umfpack.symbolic(Ac)
-        self.numeric = cvxopt.umfpack.numeric(Ac, F)
-        self.A = Ac
-        # bc = cvxopt.matrix(b)
-        # cvxopt.umfpack.linsolve(Ac, bc)
-        # cnp = np.array(bc)
-        super(umfpack_LU_LinearOperator, self).__init__( A.dtype ,A.shape)
+# Wraps a factorization from the sparse solver registry as the shift-invert operator
+# used by scipy's eigs, instead of scipy's default SuperLU.
+class _factorized_LinearOperator(LinearOperator):
+    def __init__(self, A, matrix_class="general", solver=None):
+        [self.solve, self.solver] = sparse_factorize(A, matrix_class=matrix_class, solver=solver)
+        super(_factorized_LinearOperator, self).__init__(A.dtype, A.shape)
 
     def _matvec(self, v):
-        b = cvxopt.matrix(v)
-        x = b
-        cvxopt.umfpack.solve(self.A, self.numeric, b)
-        return x
+        return self.solve(v)
+
+    def _matmat(self, V):
+        return self.solve(V)
 
 '''
 Computes Generalized Eigenvalues and Eigenvectors of sparse non-definite matrix A, with massmatrix M
@@ -44,12 +29,15 @@ A - n x n indefinite sparse matrix
 Optional
 k - int number of eigenvectors/values tos olve for (default=5)
 M - n x n indefinite mass matrix
+matrix_class - "spd", "symmetric_indefinite" or "general", used to pick the factorization (default="general")
+solver - name of the sparse solver backend to use (default=None, picks by matrix_class)
 
 Returns
 D - k x 1 eigenvalues
 B - n x k eigenvectors
 '''
-def eigs(A, k=5, M=None):
+@profiled
+def eigs(A, k=5, M=None, matrix_class="general", solver=None):
     """
     Computes Generalized Eigenvalues and Eigenvectors of sparse non-definite matrix A, with massmatrix M
 
@@ -61,6 +49,10 @@ def eigs(A, k=5, M=None):
         Number of eigenvectors/values to solve for (default=5)
     M : (n, n) float sparse matrix
         Indefinite mass matrix
+    matrix_class : str
+        One of "spd", "symmetric_indefinite" or "general", used to pick the factorization of A (default="general")
+    solver : str
+        Name of the sparse solver backend to use. If None, picks according to matrix_class (default=None)
 
     Returns
     --------
@@ -73,12 +65,7 @@ def eigs(A, k=5, M=None):
     if M is None:
         M = sp.sparse.identity(A.shape[0])
 
-    try:
-        OpInv = umfpack_LU_LinearOperator(A)
-        # MInv = umfpack_LU_LinearOperator(M)
-        [D, B] = sp.sparse.linalg.eigs(A, M=M, k=k, sigma=0,
-                                  which='LM', OPinv=OpInv)
-    except:
-        print("UMFPACK LU Factorization Failed, Trying Scipy LU, which is slower")
-        [D, B] = sp.sparse.linalg.eigs(A, M=M, k=k, sigma=0,which='LM')
+    OpInv = _factorized_LinearOperator(A, matrix_class=matrix_class, solver=solver)
+    [D, B] = sp.sparse.linalg.eigs(A, M=M, k=k, sigma=0,
+                                   which='LM', OPinv=OpInv)
     return D, B
\ No newline at end of file
@@ -0,0 +1,212 @@
+import os
+
+import numpy as np
+import igl
+
+from .lbs_reconstruct import lbs_reconstruct
+from .linear_cd_sim import linear_cd_sim, linear_cd_state
+
+
+def _rig_frames(P):
+    # columns of a (12b, frames) array (e.g. a memory map), or the vectors of any iterable, one frame at a time
+    if hasattr(P, "shape"):
+        for i in range(P.shape[1]):
+            yield P[:, i]
+    else:
+        for p in P:
+            yield np.ravel(p)
+
+
+def _simulate(sim, P, state, m, chunk_size):
+    # steps the sim through the clip, yielding blocks of at most chunk_size frames of rig parameters and
+    # secondary motion. The blocks are reused, so they are only valid until the next one is asked for
+    Pc = None
+    Zc = np.zeros((m, chunk_size), order="F")
+    sequence = True
+    i = 0
+    for p in _rig_frames(P):
+        if Pc is None:
+            Pc = np.zeros((p.shape[0], chunk_size), order="F")
+            if isinstance(sim, linear_cd_sim):
+                if state is None:
+                    state = linear_cd_state(np.zeros(m), p, dtype=sim.dtype)
+            else:
+                from .fast_cd_sim import fast_cd_state
+                if state is None:
+                    state = fast_cd_state(np.zeros((m, 1)), p.reshape(-1, 1))
+                # whole chunks go through the native step_sequence, unless a step needs the python solve loop
+                sequence = sim.time_budget is None and not sim.carry_unconverged
+        Pc[:, i] = p
+        if not sequence:
+            sim.step_into(Pc[:, i], state, Zc[:, i])
+            state.update(Zc[:, i], Pc[:, i])
+        i += 1
+        if i == chunk_size:
+            if sequence:
+                sim.step_sequence(Pc, state, out=Zc)
+            yield Pc, Zc
+            i = 0
+    if i > 0:
+        # leading columns of Fortran ordered blocks are Fortran ordered themselves
+        if sequence:
+            sim.step_sequence(Pc[:, :i], state, out=Zc[:, :i])
+        yield Pc[:, :i], Zc[:, :i]
+
+
+def _deform(blocks, V, Wp, Ws, so, to):
+    # positions of the exported vertices for every block of frames, back in the frame of the input mesh
+    for [Pc, Zc] in blocks:
+        U = lbs_reconstruct(V, Wp, Ws, Pc, Zc)
+        if U.ndim == 2:
+            U = U[None]
+        yield (U + to) / so
+
+
+def _frame_path(path, i):
+    [root, ext] = os.path.splitext(path)
+    if "{" in root:
+        return root.format(i) + ext
+    return root + "_%05d" % i + ext
+
+
+def _write_obj(path, U, F, TC=None, FTC=None):
+    with open(path, "w") as f:
+        np.savetxt(f, U, fmt="v %.8g %.8g %.8g")
+        if TC is None:
+            np.savetxt(f, F + 1, fmt="f %d %d %d")
+        else:
+            np.savetxt(f, TC, fmt="vt %.8g %.8g")
+            np.savetxt(f, np.stack([F + 1, FTC + 1], axis=2).reshape(-1, 6), fmt="f %d/%d %d/%d %d/%d")
+
+
+def _write_ply(path, U, F):
+    header = ("ply\nformat binary_little_endian 1.0\nelement vertex %d\nproperty float x\nproperty float y\n"
+              "property float z\nelement face %d\nproperty list uchar int vertex_indices\nend_header\n"
+              % (U.shape[0], F.shape[0]))
+    faces = np.zeros(F.shape[0], dtype=[("n", "u1"), ("f", "<i4", (3,))])
+    faces["n"] = 3
+    faces["f"] = F
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        f.write(U.astype("<f4").tobytes())
+        f.write(faces.tobytes())
+
+
+def export_deformed_meshes(sim, V, T, Wp, Ws, P, path, texture_obj=None, state=None, num_frames=None,
+                           so=1.0, to=None, chunk_size=64):
+    """
+    Headless export of a simulated rig clip as per-frame deformed meshes, without OpenGL.
+
+    The clip flows through a generator pipeline, simulating, reconstructing (with lbs_reconstruct) and writing
+    chunk_size frames at a time, so memory stays bounded by a chunk whatever the length of the clip. Each chunk is
+    simulated with a single step_sequence call, or step by step for a fast_cd_sim with a time_budget or
+    carry_unconverged. The
+    exported mesh is either the boundary surface of the tet mesh (boundary_facets) or, with texture_obj, the
+    textured surface mesh, deformed through the prolongation matrix onto the tet mesh like the viewers do.
+    The output format follows the extension of path:
+    ```
+        .npy  (frames, s, 3) memory mapped stack of vertex positions, with the triangles in <path>_faces.npy
+        .obj  one OBJ per frame, with texture coordinates if texture_obj is given
+        .ply  one binary PLY per frame
+    ```
+    Sequence files are named after path, either by formatting it with the frame index
+    (e.g. "out/fish_{:05d}.obj") or by appending _<frame> to it.
+
+    Parameters
+    ----------
+    sim : fast_cd_sim or linear_cd_sim
+        Simulation to step through the clip
+    V : (n, 3) float numpy array
+        Rest vertex positions of the tet mesh the sim was built on
+    T : (t, 4) int numpy array
+        Tet indices
+    Wp : (n, b) float numpy array
+        Primary rig skinning weights
+    Ws : (n, m) float numpy array
+        Secondary skinning weights of the sim's subspace
+    P : (12b, frames) float numpy array or iterable of (12b,) float numpy arrays
+        Rig parameters of every frame, e.g. a memory map, or a generator for clips that don't fit in memory
+    path : str
+        Output file (.npy) or file name pattern (.obj, .ply)
+    texture_obj : str
+        Textured surface .obj to export instead of the tet mesh boundary, in the frame of the input mesh
+        (default=None)
+    state : fast_cd_state or linear_cd_state
+        State the clip starts from, advanced in place. If None, starts at rest on the first frame (default=None)
+    num_frames : int
+        Number of frames, needed to size the .npy stack when P is an iterable (default=None, P.shape[1])
+    so : float
+        Scale the mesh was normalized by before simulation, undone on export (default=1)
+    to : (1, 3) float numpy array
+        Translation the mesh was normalized by before simulation, undone on export (default=0)
+    chunk_size : int
+        Number of frames simulated and reconstructed at a time (default=64)
+
+    Returns
+    -------
+    report : dict
+        frames, number of exported vertices and faces, path, and the faces_file of a .npy export or the
+        first_file of a sequence
+
+    Examples
+    --------
+    ```
+    >>> pre = fcd.build(msh_file=fcd.get_data("cd_fish.msh"), rig_file=fcd.get_data("cd_fish_rig.json"))
+    >>> fcd.export_deformed_meshes(pre["sim"], pre["V"], pre["T"], pre["Wp"], pre["Ws"], Prel, "out/fish.npy",
+    >>>                            so=pre["so"], to=pre["to"])
+    ```
+    """
+    [root, ext] = os.path.splitext(path)
+    ext = ext.lower()
+    assert (ext in [".npy", ".obj", ".ply"] and "path must end in .npy, .obj or .ply")
+    to = np.zeros((1, 3)) if to is None else np.reshape(to, (1, 3))
+    dirname = os.path.dirname(path)
+    if dirname != "":
+        os.makedirs(dirname, exist_ok=True)
+
+    [TC, FTC] = [None, None]
+    if texture_obj is None:
+        F = igl.boundary_facets(T)
+        [I, F] = np.unique(F, return_inverse=True)
+        F = F.reshape(-1, 3)
+        [Vx, Wpx, Wsx] = [V[I], Wp[I], Ws[I]]
+    else:
+        import fast_cd_pyb as fcdp
+        [Vf, TC, N, F, FTC, FN] = fcdp.readOBJ_tex(texture_obj)
+        Vx = Vf * so - to
+        Pr = fcdp.prolongation(Vx, V, T)
+        [Wpx, Wsx] = [Pr @ Wp, Pr @ Ws]
+
+    if num_frames is None and hasattr(P, "shape"):
+        num_frames = P.shape[1]
+    if ext == ".npy":
+        assert (num_frames is not None and "exporting to .npy needs num_frames when P is an iterable")
+        U = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(num_frames, Vx.shape[0], 3))
+        np.save(root + "_faces.npy", F)
+
+    m = Ws.shape[1] * 12
+    frame = 0
+    for Uc in _deform(_simulate(sim, P, state, m, chunk_size), Vx, Wpx, Wsx, so, to):
+        if ext == ".npy":
+            assert (frame + Uc.shape[0] <= num_frames and "the clip has more frames than num_frames")
+            U[frame:frame + Uc.shape[0]] = Uc
+        elif ext == ".obj":
+            for [j, Ui] in enumerate(Uc):
+                _write_obj(_frame_path(path, frame + j), Ui, F, TC, FTC)
+        else:
+            for [j, Ui] in enumerate(Uc):
+                _write_ply(_frame_path(path, frame + j), Ui, F)
+        frame += Uc.shape[0]
+
+    if ext == ".npy":
+        # a shorter clip would leave the tail of the stack zeroed
+        assert (frame == num_frames and "the clip has fewer frames than num_frames")
+
+    report = dict(frames=frame, num_vertices=int(Vx.shape[0]), num_faces=int(F.shape[0]), path=path)
+    if ext == ".npy":
+        U.flush()
+        del U
+        report["faces_file"] = root + "_faces.npy"
+    else:
+        report["first_file"] = _frame_path(path, 0)
+    return report
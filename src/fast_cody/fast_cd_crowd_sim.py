@@ -0,0 +1,108 @@
+import numpy as np
+
+
+class fast_cd_crowd_sim():
+    """
+    Many instances of the same creature, each with its own rig animation, simulated with a single
+    fast_cd_sim. The static and dynamic precomputation (and its factorization) is stored once, and
+    the N states live side by side as the columns of (m, N) and (12b, N) matrices.
+
+    Each step advances every instance in one native call, with the GIL released. The local steps and the
+    global solve still run per instance: the native solver backsubstitutes one right hand side at a time
+    against the shared factorization, so the cost of a step is linear in N, without python overhead per
+    instance. Instances are stepped with the solver parameters of the sim, ignoring its time_budget and
+    carry_unconverged.
+
+    Examples
+    --------
+    ```
+    >>> crowd = fast_cody.fast_cd_crowd_sim(sim, 12)
+    >>> for i in range(frames):
+    >>>     Z = crowd.step(P[:, :, i])
+    ```
+    """
+    def __init__(self, sim, num_instances, z0=None, p0=None):
+        """
+        Initializes every instance at rest
+
+        Parameters
+        ----------
+        sim : fast_cd_sim
+            Simulation whose precomputation is shared by every instance
+        num_instances : int
+            Number of instances N
+        z0 : (m, N) float numpy array
+            Initial reduced secondary motion of every instance (default=0)
+        p0 : (12b, N) float numpy array
+            Initial rig parameters of every instance. If None, every instance starts at the rest pose (default=None)
+        """
+        assert (sim.model == "arap" and "fast_cd_crowd_sim only supports the arap model")
+        self.sim = sim
+        self.num_instances = num_instances
+        m = sim._f_ext0.shape[0]
+        num_p = sim.Jsp.shape[1]
+
+        if z0 is None:
+            z0 = np.zeros((m, num_instances))
+        if p0 is None:
+            # identity affine per bone, in the (3, b, 4) row-major layout of the rig parameters
+            b = num_p // 12
+            p0 = np.tile(np.tile(np.eye(3, 4)[:, None, :], (1, b, 1)).reshape(-1, 1), (1, num_instances))
+        assert (z0.shape == (m, num_instances) and "z0 must be m x N")
+        assert (p0.shape == (num_p, num_instances) and "p0 must be 12b x N")
+
+        # triple buffer for z (prev, curr, next) and double buffer for p, rotated instead of reallocated
+        self.Z_prev = np.array(z0, order="F", dtype=np.float64)
+        self.Z_curr = np.array(z0, order="F", dtype=np.float64)
+        self.Z_next = np.zeros((m, num_instances), order="F")
+        self.P_prev = np.array(p0, order="F", dtype=np.float64)
+        self.P_curr = np.array(p0, order="F", dtype=np.float64)
+
+    def step(self, P, f_ext=None, bc=None):
+        """
+        Steps every instance forward by one timestep
+
+        Parameters
+        ----------
+        P : (12b, N) float numpy array
+            Next rig parameters of every instance, one column per instance
+        f_ext : (m, 1) float numpy array
+            External force, shared by every instance (default=0)
+        bc : (c, 1) float numpy array
+            Boundary constraints, shared by every instance (default=None). Only valid if sim.Aeq is non-empty
+
+        Returns
+        -------
+        Z : (m, N) float numpy array
+            Reduced secondary motion of every instance. This is the crowd's current state buffer,
+            valid until the next step. Copy it if you need to keep it around.
+        """
+        assert (P.shape == self.P_curr.shape and "P must be 12b x N")
+        self.sim.sim.step_batch(P, self.Z_curr, self.Z_prev, self.P_curr, self.P_prev, self.Z_next,
+                                self.sim._f_ext0 if f_ext is None else f_ext,
+                                self.sim._bc0 if bc is None else bc)
+
+        self.Z_prev, self.Z_curr, self.Z_next = self.Z_curr, self.Z_next, self.Z_prev
+        self.P_prev, self.P_curr = self.P_curr, self.P_prev
+        self.P_curr[:] = P
+        return self.Z_curr
+
+    def reset(self, i, z=None, p=None):
+        """
+        Puts instance i back at rest, e.g. when its animation loops
+
+        Parameters
+        ----------
+        i : int
+            Instance index
+        z : (m, 1) float numpy array
+            Reduced secondary motion to reset to (default=0)
+        p : (12b, 1) float numpy array
+            Rig parameters to reset to (default=current rig parameters of instance i)
+        """
+        z = 0.0 if z is None else np.ravel(z)
+        p = self.P_curr[:, i].copy() if p is None else np.ravel(p)
+        self.Z_prev[:, i] = z
+        self.Z_curr[:, i] = z
+        self.P_prev[:, i] = p
+        self.P_curr[:, i] = p
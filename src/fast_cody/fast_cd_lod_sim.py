@@ -0,0 +1,248 @@
+import time
+
+import numpy as np
+import igl
+
+from .fast_cd_sim import fast_cd_sim, fast_cd_state
+from .laplacian import laplacian
+from .lbs_jacobian import lbs_jacobian
+from .skinning_clusters import skinning_clusters
+from .skinning_subspace import skinning_subspace
+from .project_into_subspace import project_into_subspace
+
+
+class fast_cd_lod_sim():
+    """
+    Fast Complementary Dynamics with several subspace sizes (levels of detail) of the same creature, switched
+    at runtime by frame time budget or camera distance.
+
+    Every level is built from the first modes of a single eigen solve, so the subspaces are nested: level i's
+    B is a subset of the columns of any larger level's B. Switching to a larger level embeds the reduced state
+    exactly, switching to a smaller one projects it in the mass matrix metric (see project_into_subspace), and
+    the motion of the dropped modes is faded out over a few frames in z_full so the displacement doesn't pop.
+    The simulation state is owned by this object, one fast_cd_sim per level shares the creature's rig.
+    """
+    def __init__(self, V, T, J, p0, num_modes=[8, 16, 32], num_clusters=None, distances=None, level=None,
+                 blend_frames=10, hysteresis=0.8, W=None, E=None, C=None, constraint_enforcement="optimal",
+                 **sim_kwargs):
+        """
+        Precomputes every level and starts at rest
+
+        Parameters
+        ----------
+        V : (n, 3) float numpy array
+            Vertex positions
+        T : (F, 4) int numpy array
+            Tet indices
+        J : (3n, 12b) float numpy array
+            LBS rig jacobian
+        p0 : (12b, 1) float numpy array
+            Initial rig parameters
+        num_modes : list of int
+            Number of modes of every level (default=[8, 16, 32])
+        num_clusters : list of int
+            Number of clusters of every level. If None, scales with the number of modes, 100 clusters for
+            the largest level (default=None)
+        distances : list of float
+            Increasing camera distances past which select_level drops to the next smaller level, one less than
+            the number of levels. Required to select by distance (default=None)
+        level : int
+            Initial level, index into the levels sorted by number of modes. If None, the largest (default=None)
+        blend_frames : int
+            Number of frames over which the motion of the modes dropped by a switch to a smaller level fades
+            out of z_full (default=10)
+        hysteresis : float
+            select_level only moves to a larger level if its estimated step time is below hysteresis * budget,
+            so that the level doesn't flicker around the budget (default=0.8)
+        W : (n, M) float numpy array
+            Precomputed skinning eigenmodes, at least as many as the largest level. If None, the largest level
+            is built with skinning_subspace (default=None)
+        E : (M, 1) float numpy array
+            Eigenvalues of W, weighing the clustering features of the smaller levels. If None, the Rayleigh
+            quotients of W (default=None)
+        C : (c, n) float numpy array
+            Constraint matrix on the weights s.t. C @ W = 0, see laplacian_eigenmodes (default=None)
+        constraint_enforcement : str
+            Method of enforcing constraint. Either "project" or "optimal" (default="optimal")
+        **sim_kwargs
+            Passed to the fast_cd_sim of every level (mu, rho, h, max_iters, cache_dir, read_cache, ...)
+        """
+        num_modes = sorted(num_modes)
+        K = num_modes[-1]
+        if num_clusters is None:
+            num_clusters = [max(100 * k // K, 1) for k in num_modes]
+        assert (len(num_clusters) == len(num_modes) and "need one cluster count per level")
+        if distances is not None:
+            assert (len(distances) == len(num_modes) - 1 and "need one distance threshold between every two levels")
+            assert (np.all(np.diff(distances) > 0) and "distance thresholds must be increasing")
+        M = igl.massmatrix(V, T)
+        if W is None:
+            [B, l, W] = skinning_subspace(V, T, K, num_clusters[-1], C=C,
+                                          constraint_enforcement=constraint_enforcement)
+        else:
+            assert (W.shape[1] >= K and "W must have as many modes as the largest level")
+            W = W[:, :K]
+            [B, l] = [lbs_jacobian(V, W), None]
+        if E is None:
+            # eigenvalues of the modes of laplacian_eigenmodes, up to their orthonormalization
+            L = laplacian(V, T) + 1e-8 * M
+            E = np.sum(W * (L @ W), axis=0) / np.sum(W * (M @ W), axis=0)
+        E = np.ravel(E)[:K]
+
+        # columns of level k in the largest level's B, in the (3, K, 4) layout of lbs_jacobian
+        self.columns = [np.arange(12 * K).reshape(3, K, 4)[:, :k, :].ravel() for k in num_modes]
+        self.num_modes = num_modes
+        self.Ws = [W[:, :k] for k in num_modes]
+        self.B = [B[:, c] for c in self.columns]
+        self.l = [skinning_clusters(self.Ws[i], E[:k], T, num_clusters[i], l=2, num_clustering_features=k)
+                  for [i, k] in enumerate(num_modes[:-1])]
+        self.l.append(l if l is not None else
+                      skinning_clusters(W, E, T, num_clusters[-1], l=2, num_clustering_features=K))
+        self.sims = [fast_cd_sim(V, T, self.B[i], self.l[i], J, **sim_kwargs) for i in range(len(num_modes))]
+
+        # projections[i][j] maps the reduced state of level i to level j, argmin_zj ||Bj zj - Bi zi||_M
+        self.projections = [[project_into_subspace(Bi, Bj, M) for Bj in self.B] for Bi in self.B]
+
+        self.distances = distances
+        self.blend_frames = blend_frames
+        self.hysteresis = hysteresis
+        self.step_times = [None] * len(num_modes)
+        self.level = len(num_modes) - 1 if level is None else level
+        m = 12 * num_modes[self.level]
+        self.state = fast_cd_state(np.zeros((m, 1)), p0)
+        self._z = [np.zeros((12 * k, 1)) for k in num_modes]
+        self._z_full = np.zeros((12 * K, 1))
+        self._residual = np.zeros(12 * K)
+        self._blend = 0
+
+    def set_level(self, level):
+        """
+        Switches to another level, projecting the current and previous reduced states into it
+
+        Parameters
+        ----------
+        level : int
+            Index of the level, into the levels sorted by number of modes
+        """
+        if level == self.level:
+            return
+        Pij = self.projections[self.level][level]
+        z_curr = Pij @ np.ravel(self.state.z_curr)
+        z_prev = Pij @ np.ravel(self.state.z_prev)
+        if level < self.level:
+            # what the smaller level can't represent, faded out of z_full over the next frames. Going up
+            # embeds exactly, and a fade still in progress keeps going
+            z_full = self.z_full
+            self._residual[:] = np.ravel(z_full)
+            self._residual[self.columns[level]] -= z_curr
+            self._blend = self.blend_frames
+        self.state = fast_cd_state(z_curr.reshape(-1, 1), self.state.p_curr.copy(),
+                                   z_prev.reshape(-1, 1), self.state.p_prev.copy())
+        # the warm start history of the new level's sim belongs to an older stretch of motion
+        self.sims[level].reset_warm_start()
+        self.level = level
+
+    def select_level(self, budget=None, distance=None):
+        """
+        Picks the level fitting a frame time budget and/or a camera distance, and switches to it.
+        With both, the smaller of the two levels wins.
+
+        Parameters
+        ----------
+        budget : float
+            Time in seconds a step may take. Levels that were never stepped have their step time
+            extrapolated from the current level's, assuming it grows with the square of the number of modes
+        distance : float
+            Distance of the creature to the camera, compared against distances
+
+        Returns
+        -------
+        level : int
+            The level switched to
+        """
+        level = len(self.num_modes) - 1
+        if distance is not None:
+            assert (self.distances is not None and "selecting by distance needs distance thresholds")
+            level = level - int(np.searchsorted(self.distances, distance, side="right"))
+        if budget is not None:
+            fits = 0
+            for i in range(len(self.num_modes)):
+                t = self.estimated_step_time(i)
+                limit = budget * self.hysteresis if i > self.level else budget
+                if t is None or t <= limit:
+                    fits = i
+                else:
+                    break
+            level = min(level, fits)
+        self.set_level(level)
+        return level
+
+    def estimated_step_time(self, level):
+        """
+        Measured or extrapolated step time of a level
+
+        Parameters
+        ----------
+        level : int
+            Index of the level
+
+        Returns
+        -------
+        t : float
+            Step time in seconds, None if no level was stepped yet
+        """
+        if self.step_times[level] is not None:
+            return self.step_times[level]
+        t = self.step_times[self.level]
+        if t is None:
+            return None
+        return t * (self.num_modes[level] / self.num_modes[self.level]) ** 2
+
+    def step(self, p, f_ext=None, bc=None):
+        """
+        Steps the active level forward and updates the state
+
+        Parameters
+        ----------
+        p : (12b, 1) float numpy array
+            Next state of the rig parameters
+        f_ext : (m, 1) float numpy array
+            External force in the active level's subspace (default=0)
+        bc : (c, 1) float numpy array
+            Boundary constraints (default=None)
+
+        Returns
+        -------
+        z : (m, 1) float numpy array
+            Next reduced secondary motion of the active level, valid until the next step
+        """
+        z = self._z[self.level]
+        start = time.perf_counter()
+        self.sims[self.level].step_into(p, self.state, z, f_ext=f_ext, bc=bc)
+        t = time.perf_counter() - start
+        prev = self.step_times[self.level]
+        self.step_times[self.level] = t if prev is None else 0.9 * prev + 0.1 * t
+        self.state.update(z, p)
+        if self._blend > 0:
+            self._blend -= 1
+        return z
+
+    @property
+    def z_full(self):
+        """
+        Reduced secondary motion of the active level embedded in the largest level, plus the fading motion of
+        the modes a recent switch dropped. Reconstructs with the largest level's B and Ws, so a renderer never
+        has to know about the switches.
+
+        Returns
+        -------
+        z : (12M, 1) float numpy array
+            Reduced secondary motion in the largest level, valid until the next call
+        """
+        z = self._z_full
+        if self._blend > 0:
+            z[:, 0] = (self._blend / self.blend_frames) * self._residual
+        else:
+            z[:] = 0
+        z[self.columns[self.level], 0] += np.ravel(self.state.z_curr)
+        return z
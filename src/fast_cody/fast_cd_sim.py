@@ -1,9 +1,18 @@
 
+import os
+import time
+import warnings
+
 import scipy as sp
 import numpy as np
 
 import fast_cd_pyb as fcd
 
+from .solver_telemetry import solver_telemetry
+from .step_recorder import step_recorder
+from .profiling import profiled
+from .sim_cache import sim_cache_key, sim_cache_dir, validate_sim_cache, write_sim_cache_manifest, load_sim_cache
+
 
 class fast_cd_state(fcd.cd_sim_state):
     """
@@ -14,6 +23,11 @@ class fast_cd_state(fcd.cd_sim_state):
         p_curr: the current state of the rig parameters
         z_prev: the previous state of the reduced secondary motion
         p_prev: the previous state of the rig parameters
+
+    The current and previous quantities are preallocated double buffers living in the underlying
+    cd_sim_state. update swaps them in place instead of allocating new arrays, and z_curr, z_prev,
+    p_curr and p_prev are read-only views into those buffers, valid until the next update.
+    Copy them if you need to keep them around.
     """
     def __init__(self, z_curr, p_curr, z_prev=None, p_prev=None):
         """
@@ -30,26 +44,17 @@ class fast_cd_state(fcd.cd_sim_state):
         p_prev : (12b, 1) float numpy array
             Previous state of the rig parameter. If None, set to p_curr
         """
-        z_curr = z_curr.copy()
-        p_curr = p_curr.copy()
-
+        # the bindings copy into the state's own buffers, no need to copy here
         if z_prev is None:
-            z_prev = z_curr.copy()
+            z_prev = z_curr
         if p_prev is None:
-            p_prev = p_curr.copy()
+            p_prev = p_curr
 
         super().__init__(z_curr, z_prev, p_curr, p_prev)
 
-
-    '''
-    Updates the simulation state
-    Inputs:
-    z - m x 1 reduced space coefficients for subspace sim
-    p - 12b x 1 rig parameters
-    '''
     def update(self, z, p):
         """
-        Updates the simulation state
+        Updates the simulation state in place, without allocating
 
         Parameters
         ----------
@@ -58,11 +63,7 @@ class fast_cd_state(fcd.cd_sim_state):
         p : (12b, 1) float numpy array
             Next state of the rig parameters
         """
-        self.z_prev = self.z_curr.copy()
-        self.p_prev = self.p_curr.copy()
-
-        self.z_curr = z.copy()
-        self.p_curr = p.copy()
+        self.swap_update(z, p)
 
 
 '''
@@ -71,9 +72,17 @@ Fast CD Simulation, implementation of https://www.dgp.toronto.edu/projects/fast_
 class fast_cd_sim():
     """
     Fast Complementary Dynamics Simulation, implementation of https://www.dgp.toronto.edu/projects/fast_complementary_dynamics_site/
+
+    Thread safety: the native solve of step, step_into and step_sequence runs with the GIL released, so
+    separate fast_cd_sim objects can be stepped concurrently from python threads (see parallel_step).
+    A single fast_cd_sim keeps solver scratch space and must only be stepped from one thread at a time.
+    The state passed to step and step_into is copied before the GIL is released. step_sequence advances
+    its state in place without the GIL, so that state must not be used elsewhere until it returns.
     """
+    @profiled
     def __init__(self, V, T, B, l, J, mu=1e4, rho=1e3, h=1e-2, max_iters=30, threshold=1e-8,
-                 read_cache=False, cache_dir="", Aeq=None, write_cache=False):
+                 read_cache=False, cache_dir="", Aeq=None, write_cache=False, time_budget=None,
+                 carry_unconverged=False, warm_start="current", report_savings=False, model="arap", lam=0.0):
         """
         Initializes a Fast Complementary Dynamics Simulation.
         
@@ -100,26 +109,367 @@ class fast_cd_sim():
         threshold : float
             Convergence threshold for local global solver (default=1e-8)
         read_cache : bool
-            Whether to read simulation precomp from cache (default=False)
+            Whether to read simulation precomp from cache (default=False). Only reads an entry written by the same
+            cache version for the same V, T, B, l, J, mu, rho and h, otherwise recomputes.
         cache_dir : str
-            Directory to read/write cache from/to (default="")
+            Root directory to read/write cache from/to (default=""). The precomp lives in a content-keyed
+            subdirectory cache_dir/fast_cd_sim-<key>, see sim_cache.
         Aeq : (c, m) float numpy array
             Constraint matrix (default empty, untested yet)
         write_cache : bool
             Whether to write simulation precomp to cache (default=False) 
+        time_budget : float
+            Wall clock budget of a step in seconds. If set, the local-global solver runs one iteration at a time
+            and stops at the first iteration boundary past the budget, at convergence, or at max_iters, whichever
+            comes first. See last_solve. Every iteration is a separate native step, which reassembles the right
+            hand side, so an iteration costs more than in an unbudgeted solve. The steps are taken by a second
+            native simulation built with max_iters=1 on the first budgeted step, which reads the cache entry if
+            there is one and otherwise redoes the precomputation. If None, runs up to max_iters (default=None)
+        carry_unconverged : bool
+            With a time_budget, whether a step that ran out of time carries its last iterate increment
+            into the warm start of the next step (default=False)
+        warm_start : str
+            Initial guess of the local-global solver when step is not given z (default="current"):
+            "current" - z_curr
+            "linear" - 2 z_curr - z_prev, constant velocity extrapolation
+            "quadratic" - 3 z_curr - 3 z_prev + z_prev2, constant acceleration extrapolation. z_prev2 is
+                remembered from the previous step, so this assumes the same state is stepped every time
+            "rig" - z_curr + s (z_curr - z_prev), with s the ratio of the next to the current rig velocity
+        report_savings : bool
+            Whether to also solve every step from z_curr, to report the iterations the warm start saved in
+            last_iters_saved and total_iters_saved. Doubles the cost of a step, meant for tuning (default=False)
+        model : str
+            Elastic model of the secondary motion (default="arap"):
+            "arap" - as-rigid-as-possible, fast_cd_arap_sim
+            "corot" - linearized corotational, fast_cd_corot_sim. Cheaper per step, meant for background
+                characters. Has no precomp cache, ignores rho, and doesn't support telemetry, time_budget
+                or report_savings
+        lam : float
+            Second lame parameter, only used by the "corot" model (default=0)
         """
         #These parameters need to be global member variables otherwise their memory is destroyed
         self.solver_params = fcd.local_global_solver_params(False, max_iters, threshold)
         if Aeq is None:
             self.Aeq = sp.sparse.csc_matrix((0, 0))
+        else:
+            self.Aeq = sp.sparse.csc_matrix(Aeq)
         self.Jsp = sp.sparse.csc_matrix(J)
+        assert (model in ["arap", "corot"] and "unknown model")
+        self.model = model
+        # the native params hold mu per tet, so the scalar parameters are kept here, along with what
+        # update_parameters needs to rebuild the simulation
+        [self.mu, self.rho, self.h, self.lam] = [mu, rho, h, lam]
+        self._inputs = (V, T, B, l)
+        self._cache_args = (read_cache, cache_dir, write_cache)
+        self._iter_sim = None
+        if model == "corot":
+            assert (time_budget is None and not report_savings and "the corot model doesn't report solver iterations")
+            self._init_corot(V, T, B, l, mu, lam, h)
+        else:
+            self._init_arap(V, T, B, l, mu, rho, h, read_cache, cache_dir, write_cache)
+
+        # zero external force and empty constraint rhs, reused by every step that doesn't provide them
+        self._f_ext0 = np.zeros(B.shape[1])
+        self._bc0 = np.zeros(self.Aeq.shape[0])
+        self.telemetry = None
+        self.recorder = None
+
+        self.time_budget = time_budget
+        self.carry_unconverged = carry_unconverged
+        self._last_solve = None
+        self._carry = None
+        self._z_iter = np.zeros(B.shape[1])
+
+        assert (warm_start in ["current", "linear", "quadratic", "rig"] and "unknown warm start predictor")
+        self.warm_start = warm_start
+        self.report_savings = report_savings
+        self.last_iters_saved = 0
+        self.total_iters_saved = 0
+        self._z_guess = np.zeros(B.shape[1])
+        self._z_prev2 = None
+        self._z_shadow = np.zeros(B.shape[1])
+        return
+
+    def _init_corot(self, V, T, B, l, mu, lam, h):
+        self.cache_dir = None
+        self.sim_params = fcd.fast_cd_corot_sim_params(V, T, B, l, self.Jsp, mu, lam, h, True)
+        if self.Aeq.shape[0] > 0:
+            self.sim_params.Aeq = self.Aeq
+        self.sim = fcd.fast_cd_corot_sim(self.sim_params, self.solver_params)
+
+    def _init_arap(self, V, T, B, l, mu, rho, h, read_cache, cache_dir, write_cache):
         self.sim_params = fcd.fast_cd_arap_sim_params(V, T, B, l, self.Jsp, self.Aeq, mu, h, rho)
 
-        write_cache = write_cache
+        # every (V, T, B, l, J, mu, rho, h) gets its own versioned cache entry, validated before it is read
+        self.cache_dir = None
+        self._cache_key = None
+        if (read_cache or write_cache) and cache_dir is not None and cache_dir != "":
+            key = self._cache_key = sim_cache_key(V, T, B, l, self.Jsp, mu, rho, h)
+            self.cache_dir = sim_cache_dir(cache_dir, key)
+            if read_cache:
+                [read_cache, reason] = validate_sim_cache(self.cache_dir, key)
+                if not read_cache:
+                    warnings.warn("fast_cd_sim cache miss (" + reason + "), recomputing")
+            os.makedirs(self.cache_dir, exist_ok=True)
+            cache_dir = self.cache_dir
+        write_cache = write_cache and not read_cache
         self.sim = fcd.fast_cd_arap_sim(cache_dir, self.sim_params, self.solver_params, read_cache, write_cache)
+        if write_cache and self.cache_dir is not None:
+            write_sim_cache_manifest(self.cache_dir, key, V, T, B, l, self.Jsp, mu, rho, h)
 
+    @property
+    def last_solve(self):
+        """
+        Outcome of the latest step
 
-        return
+        Returns
+        -------
+        iters : int
+            Number of local-global iterations run
+        residual : float
+            Final residual of the solver
+        converged : bool
+            Whether the residual dropped below the threshold
+        """
+        if self.time_budget is not None and self._last_solve is not None:
+            return self._last_solve
+        sol = self.sim.sol()
+        return sol.prev_solve_iters, sol.prev_res, sol.prev_res < self.solver_params.threshold
+
+    def _iteration_sim(self):
+        # native sim running a single local-global iteration per step. The native solver copies its solver_params
+        # when it is built, so this needs a sim of its own, built with max_iters=1 on first use. It reads this
+        # simulation's cache entry if there is one, otherwise it redoes the precompute
+        if self._iter_sim is None:
+            self._iter_params = fcd.local_global_solver_params(False, 1, self.solver_params.threshold)
+            read = self.cache_dir is not None and validate_sim_cache(self.cache_dir, self._cache_key)[0]
+            self._iter_sim = fcd.fast_cd_arap_sim(self.cache_dir if read else "", self.sim_params,
+                                                  self._iter_params, read, False)
+        return self._iter_sim
+
+    def _iterate_into(self, out, z, p, state, f_ext, bc):
+        # one local-global iteration from z. Returns the residual
+        sim = self._iteration_sim()
+        sim.step_into(out, z, p, state, f_ext, bc)
+        return sim.sol().prev_res
+
+    def _solve_into(self, out, z, p, state, f_ext, bc):
+        if self.report_savings:
+            # baseline solve from z_curr, first so that sol() reports the real solve afterwards
+            self.sim.step_into(self._z_shadow, state.z_curr, p, state, f_ext, bc)
+            baseline_iters = self.sim.sol().prev_solve_iters
+            self._solve(out, z, p, state, f_ext, bc)
+            self.last_iters_saved = baseline_iters - self.last_solve[0]
+            self.total_iters_saved += self.last_iters_saved
+            return out
+        return self._solve(out, z, p, state, f_ext, bc)
+
+    def _solve(self, out, z, p, state, f_ext, bc):
+        if self.time_budget is None:
+            self.sim.step_into(out, z, p, state, f_ext, bc)
+            return out
+
+        deadline = time.perf_counter() + self.time_budget
+        iters = 0
+        while True:
+            if self.carry_unconverged:
+                self._z_iter[:] = np.ravel(z)
+            res = self._iterate_into(out, z, p, state, f_ext, bc)
+            iters += 1
+            if (res < self.solver_params.threshold or iters >= self.solver_params.max_iters or
+                    time.perf_counter() >= deadline):
+                break
+            z = out
+
+        converged = res < self.solver_params.threshold
+        self._last_solve = (iters, res, converged)
+        if self.carry_unconverged and not converged:
+            self._carry = np.ravel(out) - self._z_iter
+        return out
+
+    def _predict(self, state, p):
+        z_curr = np.ravel(state.z_curr)
+        if self.warm_start == "current":
+            return z_curr
+        z_prev = np.ravel(state.z_prev)
+        guess = self._z_guess
+        if self.warm_start == "linear" or (self.warm_start == "quadratic" and self._z_prev2 is None):
+            np.subtract(2.0 * z_curr, z_prev, out=guess)
+        elif self.warm_start == "quadratic":
+            np.subtract(z_curr, z_prev, out=guess)
+            guess *= 3.0
+            guess += self._z_prev2
+        elif self.warm_start == "rig":
+            p_curr = np.ravel(state.p_curr)
+            v_curr = np.linalg.norm(p_curr - np.ravel(state.p_prev))
+            v_next = np.linalg.norm(np.ravel(p) - p_curr)
+            s = 0.0 if v_curr < 1e-12 else min(v_next / v_curr, 2.0)
+            np.subtract(z_curr, z_prev, out=guess)
+            guess *= s
+            guess += z_curr
+
+        if self.warm_start == "quadratic":
+            if self._z_prev2 is None:
+                self._z_prev2 = np.zeros(z_prev.shape[0])
+            self._z_prev2[:] = z_prev
+        return guess
+
+    def _warm_start(self, state, p):
+        z = self._predict(state, p)
+        if self._carry is None:
+            return z
+        z = z + self._carry
+        self._carry = None
+        return z
+
+    def reset_warm_start(self):
+        """
+        Forgets the history the warm start predictor and carry_unconverged keep from previous steps, e.g. when the
+        next step continues from another state than the last one stepped
+        """
+        self._z_prev2 = None
+        self._carry = None
+
+    @classmethod
+    def from_cache(cls, sim_dir, **kwargs):
+        """
+        Rebuilds a simulation from a cache entry alone, without the subspace precomputation. The entry must have
+        been written with its inputs, which are read back and copied into the simulation like any other inputs.
+
+        Parameters
+        ----------
+        sim_dir : str
+            Cache entry directory, i.e. fast_cd_sim.cache_dir of the simulation that wrote it
+        **kwargs
+            Other arguments of fast_cd_sim (max_iters, threshold, warm_start, ...)
+
+        Returns
+        -------
+        sim : fast_cd_sim
+            Simulation reading its precomp from the entry
+        """
+        inputs = load_sim_cache(sim_dir)
+        cache_dir = os.path.dirname(os.path.normpath(sim_dir))
+        return cls(inputs["V"], inputs["T"], inputs["B"], inputs["l"], inputs["J"], mu=inputs["mu"],
+                   rho=inputs["rho"], h=inputs["h"], read_cache=True, cache_dir=cache_dir, **kwargs)
+
+    def update_parameters(self, mu=None, rho=None, h=None):
+        """
+        Changes the material parameters and timestep of the simulation.
+
+        The simulation library bakes mu, rho and h into its whole precomputation, the reduced matrices included,
+        so the simulator is rebuilt with the new ones. With read_cache it reads the cache entry of the new
+        parameters if there is one, and with write_cache it writes one, so switching back and forth between
+        parameters that were used before only pays for reading their entries.
+
+        The simulation state is unaffected. Don't call this while the simulation is being stepped on another thread.
+
+        Parameters
+        ----------
+        mu : float
+            New first lame parameter (default=None, unchanged)
+        rho : float
+            New density (default=None, unchanged)
+        h : float
+            New timestep (default=None, unchanged)
+        """
+        if mu is not None:
+            self.mu = mu
+        if rho is not None:
+            self.rho = rho
+        if h is not None:
+            self.h = h
+        self._iter_sim = None
+        [V, T, B, l] = self._inputs
+        if self.model == "corot":
+            self._init_corot(V, T, B, l, self.mu, self.lam, self.h)
+        else:
+            self._init_arap(V, T, B, l, self.mu, self.rho, self.h, *self._cache_args)
+
+    def enable_telemetry(self, capacity=1024, detailed=False):
+        """
+        Starts recording per-step solver statistics (iterations, residual, step time) of every step and step_into
+
+        Parameters
+        ----------
+        capacity : int
+            Number of most recent steps kept (default=1024)
+        detailed : bool
+            Whether to also record the residual after every iteration, which is slower (default=False)
+
+        Returns
+        -------
+        telemetry : solver_telemetry
+            Ring buffer of the recorded steps, also available as fast_cd_sim.telemetry
+
+        Only the total time of a step is recorded. The local (per-cluster rotation) and global phase timings
+        are not provided, the bindings don't expose them.
+        """
+        assert (self.model == "arap" and "the corot model doesn't report solver iterations")
+        self.telemetry = solver_telemetry(self, capacity=capacity, detailed=detailed)
+        return self.telemetry
+
+    def disable_telemetry(self):
+        """
+        Stops recording solver statistics
+        """
+        self.telemetry = None
+
+    def start_recording(self, path, record_f_ext=False, config=None):
+        """
+        Starts recording the inputs of every step, step_into and step_sequence to a file, for deterministic
+        replay through a fresh simulation (see step_recorder and benchmarks/step_replay.py). The recording
+        keeps the configuration of the simulation (see recording_config), and the constraint rhs of every step
+        if it has constraints
+
+        Parameters
+        ----------
+        path : str
+            File to write the recording to
+        record_f_ext : bool
+            Whether to also record the external force of every step (default=False)
+        config : dict
+            Configuration the simulation doesn't know about, e.g. the num_clusters and constraint_enforcement
+            its subspace was built with, added to the recorded one (default=None)
+
+        Returns
+        -------
+        recorder : step_recorder
+            The recording, also available as fast_cd_sim.recorder
+        """
+        self.stop_recording()
+        m = self._f_ext0.shape[0]
+        self.recorder = step_recorder(path, self.Jsp.shape[1], m, m if record_f_ext else 0, self.Aeq.shape[0],
+                                      dict(self.recording_config(), **({} if config is None else config)))
+        return self.recorder
+
+    def recording_config(self):
+        """
+        Configuration of the simulation, as recorded by start_recording
+
+        Returns
+        -------
+        config : dict
+            model, num_modes, mu, rho (arap) or lam (corot), h, max_iters, threshold, warm_start, time_budget
+            and carry_unconverged
+        """
+        config = dict(model=self.model, num_modes=self._f_ext0.shape[0] // 12, mu=self.mu,
+                      h=self.h, max_iters=self.solver_params.max_iters,
+                      threshold=self.solver_params.threshold, warm_start=self.warm_start,
+                      time_budget=self.time_budget, carry_unconverged=self.carry_unconverged)
+        if self.model == "corot":
+            config["lam"] = self.lam
+        else:
+            config["rho"] = self.rho
+        return config
+
+    def stop_recording(self):
+        """
+        Stops recording and closes the recording file
+        """
+        if self.recorder is not None:
+            self.recorder.close()
+        self.recorder = None
 
     '''
     Steps simulation state forward
@@ -156,15 +506,117 @@ class fast_cd_sim():
 
 
         if f_ext is None:
-            f_ext = np.zeros((state.z_curr.shape[0], 1))
+            f_ext = self._f_ext0
         if bc is None:
-            bc = np.array([[]], dtype=np.float64).T
+            bc = self._bc0
         else:
-            assert(bc.shape[0] == self.Aeq.shape[0])
+            assert(bc.shape[0] == self.Aeq.shape[0] and "Constraint rhs and matrix must have same number of rows")
         if z is None:
-            z = state.z_curr
-        assert(bc.shape[0] == self.Aeq.shape[0] and "Constraint rhs and matrix must have same number of rows")
+            z = self._warm_start(state, p)
+        if self.recorder is not None:
+            self.recorder.record(p, state, f_ext, bc)
 
-        z = self.sim.step(z, p, state, f_ext, bc)[:, None]
+        out = np.zeros((self._f_ext0.shape[0], 1))
+        if self.telemetry is not None:
+            return self.telemetry.step_into(p, state, out, z, f_ext, bc)
+        return self._solve_into(out, z, p, state, f_ext, bc)
 
-        return z
+    def step_into(self, p, state, out, z=None, f_ext=None, bc=None):
+        """
+        Steps simulation state forward, writing the result into a preallocated array. Same as step, minus the
+        per-step numpy temporaries, meant for hot loops. The native solver still returns each step by value.
+
+        Parameters
+        ----------
+        p : (12b, 1) float numpy array
+            Next state of the rig parameters
+        state : fast_cd_state
+            Current state of the simulation
+        out : (m, 1) or (m,) contiguous float64 numpy array
+            Receives the next state of the reduced secondary motion sim
+        z : (m, 1) float numpy array
+            First guess for the local global solver (default=state.z_curr)
+        f_ext : (m, 1) float numpy array
+            External force (default=0)
+        bc : (c, 1) float numpy array
+            Boundary constraints (default=None). Only valid if fast_cd_sim.Aeq is non-empty
+
+        Returns
+        -------
+        out : (m, 1) or (m,) float numpy array
+            The array passed in as out
+
+        Examples
+        --------
+        ```
+        >>> z = np.zeros((B.shape[1], 1))
+        >>> for i in range(frames):
+        >>>     sim.step_into(P[:, i], st, out=z)
+        >>>     st.update(z, P[:, i])
+        ```
+        """
+        if z is None:
+            z = state.z_curr if self._carry is None and self.warm_start == "current" else self._warm_start(state, p)
+        if self.recorder is not None:
+            self.recorder.record(p, state, f_ext, bc)
+        if self.telemetry is not None:
+            return self.telemetry.step_into(p, state, out, z, self._f_ext0 if f_ext is None else f_ext,
+                                            self._bc0 if bc is None else bc)
+        return self._solve_into(out, z, p, state, self._f_ext0 if f_ext is None else f_ext,
+                                self._bc0 if bc is None else bc)
+
+    def step_sequence(self, P, state=None, out=None, f_ext=None, bc=None):
+        """
+        Steps the simulation through a whole clip of rig parameters in a single native call, with the GIL released.
+        Meant for offline bakes, where nothing has to happen in python between frames.
+
+        Every frame is solved natively from z_curr for up to max_iters iterations, so the python side features
+        of step and step_into don't apply: a time_budget or carry_unconverged sim is refused, and the warm_start
+        predictor, report_savings and telemetry are skipped for the frames of the clip. Recording still works.
+
+        Parameters
+        ----------
+        P : (12b, frames) float numpy array
+            Rig parameters of every frame, one column per frame
+        state : fast_cd_state
+            State the clip starts from, advanced in place to the last frame. If None, starts at rest
+            on the first frame of P (default=None)
+        out : (m, frames) float64 numpy array
+            Fortran ordered array receiving the trajectory, e.g. a np.lib.format.open_memmap(...,
+            fortran_order=True) for clips that don't fit in memory. If None, a new one is allocated (default=None)
+        f_ext : (m, 1) float numpy array
+            External force, constant over the clip (default=0)
+        bc : (c, 1) float numpy array
+            Boundary constraints, constant over the clip (default=None). Only valid if fast_cd_sim.Aeq is non-empty
+
+        Returns
+        -------
+        Z : (m, frames) float numpy array
+            Reduced secondary motion of every frame, the array passed in as out if given
+
+        Examples
+        --------
+        ```
+        >>> st = fast_cd_state(np.zeros((B.shape[1], 1)), Prel[:, [0]])
+        >>> Z = sim.step_sequence(Prel, st)
+        ```
+        """
+        assert (self.time_budget is None and not self.carry_unconverged and
+                "step_sequence doesn't support time_budget or carry_unconverged, use step_into")
+        m = self._f_ext0.shape[0]
+        if state is None:
+            state = fast_cd_state(np.zeros((m, 1)), P[:, [0]])
+        if out is None:
+            out = np.zeros((m, P.shape[1]), order="F")
+        assert (out.shape == (m, P.shape[1]) and "out must be m x frames")
+        assert (out.flags.f_contiguous and out.dtype == np.float64 and "out must be a Fortran ordered float64 array")
+        if bc is not None:
+            assert (bc.shape[0] == self.Aeq.shape[0] and "Constraint rhs and matrix must have same number of rows")
+
+        if self.recorder is not None:
+            for i in range(P.shape[1]):
+                self.recorder.record(P[:, i], state, f_ext, bc)
+
+        self.sim.step_sequence(P, state, out, self._f_ext0 if f_ext is None else f_ext,
+                               self._bc0 if bc is None else bc)
+        return out
@@ -2,8 +2,11 @@ import igl
 import scipy as sp
 import numpy as np
 
+from .profiling import profiled
 
 
+
+@profiled
 def laplacian(X, T, mu=None):
     """
     Computes the Laplacian of a d-simplex. With d being 2, 3 or 4.
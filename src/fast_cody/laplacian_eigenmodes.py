@@ -5,14 +5,15 @@ from scipy.sparse import hstack, vstack
 
 
 import os
-import time
 import numpy as np
 
 from .laplacian import laplacian
 from .project_out_subspace import project_out_subspace
 from .orthonormalize import orthonormalize
 from .eigs import eigs
+from .profiling import profiled
 
+@profiled
 def laplacian_eigenmodes(V, T, m, read_cache=False, cache_dir=None, J=None,
                          mu=None, constraint_enforcement="optimal"):
     """ Computes Laplacian Eigenmodes for a given mesh.
@@ -51,16 +52,15 @@ def laplacian_eigenmodes(V, T, m, read_cache=False, cache_dir=None, J=None,
         L = laplacian(V, T, mu=mu)
         M = igl.massmatrix(V, T)
         L =  L + 1e-8 * M
+        matrix_class = "spd"
         if constraint_enforcement == "optimal":
             if J is not None:
+                matrix_class = "symmetric_indefinite"
                 c = J.shape[0]
                 Z = sp.sparse.csc_matrix((c, c))
                 L = vstack((hstack((L, J.T)), hstack((J, Z )))).tocsc()
                 M = sp.sparse.block_diag((M, Z)).tocsc()
-        print("Computing eigenmodes... may take a while...")
-        start = time.time()
-        [E, B] = eigs(L, M=M, k=m)
-        print("Done computing eigenmodes! Took, ", time.time() - start, " seconds")
+        [E, B] = eigs(L, M=M, k=m, matrix_class=matrix_class)
 
         n = V.shape[0]
         if J is not None:
@@ -73,7 +73,6 @@ def laplacian_eigenmodes(V, T, m, read_cache=False, cache_dir=None, J=None,
             B = project_out_subspace(B, J.T)
             E = np.diag(B.T @ L @ B)
             # WeightsViewer(V, T, B)
-            print("Done projecting out constraints from eigenmodes")
 
         if cache_dir is not None:
             os.makedirs(cache_dir, exist_ok=True)
@@ -1,6 +1,10 @@
 import numpy as np
 
-def lbs_jacobian(V, W):
+from .profiling import profiled
+
+
+@profiled
+def lbs_jacobian(V, W, dtype=np.float64):
     """ Linear Blend Skinning Jacobian
 
         Parameters
@@ -9,6 +13,8 @@ def lbs_jacobian(V, W):
             Mesh vertices
         W : (n, k) numpy float array
             Mesh skinning weights
+        dtype : numpy dtype
+            Floating point type of J, e.g. np.float32 to halve its footprint (default=np.float64)
 
         Returns
         -------
@@ -19,18 +25,20 @@ def lbs_jacobian(V, W):
     n = V.shape[0]
     d = V.shape[1]
     k = W.shape[1]
+    V = V.astype(dtype, copy=False)
+    W = W.astype(dtype, copy=False)
 
-    one_d1 = np.ones((d+1, 1))
-    one_k = np.ones((k, 1))
+    one_d1 = np.ones((d+1, 1), dtype=dtype)
+    one_k = np.ones((k, 1), dtype=dtype)
 
     # append 1s to V to make V1 , homogeneous
-    V1 = np.hstack((V, np.ones((V.shape[0], 1))))
+    V1 = np.hstack((V, np.ones((V.shape[0], 1), dtype=dtype)))
 
 
     Wexp = np.kron( W, one_d1.T)
     V1exp = np.kron( one_k.T, V1)
     J = Wexp * V1exp
-    Jexp = np.kron(np.identity(d), J)
+    Jexp = np.kron(np.identity(d, dtype=dtype), J)
     return Jexp
 
 #
@@ -0,0 +1,79 @@
+import numpy as np
+
+from .profiling import profiled
+
+
+def _blend(W, A, F):
+    # per-vertex blended affine transforms (n, 3, 4, F) of the (3, k, 4, F) handle transforms A
+    k = W.shape[1]
+    A = A.reshape(3, k, 4, F).transpose(1, 0, 2, 3).reshape(k, 12 * F)
+    return (W @ A).reshape(W.shape[0], 3, 4, F)
+
+
+@profiled
+def lbs_reconstruct(V, Wp, Ws, p, z=None, chunk_size=65536, out=None):
+    """ Reconstructs the deformed vertex positions of the rig and secondary motion,
+        ```
+            U = J p + B z
+        ```
+        with J = lbs_jacobian(V, Wp) and B = lbs_jacobian(V, Ws), without forming either matrix. Both are linear
+        blend skinning jacobians, so every vertex is moved by a single blended affine transform,
+        ```
+            u(x) = sum_i Wp_i(x) P_i [x; 1] + sum_j Ws_j(x) Z_j [x; 1]
+        ```
+        which costs O(n (b + m)) time per frame and no 3n x 12(b + m) dense matrix.
+
+    Parameters
+    ----------
+    V : (n, 3) float numpy array
+        Rest vertex positions
+    Wp : (n, b) float numpy array
+        Primary rig skinning weights
+    Ws : (n, m) float numpy array
+        Secondary skinning weights of the subspace. If None, only the rig is applied
+    p : (12b,) or (12b, F) float numpy array
+        Rig parameters, of one frame or one column per frame, in the layout of lbs_jacobian
+    z : (12m,) or (12m, F) float numpy array
+        Reduced secondary motion, with as many frames as p (default=None)
+    chunk_size : int
+        Number of vertices reconstructed at a time, bounding the temporaries to chunk_size x 12F (default=65536)
+    out : (n, 3) or (F, n, 3) float numpy array
+        C contiguous array receiving the positions, e.g. a memory map. If None, a new one is allocated
+        (default=None)
+
+    Returns
+    -------
+    U : (n, 3) or (F, n, 3) float numpy array
+        Deformed vertex positions, of one frame if p is a vector or a single column, otherwise of every frame
+
+    Examples
+    --------
+    ```
+    >>> U = fcd.lbs_reconstruct(V, Wp, Ws, p, z)
+    >>> np.allclose(U, np.reshape(J @ p + B @ z, (n, 3), order="F"))
+    ```
+    """
+    n = V.shape[0]
+    single = p.ndim == 1 or p.shape[1] == 1
+    P = p.reshape(p.shape[0], -1)
+    F = P.shape[1]
+    assert (P.shape[0] == 12 * Wp.shape[1] and "p must have 12 parameters per rig handle")
+    if Ws is not None:
+        assert (z is not None and "reconstructing the secondary motion needs z")
+        Z = z.reshape(z.shape[0], -1)
+        assert (Z.shape == (12 * Ws.shape[1], F) and "z must have 12 parameters per mode, and as many frames as p")
+    dtype = np.result_type(V.dtype, Wp.dtype, P.dtype, *([] if Ws is None else [Ws.dtype, Z.dtype]))
+    if out is None:
+        out = np.zeros((n, 3) if single else (F, n, 3), dtype=dtype)
+    # reshaping a non contiguous out would silently write into a copy
+    assert (out.flags.c_contiguous and "out must be C contiguous")
+    U = out.reshape(F, n, 3)
+
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        A = _blend(Wp[start:end], P, F)
+        if Ws is not None:
+            A += _blend(Ws[start:end], Z, F)
+        # apply every vertex's transform to its homogeneous rest position
+        U[:, start:end, :] = np.einsum("vcjf,vj->fvc", A[:, :, :3, :], V[start:end]) + A[:, :, 3, :].transpose(2, 0, 1)
+    return out
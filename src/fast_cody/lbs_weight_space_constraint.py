@@ -1,6 +1,10 @@
 import scipy as sp
 import numpy as np
 from .orthonormalize import orthonormalize
+from .profiling import profiled
+
+
+@profiled
 def lbs_weight_space_constraint(V, C):
     """ Rewrites a linear equality constraint that acts on per-vertex displacements (CU(W) = 0)
         to instead act on the per-vertex skinning weights  (AW = 0).
@@ -0,0 +1,209 @@
+import numpy as np
+import scipy as sp
+import scipy.linalg
+import igl
+
+from .linear_elasticity_hessian import linear_elasticity_hessian
+
+
+class linear_cd_state():
+    """
+    Pure numpy simulation state, with the same z_curr, z_prev, p_curr, p_prev and update interface as
+    fast_cd_state, for machines without the fast_cd_pyb extension. Current and previous quantities are double
+    buffers swapped in place by update.
+    """
+    def __init__(self, z_curr, p_curr, z_prev=None, p_prev=None, dtype=np.float64):
+        """
+        Sets current and previous simulation states
+
+        Parameters
+        ----------
+        z_curr : (m, 1) float numpy array
+            Current state of the reduced secondary motion sim
+        p_curr : (12b, 1) float numpy array
+            Current state of the rig parameters
+        z_prev : (m, 1) float numpy array
+            Previous state of the reduced secondary motion sim. If None, set to z_curr
+        p_prev : (12b, 1) float numpy array
+            Previous state of the rig parameter. If None, set to p_curr
+        dtype : numpy dtype
+            np.float64 or np.float32, should match the simulation's (default=np.float64)
+        """
+        self.z_curr = np.array(z_curr, dtype=dtype).ravel()
+        self.p_curr = np.array(p_curr, dtype=dtype).ravel()
+        self.z_prev = self.z_curr.copy() if z_prev is None else np.array(z_prev, dtype=dtype).ravel()
+        self.p_prev = self.p_curr.copy() if p_prev is None else np.array(p_prev, dtype=dtype).ravel()
+
+    def update(self, z, p):
+        """
+        Updates the simulation state in place, without allocating
+
+        Parameters
+        ----------
+        z : (m, 1) float numpy array
+            Next state of the reduced secondary motion sim
+        p : (12b, 1) float numpy array
+            Next state of the rig parameters
+        """
+        [self.z_prev, self.z_curr] = [self.z_curr, self.z_prev]
+        [self.p_prev, self.p_curr] = [self.p_curr, self.p_prev]
+        self.z_curr[:] = np.ravel(z)
+        self.p_curr[:] = np.ravel(p)
+
+
+class linear_cd_sim():
+    """
+    Linear elastic Fast Complementary Dynamics, in pure numpy/scipy.
+
+    Replaces the ARAP energy of fast_cd_sim with linear elasticity (linear_elasticity_hessian), which makes the
+    implicit Euler step a single linear solve with a constant m x m matrix:
+    ```
+        (rho/h^2 B'MB + B'KB) z = rho/h^2 (B'MB (2 z_curr - z_prev) + B'MJ (2 p_curr - p_prev - p)) - B'KJ p + B'KX + f_ext
+    ```
+    The matrix is Cholesky factored once, and a step is a couple of small dense products and a back-substitution,
+    with no local-global iterations. Linear elasticity is not rotation invariant, so large rig rotations produce
+    spurious secondary motion; use fast_cd_sim when accuracy matters, this for headless analysis, batch jobs and
+    machines without a built fast_cd_pyb.
+    """
+    def __init__(self, V, T, B, J, mu=1e4, lam=0.0, rho=1e3, h=1e-2, dtype=np.float64):
+        """
+        Precomputes and factors the reduced system
+
+        Parameters
+        ----------
+        V : (n, 3) float numpy array
+            Vertex positions
+        T : (F, 4) int numpy array
+            Tet indices
+        B : (3n, m) float numpy array
+            Subspace matrix
+        J : (3n, 12b) float numpy array
+            LBS rig jacobian
+        mu : float
+            First lame parameter (default=1e4)
+        lam : float
+            Second lame parameter (default=0)
+        rho : float
+            Density (default=1e3)
+        h : float
+            Timestep (default=1e-2)
+        dtype : numpy dtype
+            np.float64 or np.float32. The reduced matrices are assembled in float64 either way, then stored, factored
+            and stepped in dtype. float32 halves the memory traffic of a step, at the cost of a relative error of
+            about float32 epsilon (6e-8) times the condition number of the system, see benchmarks/float32_error.py
+            (default=np.float64)
+        """
+        assert (dtype in [np.float64, np.float32] and "dtype must be np.float64 or np.float32")
+        self.dtype = dtype
+        M = sp.sparse.kron(sp.sparse.identity(3), igl.massmatrix(V, T))
+        K = linear_elasticity_hessian(V, T, mu=mu, lam=lam)
+        x0 = V.flatten(order="F")
+
+        MB = M @ B
+        KB = K @ B
+        self.BMB = np.asarray(B.T @ MB, dtype=dtype)
+        self.BMJ = np.asarray(MB.T @ J, dtype=dtype)
+        self.BKB = np.asarray(B.T @ KB, dtype=dtype)
+        self.BKJ = np.asarray(KB.T @ J, dtype=dtype)
+        self.BKX = np.asarray(KB.T @ x0, dtype=dtype)
+
+        self.rho = rho
+        self.h = h
+        self.c = dtype(rho / (h * h))
+        self.A = self.c * self.BMB + self.BKB
+        self.factor = sp.linalg.cho_factor(self.A)
+
+        m = B.shape[1]
+        self._rhs = np.zeros(m, dtype=dtype)
+        self._dz = np.zeros(m, dtype=dtype)
+        self._dp = np.zeros(J.shape[1], dtype=dtype)
+
+    def step_into(self, p, state, out, f_ext=None):
+        """
+        Steps simulation state forward, writing the result into a preallocated array
+
+        Parameters
+        ----------
+        p : (12b, 1) float numpy array
+            Next state of the rig parameters
+        state : linear_cd_state or fast_cd_state
+            Current state of the simulation
+        out : (m, 1) or (m,) float numpy array
+            Receives the next state of the reduced secondary motion sim
+        f_ext : (m, 1) float numpy array
+            External force (default=0)
+
+        Returns
+        -------
+        out : (m, 1) or (m,) float numpy array
+            The array passed in as out
+        """
+        p = np.ravel(p).astype(self.dtype, copy=False)
+        z_curr = np.ravel(state.z_curr)
+        p_curr = np.ravel(state.p_curr)
+        np.subtract(2.0 * z_curr, np.ravel(state.z_prev), out=self._dz)
+        np.subtract(2.0 * p_curr, np.ravel(state.p_prev), out=self._dp)
+        self._dp -= p
+
+        rhs = self._rhs
+        np.dot(self.BMB, self._dz, out=rhs)
+        rhs += self.BMJ @ self._dp
+        rhs *= self.c
+        rhs -= self.BKJ @ p
+        rhs += self.BKX
+        if f_ext is not None:
+            rhs += np.ravel(f_ext)
+
+        out.reshape(-1)[:] = sp.linalg.cho_solve(self.factor, rhs)
+        return out
+
+    def step(self, p, state, f_ext=None):
+        """
+        Steps simulation state forward
+
+        Parameters
+        ----------
+        p : (12b, 1) float numpy array
+            Next state of the rig parameters
+        state : linear_cd_state or fast_cd_state
+            Current state of the simulation
+        f_ext : (m, 1) float numpy array
+            External force (default=0)
+
+        Returns
+        -------
+        z_next : (m, 1) float numpy array
+            Next state of the reduced secondary motion sim
+        """
+        return self.step_into(p, state, np.zeros((self.A.shape[0], 1), dtype=self.dtype), f_ext=f_ext)
+
+    def step_sequence(self, P, state=None, out=None, f_ext=None):
+        """
+        Steps the simulation through a whole clip of rig parameters
+
+        Parameters
+        ----------
+        P : (12b, frames) float numpy array
+            Rig parameters of every frame, one column per frame
+        state : linear_cd_state
+            State the clip starts from, advanced in place to the last frame. If None, starts at rest
+            on the first frame of P (default=None)
+        out : (m, frames) float numpy array
+            Array receiving the trajectory, e.g. a memory map. If None, a new one is allocated (default=None)
+        f_ext : (m, 1) float numpy array
+            External force, constant over the clip (default=0)
+
+        Returns
+        -------
+        Z : (m, frames) float numpy array
+            Reduced secondary motion of every frame
+        """
+        m = self.A.shape[0]
+        if state is None:
+            state = linear_cd_state(np.zeros(m), P[:, 0], dtype=self.dtype)
+        if out is None:
+            out = np.zeros((m, P.shape[1]), order="F", dtype=self.dtype)
+        for i in range(P.shape[1]):
+            self.step_into(P[:, i], state, out[:, i], f_ext=f_ext)
+            state.update(out[:, i], P[:, i])
+        return out
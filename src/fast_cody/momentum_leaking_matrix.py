@@ -3,8 +3,10 @@ import numpy as np
 import scipy as sp
 
 from .diffuse_weights import diffuse_weights
+from .profiling import profiled
 
 
+@profiled
 def momentum_leaking_matrix(V, T, dt=None, pow=1):
     """
     Constructs the momentum leaking matrix, that fudges the CD constraint to allow momentum to leak from
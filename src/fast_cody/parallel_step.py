@@ -0,0 +1,65 @@
+import concurrent.futures
+
+import numpy as np
+
+
+def _step_and_update(sim, p, state, out):
+    sim.step_into(p, state, out=out)
+    state.update(out, p)
+    return out
+
+
+def parallel_step(sims, P, states, Z=None, executor=None, max_workers=None):
+    """
+    Steps independent simulations forward by one timestep on a thread pool. The native solve of each
+    step runs with the GIL released, so this scales with the number of cores.
+
+    Thread safety: each entry of sims must be a distinct fast_cd_sim object (a sim keeps solver scratch
+    space, so the same object must never be stepped from two threads at once), and each entry of states
+    must be a distinct fast_cd_state that nothing else touches until this returns.
+
+    Parameters
+    ----------
+    sims : list of fast_cd_sim
+        N distinct simulations
+    P : list of (12b, 1) float numpy arrays
+        Next rig parameters of each simulation
+    states : list of fast_cd_state
+        Current state of each simulation, updated in place to the new timestep
+    Z : list of (m, 1) float numpy arrays
+        Preallocated outputs receiving the next reduced secondary motion of each simulation.
+        If None, new ones are allocated (default=None)
+    executor : concurrent.futures.ThreadPoolExecutor
+        Pool to run on. Pass one in to reuse it across timesteps. If None, a pool is created
+        and shut down on return (default=None)
+    max_workers : int
+        Number of threads of the pool created when executor is None (default=None, number of cores)
+
+    Returns
+    -------
+    Z : list of (m, 1) float numpy arrays
+        Next reduced secondary motion of each simulation
+
+    Examples
+    --------
+    ```
+    >>> pool = concurrent.futures.ThreadPoolExecutor()
+    >>> for i in range(frames):
+    >>>     Z = parallel_step(sims, [P[:, [i]] for P in Ps], states, Z=Z, executor=pool)
+    ```
+    """
+    assert (len(sims) == len(P) == len(states) and "need one rig parameter vector and one state per sim")
+    assert (len(set(map(id, sims))) == len(sims) and "a sim can't be stepped from two threads at once")
+    if Z is None:
+        Z = [np.zeros((s.z_curr.shape[0], 1)) for s in states]
+
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [executor.submit(_step_and_update, sims[i], P[i], states[i], Z[i]) for i in range(len(sims))]
+        Z = [f.result() for f in futures]
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return Z
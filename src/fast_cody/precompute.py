@@ -0,0 +1,412 @@
+import os
+import pickle
+import hashlib
+import concurrent.futures
+
+import numpy as np
+import scipy as sp
+import igl
+
+import fast_cd_pyb as fcdp
+
+from .read_msh import read_msh
+from .read_rig_from_json import read_rig_from_json
+from .diffuse_weights import diffuse_weights
+from .lbs_jacobian import lbs_jacobian
+from .momentum_leaking_matrix import momentum_leaking_matrix
+from .complementary_constraint_matrix import complementary_constraint_matrix
+from .lbs_weight_space_constraint import lbs_weight_space_constraint
+from .skinning_subspace import skinning_subspace
+from .fast_cd_sim import fast_cd_sim
+from .profiling import profiled
+
+# bump whenever a stage changes what it computes, so old memoized results are not reused
+PRECOMPUTE_VERSION = 1
+
+
+def _hash_value(h, x):
+    if isinstance(x, np.ndarray):
+        h.update(str((x.shape, x.dtype.str)).encode())
+        h.update(np.ascontiguousarray(x).tobytes())
+    elif sp.sparse.issparse(x):
+        x = sp.sparse.csc_matrix(x)
+        h.update(str(x.shape).encode())
+        for a in (x.data, x.indices, x.indptr):
+            _hash_value(h, a)
+    elif isinstance(x, (tuple, list)):
+        h.update(str(len(x)).encode())
+        for y in x:
+            _hash_value(h, y)
+    else:
+        h.update(repr(x).encode())
+
+
+def hash_file(path):
+    """
+    Content hash of a file, so memoized results follow the file and not its path.
+
+    Parameters
+    ----------
+    path : str
+        Path to the file
+
+    Returns
+    -------
+    key : str
+        sha1 hex digest of the file contents
+    """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class precompute_stage():
+    """
+    One node of a precompute_graph.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage, also the name of its output
+    func : function
+        Module level function computing the stage. Called with the outputs of deps as keyword arguments,
+        so it can be shipped to a process pool.
+    deps : list of str
+        Names of the stages or graph inputs this stage depends on
+    memoize : bool
+        Whether to memoize the output of this stage to disk (default=True)
+    """
+    def __init__(self, name, func, deps=(), memoize=True):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.memoize = memoize
+
+
+class precompute_graph():
+    """
+    Declarative graph of precompute stages. Stages whose inputs are ready run concurrently on a thread or
+    process pool, and each stage output is memoized to disk under a key derived from the stage name and the
+    keys of everything it depends on, so a warm run only loads what it needs.
+
+    Parameters
+    ----------
+    stages : list of precompute_stage
+        Stages making up the graph
+
+    Examples
+    --------
+    ```
+    >>> import fast_cody as fcd
+    >>> g = fcd.precompute_graph([fcd.precompute_stage("twice", lambda x: 2 * x, ["x"])])
+    >>> g.run({"x": 3}, ["twice"], executor=None)["twice"]
+    6
+    ```
+    """
+    def __init__(self, stages):
+        self.stages = {s.name: s for s in stages}
+
+    def keys(self, inputs, input_keys=None):
+        """
+        Computes the memoization key of every input and stage.
+
+        Parameters
+        ----------
+        inputs : dict
+            Maps input names to values
+        input_keys : dict
+            Maps input names to precomputed keys, e.g. file contents hashes for inputs that are paths (default=None)
+
+        Returns
+        -------
+        keys : dict
+            Maps input and stage names to sha1 hex digests
+        """
+        keys = dict(input_keys) if input_keys is not None else {}
+        for name, value in inputs.items():
+            if name in keys:
+                continue
+            h = hashlib.sha1()
+            _hash_value(h, value)
+            keys[name] = h.hexdigest()
+
+        def key(name):
+            if name not in keys:
+                stage = self.stages[name]
+                h = hashlib.sha1((name + str(PRECOMPUTE_VERSION)).encode())
+                for d in stage.deps:
+                    h.update(key(d).encode())
+                keys[name] = h.hexdigest()
+            return keys[name]
+        for name in self.stages:
+            key(name)
+        return keys
+
+    def run(self, inputs, targets, cache_dir=None, read_cache=True, executor="thread", max_workers=None,
+            input_keys=None):
+        """
+        Runs the stages required to produce targets.
+
+        Parameters
+        ----------
+        inputs : dict
+            Maps input names to values. Inputs may also override stages.
+        targets : list of str
+            Stage names whose outputs we want
+        cache_dir : str
+            Directory where stage outputs are memoized. If None, nothing is memoized (default=None)
+        read_cache : bool
+            Whether to load memoized stage outputs from cache_dir (default=True)
+        executor : str
+            "thread", "process" or None to run serially (default="thread")
+        max_workers : int
+            Number of workers of the pool (default=None, lets concurrent.futures decide)
+        input_keys : dict
+            Maps input names to precomputed keys, see keys (default=None)
+
+        Returns
+        -------
+        outputs : dict
+            Maps each target (and every stage that was computed or loaded on the way) to its output
+        """
+        keys = self.keys(inputs, input_keys)
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        def path(name):
+            return os.path.join(cache_dir, name + "-" + keys[name] + ".pkl")
+
+        def cached(name):
+            return (cache_dir is not None and read_cache and self.stages[name].memoize
+                    and os.path.exists(path(name)))
+
+        # walk back from the targets, stopping at inputs and memoized stages
+        required = set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name in required or name in inputs:
+                continue
+            required.add(name)
+            if not cached(name):
+                stack.extend(self.stages[name].deps)
+
+        outputs = {}
+        for name in required:
+            if cached(name):
+                with open(path(name), "rb") as f:
+                    outputs[name] = pickle.load(f)
+
+        pending = {name for name in required if name not in outputs}
+        values = dict(inputs)
+        values.update(outputs)
+
+        def finish(name, value):
+            values[name] = value
+            outputs[name] = value
+            pending.discard(name)
+            if cache_dir is not None and self.stages[name].memoize:
+                with open(path(name), "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        def ready():
+            return [n for n in pending if n not in running and all(d in values for d in self.stages[n].deps)]
+
+        running = {}
+        if executor is None:
+            while pending:
+                names = ready()
+                assert (len(names) > 0 and "precompute graph has unresolvable dependencies")
+                for name in names:
+                    stage = self.stages[name]
+                    finish(name, stage.func(**{d: values[d] for d in stage.deps}))
+            return outputs
+
+        Pool = concurrent.futures.ProcessPoolExecutor if executor == "process" \
+            else concurrent.futures.ThreadPoolExecutor
+        with Pool(max_workers=max_workers) as pool:
+            while pending:
+                for name in ready():
+                    stage = self.stages[name]
+                    running[name] = pool.submit(stage.func, **{d: values[d] for d in stage.deps})
+                assert (len(running) > 0 and "precompute graph has unresolvable dependencies")
+                done, _ = concurrent.futures.wait(running.values(),
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for name in [n for n, f in running.items() if f in done]:
+                    finish(name, running.pop(name).result())
+        return outputs
+
+
+# Stage functions. These live at module level so they can be pickled into a process pool.
+def _mesh(msh_file):
+    [V, F, T] = read_msh(msh_file)
+    return V, T
+
+
+def _geometry(mesh):
+    [V, T] = mesh
+    [V, so, to] = fcdp.scale_and_center_geometry(V, 1, np.array([[0, 0, 0.]]))  # center to unit height and about origin
+    return V, so, to
+
+
+def _rig(rig_file):
+    return read_rig_from_json(rig_file)
+
+
+def _primary_weights(mesh, rig, Wp):
+    if Wp is not None:
+        return Wp
+    [V, T] = mesh
+    if rig is None:
+        return np.ones((V.shape[0], 1))  # single affine handle
+    [Vpsurf, Fpsurf, Wpsurface, P0, lengths, pI] = rig
+    aI = np.arange(V.shape[0])
+    [D2, bI, CP] = igl.point_mesh_squared_distance(Vpsurf, V, aI)
+    return diffuse_weights(V, T, Wpsurface, bI, dt=10000)
+
+
+def _jacobian(geometry, primary_weights):
+    return lbs_jacobian(geometry[0], primary_weights)
+
+
+def _mass(geometry, mesh):
+    return igl.massmatrix(geometry[0], mesh[1])
+
+
+def _momentum_leak(geometry, mesh, leak_dt):
+    return momentum_leaking_matrix(geometry[0], mesh[1], dt=leak_dt)
+
+
+def _weight_space_constraint(geometry, mesh, jacobian, mass, momentum_leak, leak_dt):
+    C = complementary_constraint_matrix(geometry[0], mesh[1], jacobian, dt=leak_dt, M=mass, D=momentum_leak)
+    return lbs_weight_space_constraint(geometry[0], C)
+
+
+def _subspace(geometry, mesh, weight_space_constraint, num_modes, num_clusters, constraint_enforcement, Ws, l):
+    if Ws is not None and l is not None:
+        return lbs_jacobian(geometry[0], Ws), l, Ws
+    return skinning_subspace(geometry[0], mesh[1], num_modes, num_clusters, C=weight_space_constraint,
+                             constraint_enforcement=constraint_enforcement)
+
+
+def _subspace_deps(Ws, l):
+    # user provided secondary weights don't need the constraint at all
+    if Ws is not None and l is not None:
+        return ["geometry", "mesh", "num_modes", "num_clusters", "constraint_enforcement", "Ws", "l"]
+    return ["geometry", "mesh", "weight_space_constraint", "num_modes", "num_clusters",
+            "constraint_enforcement", "Ws", "l"]
+
+
+@profiled
+def build(msh_file=None, V=None, T=None, rig_file=None, Wp=None, Ws=None, l=None,
+          num_modes=16, num_clusters=100, constraint_enforcement="optimal", leak_dt=1e-3,
+          mu=1e4, rho=1e3, h=1e-2, cache_dir=None, read_cache=False, write_cache=False,
+          executor="thread", max_workers=None, build_sim=True):
+    """
+    Runs the whole Fast CD precompute (mesh, rig weights, rig jacobian, complementarity constraint,
+    skinning subspace and simulator) as a memoized precompute_graph. The mass matrix, momentum leaking
+    diffusion and rig weight diffusion are independent and run concurrently.
+
+    Parameters
+    ----------
+    msh_file : str
+        Path to Tet mesh .msh file. If None, expects V and T to be provided.
+    V : (n, 3) float numpy array
+        Vertex positions. Ignored if msh_file is provided.
+    T : (t, 4) int numpy array
+        Tet indices. Ignored if msh_file is provided.
+    rig_file : str
+        Path to rig.json file whose weights are diffused into the volume. If None and Wp is None, uses a single affine handle.
+    Wp : (n, b) float numpy array
+        Primary rig weights on the unscaled mesh. Overrides rig_file.
+    Ws : (n, m) float numpy array
+        Secondary skinning weights. If None (or l is None), computed with skinning_subspace.
+    l : (t,) int numpy array
+        Per-tet cluster indices. If None (or Ws is None), computed with skinning_subspace.
+    num_modes : int
+        Number of skinning modes (default=16)
+    num_clusters : int
+        Number of skinning clusters (default=100)
+    constraint_enforcement : str
+        "project" or "optimal" (default="optimal")
+    leak_dt : float
+        Diffusion timestep of the momentum leaking matrix (default=1e-3)
+    mu : float
+        First lame parameter (default=1e4)
+    rho : float
+        Density (default=1e3)
+    h : float
+        Timestep (default=1e-2)
+    cache_dir : str
+        Directory where stage outputs are memoized and where the simulator reads its cache from. If None, nothing is memoized.
+    read_cache : bool
+        Whether to reuse memoized stages and simulator precompute from cache_dir (default=False)
+    write_cache : bool
+        Whether the simulator also writes its precompute to cache_dir (default=False)
+    executor : str
+        "thread", "process" or None to run serially (default="thread")
+    max_workers : int
+        Number of workers of the pool (default=None)
+    build_sim : bool
+        Whether to also construct the fast_cd_sim (default=True)
+
+    Returns
+    -------
+    pre : dict
+        With keys "V" (scaled and centered), "T", "so", "to", "Wp", "J", "B", "l", "Ws", "rig"
+        (output of read_rig_from_json or None) and "sim" (fast_cd_sim or None)
+
+    Examples
+    --------
+    ```
+    >>> import fast_cody as fcd
+    >>> pre = fcd.build(fcd.get_data("cd_fish.msh"), cache_dir="./cache/cd_fish", read_cache=True)
+    >>> z = pre["sim"].step(p, st)
+    ```
+    """
+    inputs = dict(Wp=Wp, Ws=Ws, l=l, num_modes=num_modes, num_clusters=num_clusters,
+                  constraint_enforcement=constraint_enforcement, leak_dt=leak_dt)
+    # file inputs are keyed by their contents, not their paths
+    input_keys = {}
+    if msh_file is not None:
+        inputs["msh_file"] = msh_file
+        input_keys["msh_file"] = hash_file(msh_file)
+    else:
+        assert (V is not None and T is not None and "Must provide either msh_file or V and T")
+        inputs["mesh"] = (V, T)
+    if rig_file is not None and Wp is None:
+        inputs["rig_file"] = rig_file
+        input_keys["rig_file"] = hash_file(rig_file)
+    else:
+        inputs["rig"] = None
+
+    graph = precompute_graph([
+        precompute_stage("mesh", _mesh, ["msh_file"], memoize=False),
+        precompute_stage("rig", _rig, ["rig_file"], memoize=False),
+        precompute_stage("geometry", _geometry, ["mesh"], memoize=False),
+        precompute_stage("primary_weights", _primary_weights, ["mesh", "rig", "Wp"]),
+        precompute_stage("jacobian", _jacobian, ["geometry", "primary_weights"], memoize=False),
+        precompute_stage("mass", _mass, ["geometry", "mesh"], memoize=False),
+        precompute_stage("momentum_leak", _momentum_leak, ["geometry", "mesh", "leak_dt"]),
+        precompute_stage("weight_space_constraint", _weight_space_constraint,
+                         ["geometry", "mesh", "jacobian", "mass", "momentum_leak", "leak_dt"]),
+        precompute_stage("subspace", _subspace, _subspace_deps(Ws, l)),
+    ])
+    out = graph.run(inputs, ["mesh", "rig", "geometry", "primary_weights", "jacobian", "subspace"],
+                    cache_dir=cache_dir, read_cache=read_cache, executor=executor, max_workers=max_workers,
+                    input_keys=input_keys)
+    mesh = inputs["mesh"] if "mesh" in inputs else out["mesh"]
+    rig = inputs["rig"] if "rig" in inputs else out["rig"]
+    [V, so, to] = out["geometry"]
+    [B, l, Ws] = out["subspace"]
+
+    sim = None
+    if build_sim:
+        sim = fast_cd_sim(V, mesh[1], B, l, out["jacobian"], mu=mu, rho=rho, h=h,
+                          cache_dir="" if cache_dir is None else cache_dir, read_cache=read_cache,
+                          write_cache=write_cache and cache_dir is not None)
+
+    return dict(V=V, T=mesh[1], so=so, to=to, Wp=out["primary_weights"], J=out["jacobian"],
+                B=B, l=l, Ws=Ws, rig=rig, sim=sim)
@@ -0,0 +1,378 @@
+import os
+import sys
+import json
+import time
+import threading
+import functools
+import tracemalloc
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+'''
+Process-wide collector of nested timing spans, for the precompute pipeline and anything else worth timing.
+
+Spans are only recorded between enable_profiling and disable_profiling (or with FAST_CODY_PROFILE=1 set in
+the environment at import). While disabled, a profiled function costs one global flag check on top of the
+call, and profile_span hands back a shared no-op context manager, so the hooks can stay in production code.
+Spans of functions running in a process pool (precompute_graph with executor="process") stay in the worker.
+
+With enable_profiling(memory=True), spans also account for memory: the tracemalloc peak and retained bytes of
+the python side (numpy and scipy arrays), the peak and retained resident set size sampled by a background
+thread, which also sees native allocations (eigs, fast_cd_pyb), and the allocation sites of the largest
+blocks still alive when the span ends. Both tracemalloc and RSS are process wide, so spans running
+concurrently on other threads are counted in each other's memory.
+'''
+
+_enabled = os.environ.get("FAST_CODY_PROFILE", "0") not in ["", "0"]
+_spans = []
+_lock = threading.Lock()
+_local = threading.local()
+_t0 = time.perf_counter()
+
+_memory = False
+_top_allocations = 0
+_started_tracemalloc = False
+_active = set()
+_rss_samples = []
+_sampler = None
+_sampler_stop = threading.Event()
+
+
+def _rss():
+    # current resident set size in bytes, or the peak one where the current one isn't available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else 1024 * rss
+    return 0
+
+
+def _sample_rss(interval):
+    while not _sampler_stop.wait(interval):
+        rss = _rss()
+        with _lock:
+            _rss_samples.append((time.perf_counter() - _t0, rss))
+            for span in _active:
+                span.rss_peak = max(span.rss_peak, rss)
+
+
+def _largest_allocations(top):
+    # allocation sites of the largest live python blocks, e.g. the dense arrays a stage left behind
+    stats = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                           tracemalloc.Filter(False, __file__)])
+    return [dict(where=str(st.traceback[0]), bytes=int(st.size), count=int(st.count))
+            for st in stats.statistics("lineno")[:top]]
+
+
+class _null_span():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _null_span()
+
+
+def _describe(x):
+    # array sizes and sparsity of an argument or output, without touching its data
+    if hasattr(x, "nnz") and hasattr(x, "shape"):
+        return dict(shape=list(x.shape), nnz=int(x.nnz))
+    if hasattr(x, "shape") and hasattr(x, "dtype"):
+        return dict(shape=list(x.shape), dtype=str(x.dtype))
+    if isinstance(x, (tuple, list)) and len(x) <= 8:
+        d = [_describe(y) for y in x]
+        if any(y is not None for y in d):
+            return d
+    return None
+
+
+class _span():
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """
+        Adds attributes to the span, e.g. sizes only known once it ran
+        """
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        self.memory = _memory
+        if self.memory:
+            # tracemalloc has a single peak, so fold it into the enclosing span before resetting it for this one
+            [current, peak] = tracemalloc.get_traced_memory()
+            if self.depth > 0 and stack[-2].memory:
+                stack[-2].mem_peak = max(stack[-2].mem_peak, peak)
+            tracemalloc.reset_peak()
+            self.mem_start = current
+            self.mem_peak = current
+            self.rss_start = _rss()
+            self.rss_peak = self.rss_start
+            with _lock:
+                _active.add(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter()
+        _local.stack.pop()
+        record = dict(name=self.name, start=self.start - _t0, duration=end - self.start, depth=self.depth,
+                      parent=self.parent, pid=os.getpid(), tid=threading.get_ident(), attrs=self.attrs)
+        if self.memory:
+            [current, peak] = tracemalloc.get_traced_memory()
+            self.mem_peak = max(self.mem_peak, peak)
+            if self.depth > 0 and _local.stack[-1].memory:
+                parent = _local.stack[-1]
+                parent.mem_peak = max(parent.mem_peak, self.mem_peak)
+            rss = _rss()
+            with _lock:
+                _active.discard(self)
+            record["memory"] = dict(peak_bytes=int(self.mem_peak - self.mem_start),
+                                    retained_bytes=int(current - self.mem_start),
+                                    rss_peak_bytes=int(max(self.rss_peak, rss) - self.rss_start),
+                                    rss_retained_bytes=int(rss - self.rss_start))
+            if _top_allocations > 0:
+                record["memory"]["largest"] = _largest_allocations(_top_allocations)
+        with _lock:
+            _spans.append(record)
+        return False
+
+
+def profile_span(name, **attrs):
+    """
+    Context manager timing a block as a span, nested under the enclosing span of the same thread
+
+    Parameters
+    ----------
+    name : str
+        Name of the span
+    **attrs
+        Attributes recorded with the span, e.g. sizes of the data being processed
+
+    Examples
+    --------
+    ```
+    >>> with fcd.profile_span("assemble", n=V.shape[0]) as span:
+    >>>     K = ...
+    >>>     span.set(nnz=K.nnz)
+    ```
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _span(name, dict(attrs))
+
+
+def profiled(func):
+    """
+    Decorator recording every call of a function as a span, named after the function, with the shapes (and nnz
+    of sparse matrices) of its array arguments and outputs as attributes
+    """
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        attrs = {}
+        for [i, a] in enumerate(args):
+            d = _describe(a)
+            if d is not None:
+                attrs["arg" + str(i)] = d
+        for [k, a] in kwargs.items():
+            d = _describe(a)
+            if d is not None:
+                attrs[k] = d
+        with _span(name, attrs) as span:
+            out = func(*args, **kwargs)
+            d = _describe(out)
+            if d is not None:
+                span.attrs["out"] = d
+        return out
+    return wrapper
+
+
+def enable_profiling(reset=True, memory=False, rss_interval=5e-3, top_allocations=5):
+    """
+    Starts recording spans
+
+    Parameters
+    ----------
+    reset : bool
+        Whether to drop the spans recorded so far (default=True)
+    memory : bool
+        Whether spans also account for memory, see profiling_memory_table. Tracing python allocations slows
+        down allocation heavy code severalfold, so this is meant for investigations, not production (default=False)
+    rss_interval : float
+        Seconds between two samples of the resident set size, with memory (default=5e-3)
+    top_allocations : int
+        Number of largest live allocation sites reported at the end of every span, with memory. Taking them
+        is a tracemalloc snapshot per span, 0 to skip it (default=5)
+    """
+    global _enabled, _memory, _top_allocations, _started_tracemalloc, _sampler
+    disable_profiling()
+    if reset:
+        reset_profiling()
+    if memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracemalloc = True
+        _top_allocations = top_allocations
+        _sampler_stop.clear()
+        _sampler = threading.Thread(target=_sample_rss, args=(rss_interval,), daemon=True)
+        _sampler.start()
+    _memory = memory
+    _enabled = True
+
+
+def disable_profiling():
+    """
+    Stops recording spans. The spans recorded so far are kept
+    """
+    global _enabled, _memory, _started_tracemalloc, _sampler
+    _enabled = False
+    _memory = False
+    if _sampler is not None:
+        _sampler_stop.set()
+        _sampler.join()
+        _sampler = None
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+
+def profiling_enabled():
+    """
+    Returns
+    -------
+    enabled : bool
+        Whether spans are being recorded
+    """
+    return _enabled
+
+
+def reset_profiling():
+    """
+    Drops every recorded span
+    """
+    with _lock:
+        _spans.clear()
+        _rss_samples.clear()
+
+
+def profiling_spans():
+    """
+    Recorded spans, in the order they finished
+
+    Returns
+    -------
+    spans : list of dict
+        name, start and duration (seconds), depth, parent name, pid, tid and attrs of every span
+    """
+    with _lock:
+        return list(_spans)
+
+
+def export_chrome_trace(path):
+    """
+    Writes the recorded spans as Chrome trace event JSON, to open in chrome://tracing or https://ui.perfetto.dev
+
+    Parameters
+    ----------
+    path : str
+        File to write the trace to
+    """
+    events = [dict(name=s["name"], ph="X", ts=1e6 * s["start"], dur=1e6 * s["duration"], pid=s["pid"],
+                   tid=s["tid"], args=dict(s["attrs"], **s.get("memory", {}))) for s in profiling_spans()]
+    # resident set size samples as a counter track
+    with _lock:
+        samples = list(_rss_samples)
+    events += [dict(name="rss", ph="C", ts=1e6 * t, pid=os.getpid(), args=dict(MB=rss / 2 ** 20))
+               for [t, rss] in samples]
+    with open(path, "w") as f:
+        json.dump(dict(traceEvents=events, displayTimeUnit="ms"), f)
+
+
+def profiling_table(sort="total"):
+    """
+    Flat table of the recorded spans, aggregated by name
+
+    Parameters
+    ----------
+    sort : str
+        Column to sort by, "total", "self", "calls" or "name" (default="total")
+
+    Returns
+    -------
+    table : str
+        One row per span name with the number of calls, the total time, the self time (total minus the time of
+        the spans nested directly in it) and the mean time
+    """
+    spans = profiling_spans()
+    rows = {}
+    for s in spans:
+        r = rows.setdefault(s["name"], dict(calls=0, total=0.0, self=0.0))
+        r["calls"] += 1
+        r["total"] += s["duration"]
+        r["self"] += s["duration"]
+    # a child finishes before its parent, and is the latest unclaimed span one level deeper on its thread
+    open_children = {}
+    for s in spans:
+        key = (s["pid"], s["tid"])
+        children = open_children.setdefault(key, {})
+        for c in children.pop(s["depth"] + 1, []):
+            rows[s["name"]]["self"] -= c
+        children.setdefault(s["depth"], []).append(s["duration"])
+
+    order = sorted(rows.items(), key=lambda kv: kv[0] if sort == "name" else -kv[1][sort])
+    lines = ["%-48s %8s %12s %12s %12s" % ("name", "calls", "total ms", "self ms", "mean ms")]
+    for [name, r] in order:
+        lines.append("%-48s %8d %12.3f %12.3f %12.3f" % (name, r["calls"], 1e3 * r["total"], 1e3 * r["self"],
+                                                         1e3 * r["total"] / r["calls"]))
+    return "\n".join(lines)
+
+
+def profiling_memory_table(top=3):
+    """
+    Table of the memory accounted to every span recorded with enable_profiling(memory=True), in the order they
+    started, indented by nesting depth
+
+    Parameters
+    ----------
+    top : int
+        Number of largest live allocation sites listed under every span (default=3)
+
+    Returns
+    -------
+    table : str
+        One row per span with its python (tracemalloc) peak and retained memory and its peak and retained
+        resident set size, in MB, followed by the largest live allocations when the span ended
+    """
+    spans = sorted([s for s in profiling_spans() if "memory" in s], key=lambda s: s["start"])
+    mb = 1.0 / 2 ** 20
+    lines = ["%-48s %10s %10s %10s %10s" % ("name", "peak MB", "kept MB", "rss pk MB", "rss kept")]
+    for s in spans:
+        m = s["memory"]
+        lines.append("%-48s %10.1f %10.1f %10.1f %10.1f" % ("  " * s["depth"] + s["name"], mb * m["peak_bytes"],
+                                                        mb * m["retained_bytes"], mb * m["rss_peak_bytes"],
+                                                        mb * m["rss_retained_bytes"]))
+        for a in m.get("largest", [])[:top]:
+            lines.append("%-48s %10.1f   %s" % ("  " * (s["depth"] + 1) + "live", mb * a["bytes"], a["where"]))
+    return "\n".join(lines)
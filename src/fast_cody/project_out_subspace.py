@@ -4,7 +4,7 @@ import scipy as sp
 from scipy.sparse import vstack, hstack
 
 
-from fast_cody.umfpack_lu_solve import umfpack_lu_solve
+from .sparse_solver import sparse_solve
 '''
 Performs a least squares projection on subspace A so that it does not span space B
 
@@ -74,7 +74,7 @@ def project_out_subspace(A, B, M=None):
     Asp = sp.sparse.csc_matrix(A)
     rhs = vstack(( M @ Asp, z))
 
-    Cmu = umfpack_lu_solve(Q, rhs.todense())
+    Cmu = sparse_solve(Q.tocsc(), np.asarray(rhs.todense()), matrix_class="symmetric_indefinite")
     #sp.sparse.linalg.spsolve(Q, rhs)
     C = Cmu[:A.shape[0], :]
     # Cd = C.toarray()
@@ -1,6 +1,8 @@
 import fast_cd_pyb as fcdp
+from .profiling import profiled
 
 
+@profiled
 def read_msh(msh_file):
     """
     Reads .msh file generated by TetWild.
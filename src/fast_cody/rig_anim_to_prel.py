@@ -0,0 +1,45 @@
+import numpy as np
+
+from .read_rig_anim_from_json import read_rig_anim_from_json
+from .world2rel import world2rel
+
+
+def rig_anim_to_prel(anim_file, P0, so=1.0, to=None):
+    """
+    Converts a world space rig animation to the rig parameters a simulation steps through: relative to the rest
+    pose of the rig, in the scaled and centered frame of the simulation, one column per frame
+
+    Parameters
+    ----------
+    anim_file : str or (frames, b, 3, 4) float numpy array
+        Path to the rig animation .json file, or the world transformation of each bone at every frame
+    P0 : (b, 3, 4) float numpy array
+        World transformation of each bone in the rest pose, e.g. the P0 of read_rig_from_json
+    so : float
+        Scale the mesh was normalized by before simulation (default=1)
+    to : (1, 3) float numpy array
+        Translation the mesh was normalized by before simulation (default=0)
+
+    Returns
+    -------
+    Prel : (12b, frames) float numpy array
+        Rig parameters of every frame
+
+    Examples
+    --------
+    ```
+    >>> pre = fcd.build(msh_file=fcd.get_data("cd_fish.msh"), rig_file=fcd.get_data("cd_fish_rig.json"))
+    >>> Prel = fcd.rig_anim_to_prel(fcd.get_data("cd_fish_rig_anim__swim.json"), pre["rig"][3], pre["so"],
+    >>>                             pre["to"])
+    ```
+    """
+    P = read_rig_anim_from_json(anim_file) if isinstance(anim_file, str) else np.asarray(anim_file)
+    to = np.zeros((1, 3)) if to is None else to
+    P0 = P0 * so
+    P0[:, :, 3] = P0[:, :, 3] - to
+    P = P * so
+    P[:, :, :, 3] = P[:, :, :, 3] - to
+    Prel = world2rel(P, P0)
+    [frames, k, d] = Prel.shape[0:3]
+    Prel = np.transpose(Prel, [3, 1, 2, 0])
+    return Prel.reshape(((d + 1) * d * k, frames), order='F')
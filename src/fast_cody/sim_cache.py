@@ -0,0 +1,185 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+import scipy as sp
+
+'''
+Content-keyed cache directory of the fast_cd_arap_sim precompute. Each simulation gets its own directory
+cache_dir/fast_cd_sim-<key>, keyed by the contents of V, T, B, l and J and by mu, rho and h, which the
+simulation library bakes into its precompute, so two creatures, two subspaces of the same creature or two
+materials never read each other's precompute. The directory holds the simulation library's own precompute
+files, a manifest.json recording the version, key, shapes and material parameters, and optionally a copy of
+the inputs, from which fast_cd_sim.from_cache rebuilds the simulation without redoing the subspace
+precomputation.
+'''
+
+# bump whenever the layout of the cache or the precompute of the simulation library changes
+SIM_CACHE_VERSION = 2
+
+
+def sim_cache_key(V, T, B, l, J, mu, rho, h):
+    """
+    Content hash of the inputs and material parameters of a fast_cd_arap_sim precompute
+
+    Parameters
+    ----------
+    V : (n, 3) float numpy array
+        Vertex positions
+    T : (F, 4) int numpy array
+        Tet indices
+    B : (3n, m) float numpy array
+        Subspace matrix
+    l : (F, 1) int numpy array
+        Cluster labels
+    J : (3n, 12b) float numpy array or scipy sparse matrix
+        LBS rig jacobian
+    mu : float
+        First lame parameter
+    rho : float
+        Density
+    h : float
+        Timestep
+
+    Returns
+    -------
+    key : str
+        sha1 hex digest
+    """
+    from .precompute import _hash_value  # precompute imports fast_cd_sim, which imports this module
+    digest = hashlib.sha1(("fast_cd_sim-v" + str(SIM_CACHE_VERSION)).encode())
+    for x in (V, T, B, l, J, np.array([mu, rho, h], dtype=np.float64)):
+        _hash_value(digest, x if sp.sparse.issparse(x) else np.asarray(x))
+    return digest.hexdigest()
+
+
+def sim_cache_dir(cache_dir, key):
+    """
+    Directory of the cache entry with the given key
+
+    Parameters
+    ----------
+    cache_dir : str
+        Root cache directory
+    key : str
+        As returned by sim_cache_key
+
+    Returns
+    -------
+    sim_dir : str
+        cache_dir/fast_cd_sim-<key>/
+    """
+    return os.path.join(cache_dir, "fast_cd_sim-" + key, "")
+
+
+def read_sim_cache_manifest(sim_dir):
+    """
+    Reads the manifest of a cache entry
+
+    Parameters
+    ----------
+    sim_dir : str
+        Cache entry directory
+
+    Returns
+    -------
+    manifest : dict
+        Version, key, shapes and material parameters of the entry, or None if there is no valid entry
+    """
+    try:
+        with open(os.path.join(sim_dir, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def validate_sim_cache(sim_dir, key):
+    """
+    Checks that a cache entry exists and was written by this version, for these inputs and material parameters
+
+    Parameters
+    ----------
+    sim_dir : str
+        Cache entry directory
+    key : str
+        Key of the current inputs and material parameters, as returned by sim_cache_key
+
+    Returns
+    -------
+    valid : bool
+        Whether the entry can be read
+    reason : str
+        Why it can't, or None
+    """
+    manifest = read_sim_cache_manifest(sim_dir)
+    if manifest is None:
+        return False, "no cache entry"
+    if manifest.get("version") != SIM_CACHE_VERSION:
+        return False, "cache version " + str(manifest.get("version")) + " != " + str(SIM_CACHE_VERSION)
+    if manifest.get("key") != key:
+        return False, "cache written for different inputs or material parameters"
+    return True, None
+
+
+def _write_manifest(sim_dir, manifest):
+    # written atomically, so a reader in another process either sees the old manifest or the new one
+    tmp = os.path.join(sim_dir, "manifest.json.tmp" + str(os.getpid()))
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(sim_dir, "manifest.json"))
+
+
+def write_sim_cache_manifest(sim_dir, key, V, T, B, l, J, mu, rho, h, save_inputs=True):
+    """
+    Records a cache entry, once the simulation library has written its precompute into sim_dir. The manifest is
+    written last and atomically, so a reader in another process either sees a complete entry or none.
+
+    Parameters
+    ----------
+    sim_dir : str
+        Cache entry directory
+    key : str
+        As returned by sim_cache_key
+    V, T, B, l, J, mu, rho, h :
+        Inputs and material parameters of the precompute, see sim_cache_key
+    save_inputs : bool
+        Whether to also save V, T, B, l (.npy) and J (.npz) so load_sim_cache can rebuild the simulation
+        from the entry alone (default=True)
+    """
+    os.makedirs(sim_dir, exist_ok=True)
+    if save_inputs:
+        for name, x in (("V", V), ("T", T), ("B", B), ("l", l)):
+            np.save(os.path.join(sim_dir, name + ".npy"), np.ascontiguousarray(x))
+        sp.sparse.save_npz(os.path.join(sim_dir, "J.npz"), sp.sparse.csc_matrix(J))
+
+    manifest = dict(version=SIM_CACHE_VERSION, key=key, mu=float(mu), rho=float(rho), h=float(h),
+                    num_vertices=int(V.shape[0]), num_tets=int(T.shape[0]), num_modes=int(B.shape[1]),
+                    num_rig_parameters=int(J.shape[1]), inputs=bool(save_inputs))
+    _write_manifest(sim_dir, manifest)
+
+
+def load_sim_cache(sim_dir, mmap_mode=None):
+    """
+    Loads the inputs saved in a cache entry
+
+    Parameters
+    ----------
+    sim_dir : str
+        Cache entry directory
+    mmap_mode : str
+        Passed to np.load of the dense inputs, e.g. "r" to only page in what is read (default=None, in memory)
+
+    Returns
+    -------
+    inputs : dict
+        "V", "T", "B", "l", "J" and the "mu", "rho", "h" of the manifest
+    """
+    manifest = read_sim_cache_manifest(sim_dir)
+    assert (manifest is not None and manifest.get("version") == SIM_CACHE_VERSION and "no valid cache entry")
+    assert (manifest.get("inputs") and "cache entry was written without its inputs")
+    inputs = {name: np.load(os.path.join(sim_dir, name + ".npy"), mmap_mode=mmap_mode)
+              for name in ("V", "T", "B", "l")}
+    inputs["J"] = sp.sparse.load_npz(os.path.join(sim_dir, "J.npz"))
+    inputs.update(mu=manifest["mu"], rho=manifest["rho"], h=manifest["h"])
+    return inputs
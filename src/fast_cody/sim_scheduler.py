@@ -0,0 +1,149 @@
+import time
+import threading
+
+import numpy as np
+
+
+class sim_scheduler():
+    """
+    Runs a simulation on its own thread at a fixed timestep, decoupled from the render loop.
+
+    The render thread publishes the latest rig parameters with set_input and reads the latest simulated
+    (z, p) with latest. Both handoffs are a single attribute assignment of an immutable snapshot, which is
+    atomic in python, so neither side ever waits on a lock: the sim always steps with the newest input, and
+    the viewer always draws the newest finished step. Since the native solve releases the GIL, rendering
+    and simulation genuinely overlap, and a slow step delays the secondary motion, not the frame.
+
+    Examples
+    --------
+    ```
+    >>> scheduler = fast_cody.sim_scheduler(sim, st, p0, h=1e-2)
+    >>> scheduler.start()
+    >>> def pre_draw_callback():
+    >>>     scheduler.set_input(viewer.T0[0:3, :].reshape((12, 1)))
+    >>>     [z, p, step] = scheduler.latest()
+    >>>     viewer.update_subspace_coefficients(z, p)
+    >>> viewer.launch()
+    >>> scheduler.stop()
+    ```
+    """
+    def __init__(self, sim, state, p0, h=1e-2, realtime=True):
+        """
+        Parameters
+        ----------
+        sim : fast_cd_sim
+            Simulation to run. Owned by the scheduler thread while it runs, don't step it elsewhere
+        state : fast_cd_state
+            State to start from. Owned by the scheduler thread while it runs
+        p0 : (12b, 1) float numpy array
+            Initial rig parameters
+        h : float
+            Timestep, in seconds of wall time between steps when realtime (default=1e-2)
+        realtime : bool
+            Whether to pace the steps to wall time. If False, steps as fast as possible (default=True)
+        """
+        self.sim = sim
+        self.state = state
+        self.h = h
+        self.realtime = realtime
+        p0 = np.array(p0, dtype=np.float64).reshape(-1, 1)
+        self._input = p0
+        self._snapshot = (np.array(state.z_curr).reshape(-1, 1), p0, 0)
+        self._running = False
+        self._thread = None
+        self._error = None
+
+        # ticks the sim couldn't keep up with, and time spent in the solver
+        self.missed_ticks = 0
+        self.step_time = 0.0
+
+    def set_input(self, p):
+        """
+        Publishes the rig parameters the next step should use
+
+        Parameters
+        ----------
+        p : (12b, 1) float numpy array
+            Rig parameters, copied
+        """
+        self._input = np.array(p, dtype=np.float64).reshape(-1, 1)
+
+    def latest(self):
+        """
+        Latest simulated snapshot
+
+        Returns
+        -------
+        z : (m, 1) float numpy array
+            Reduced secondary motion of the latest finished step
+        p : (12b, 1) float numpy array
+            Rig parameters that step was taken with
+        step : int
+            Number of steps taken so far
+
+        Raises
+        ------
+        Exception
+            Whatever stopped the simulation thread, once
+        """
+        self._raise_error()
+        return self._snapshot
+
+    def start(self):
+        """
+        Starts the simulation thread
+        """
+        assert (self._thread is None and "scheduler already started")
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the simulation thread and waits for the step in flight to finish. Re-raises whatever stopped
+        the thread, if latest hasn't already
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+    def _raise_error(self):
+        error = self._error
+        if error is not None:
+            self._error = None
+            raise error
+
+    def _run(self):
+        # a failing step stops the thread, and the error surfaces on the render thread instead of being lost
+        try:
+            self._step_loop()
+        except Exception as e:
+            self._error = e
+            self._running = False
+
+    def _step_loop(self):
+        step = self._snapshot[2]
+        next_tick = time.perf_counter()
+        while self._running:
+            p = self._input
+            start = time.perf_counter()
+            # fresh output every step: a published snapshot is never written to again
+            z = self.sim.step(p, self.state)
+            self.state.update(z, p)
+            self.step_time = time.perf_counter() - start
+            step += 1
+            self._snapshot = (z, p, step)
+
+            if not self.realtime:
+                continue
+            next_tick += self.h
+            wait = next_tick - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            else:
+                # fell behind, drop the missed ticks instead of trying to catch up with a burst of steps
+                missed = int(-wait / self.h)
+                self.missed_ticks += missed
+                next_tick += missed * self.h
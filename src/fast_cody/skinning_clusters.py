@@ -2,8 +2,10 @@ import numpy as np
 from sklearn.cluster import KMeans
 
 from .average_onto_simplex import average_onto_simplex
+from .profiling import profiled
 
 
+@profiled
 def skinning_clusters(W, D, T, k, l=2, num_clustering_features=10,
                       return_centroids=False, return_simplex_features=False):
     """ Skinning clusters.
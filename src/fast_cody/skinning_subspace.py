@@ -7,8 +7,10 @@ from .laplacian_eigenmodes import laplacian_eigenmodes
 from .skinning_clusters import skinning_clusters
 from .lbs_jacobian import lbs_jacobian
 from .orthonormalize import orthonormalize
+from .profiling import profiled
 
 
+@profiled
 def skinning_subspace(X, T, num_modes, num_clusters,
                       cache_dir=None, read_cache=False,
                       ortho=True, mu=None, C=None, constraint_enforcement="optimal"):
@@ -0,0 +1,137 @@
+import time
+
+import numpy as np
+
+
+class solver_telemetry():
+    """
+    Per-step statistics of the local-global solver of a fast_cd_sim, kept in a preallocated ring buffer
+    of the last capacity steps. Recording a step costs two clock reads and three array writes.
+
+    For every step it records the number of local-global iterations (in the time budgeted mode of fast_cd_sim,
+    those that fit in the budget), the final residual and the wall time of the step. In detailed mode it also
+    records the residual after every iteration, by running the solver one iteration at a time, warm started
+    from the previous iterate. That costs a binding call and a right hand side assembly per iteration, so use
+    it to tune max_iters, not in production.
+
+    Phase timings are not provided: the split of a step between the local (per-cluster rotation) and global
+    phases happens inside the solver of the simulation library, which its bindings don't expose, so only the
+    total step time is recorded.
+
+    Examples
+    --------
+    ```
+    >>> tel = sim.enable_telemetry(capacity=1000)
+    >>> for i in range(frames):
+    >>>     sim.step_into(P[:, i], st, out=z)
+    >>>     st.update(z, P[:, i])
+    >>> print(tel.summary())
+    ```
+    """
+    def __init__(self, sim, capacity=1024, detailed=False):
+        """
+        Parameters
+        ----------
+        sim : fast_cd_sim
+            Simulation to record
+        capacity : int
+            Number of most recent steps kept (default=1024)
+        detailed : bool
+            Whether to also record the residual after every iteration (default=False)
+        """
+        self.sim = sim
+        self.capacity = capacity
+        self.detailed = detailed
+        self.max_iters = sim.solver_params.max_iters
+
+        self.iters = np.zeros(capacity, dtype=np.int32)
+        self.residual = np.zeros(capacity)
+        self.step_time = np.zeros(capacity)
+        self.residual_history = np.full((capacity, self.max_iters), np.nan) if detailed else None
+        self.count = 0
+
+    def _record(self, iters, residual, seconds):
+        i = self.count % self.capacity
+        self.iters[i] = iters
+        self.residual[i] = residual
+        self.step_time[i] = seconds
+        self.count += 1
+        return i
+
+    def step_into(self, p, state, out, z, f_ext, bc):
+        """
+        Steps the simulation like fast_cd_sim.step_into and records the step. Called by fast_cd_sim
+        when telemetry is enabled, all arguments are required.
+        """
+        if not self.detailed:
+            start = time.perf_counter()
+            self.sim._solve_into(out, z, p, state, f_ext, bc)
+            seconds = time.perf_counter() - start
+            [iters, res, converged] = self.sim.last_solve
+            self._record(iters, res, seconds)
+            return out
+
+        history = np.full(self.max_iters, np.nan)
+        iters = 0
+        res = np.inf
+        start = time.perf_counter()
+        while iters < self.sim.solver_params.max_iters:
+            res = self.sim._iterate_into(out, z, p, state, f_ext, bc)
+            if iters < history.shape[0]:
+                history[iters] = res
+            iters += 1
+            z = out
+            if res < self.sim.solver_params.threshold:
+                break
+        seconds = time.perf_counter() - start
+        i = self._record(iters, res, seconds)
+        self.residual_history[i] = history
+        return out
+
+    def stats(self):
+        """
+        Recorded steps, oldest first
+
+        Returns
+        -------
+        stats : dict
+            "step" (s,) int step indices, "iters" (s,) int iteration counts, "residual" (s,) final residuals,
+            "step_time" (s,) seconds, and in detailed mode "residual_history" (s, max_iters) residual after
+            every iteration (nan past the last one)
+        """
+        s = min(self.count, self.capacity)
+        order = (np.arange(self.count - s, self.count)) % self.capacity
+        stats = dict(step=np.arange(self.count - s, self.count), iters=self.iters[order].copy(),
+                     residual=self.residual[order].copy(), step_time=self.step_time[order].copy())
+        if self.detailed:
+            stats["residual_history"] = self.residual_history[order].copy()
+        return stats
+
+    def summary(self):
+        """
+        Aggregates of the recorded steps
+
+        Returns
+        -------
+        summary : dict
+            Number of steps, mean and max iterations, fraction of steps that hit max_iters,
+            mean and max final residual, and mean, 95th percentile and max step time in seconds
+        """
+        s = self.stats()
+        if s["iters"].shape[0] == 0:
+            return dict(steps=0)
+        return dict(steps=int(s["iters"].shape[0]),
+                    mean_iters=float(s["iters"].mean()), max_iters=int(s["iters"].max()),
+                    hit_max_iters=float((s["iters"] >= self.max_iters).mean()),
+                    mean_residual=float(s["residual"].mean()), max_residual=float(s["residual"].max()),
+                    mean_step_time=float(s["step_time"].mean()),
+                    p95_step_time=float(np.percentile(s["step_time"], 95)),
+                    max_step_time=float(s["step_time"].max()))
+
+    def reset(self):
+        """
+        Forgets every recorded step
+        """
+        self.count = 0
+        if self.detailed:
+            self.residual_history[:] = np.nan
@@ -0,0 +1,202 @@
+import time
+import warnings
+
+import numpy as np
+import scipy as sp
+import scipy.sparse.linalg
+import cvxopt
+import cvxopt.umfpack
+
+'''
+Registry of sparse direct solvers used by the precomputation. Each backend is a
+factorization function that takes an (n, n) sparse matrix and returns a solve function
+mapping (n,) or (n, k) right hand sides to solutions.
+
+Matrix classes:
+    "spd" - symmetric positive definite (e.g. L*dt + M)
+    "symmetric_indefinite" - symmetric indefinite (e.g. the constrained KKT system [L C^T; C 0])
+    "general" - anything else
+'''
+
+MATRIX_CLASSES = ("spd", "symmetric_indefinite", "general")
+
+_solvers = {}
+_preferences = {"spd": ["cholmod", "splu_spd", "umfpack", "superlu"],
+                "symmetric_indefinite": ["umfpack", "superlu"],
+                "general": ["umfpack", "superlu"]}
+_timings = {}
+
+
+def _record_timing(name, phase, seconds):
+    t = _timings.setdefault(name, {"factorize": 0.0, "solve": 0.0,
+                                   "factorize_calls": 0, "solve_calls": 0})
+    t[phase] += seconds
+    t[phase + "_calls"] += 1
+
+
+def _as_2d(b):
+    b = np.asarray(b, dtype=np.float64)
+    if b.ndim == 1:
+        return b[:, None], True
+    return b, False
+
+
+def _umfpack_factorize(A):
+    Acoo = A.tocoo()
+    Ac = cvxopt.spmatrix(Acoo.data, Acoo.row, Acoo.col, A.shape)
+    F = cvxopt.umfpack.symbolic(Ac)
+    numeric = cvxopt.umfpack.numeric(Ac, F)
+
+    def solve(b):
+        b, flat = _as_2d(b)
+        x = cvxopt.matrix(np.asfortranarray(b))
+        cvxopt.umfpack.solve(Ac, numeric, x)
+        x = np.array(x)
+        return x[:, 0] if flat else x
+    return solve
+
+
+def _superlu_factorize(A):
+    lu = sp.sparse.linalg.splu(sp.sparse.csc_matrix(A))
+    return lu.solve
+
+
+def _splu_spd_factorize(A):
+    # Symmetric mode of SuperLU: a fill reducing ordering of A + A^T applied to both rows and columns, and
+    # diagonal pivots preferred. Still a pivoted LU, but on an SPD matrix the diagonal pivots are always taken,
+    # so it keeps the symmetric ordering and skips the fill of row interchanges.
+    lu = sp.sparse.linalg.splu(sp.sparse.csc_matrix(A), permc_spec="MMD_AT_PLUS_A",
+                               diag_pivot_thresh=0.0, options=dict(SymmetricMode=True))
+    return lu.solve
+
+
+def _cholmod_factorize(A):
+    from sksparse.cholmod import cholesky  # optional dependency
+    factor = cholesky(sp.sparse.csc_matrix(A))
+    return factor
+
+
+def register_sparse_solver(name, factorize, matrix_classes=None, priority=None):
+    """
+    Registers a sparse direct solver backend.
+
+    Parameters
+    ----------
+    name : str
+        Name of the backend
+    factorize : function
+        Takes an (n, n) scipy sparse matrix and returns a function solving for (n,) or (n, k) right hand sides
+    matrix_classes : list of str
+        Matrix classes ("spd", "symmetric_indefinite", "general") this backend should be preferred for.
+        If None, the backend is registered but only used when asked for by name.
+    priority : int
+        Position in the preference list of each matrix class (default None, appends to the end)
+    """
+    _solvers[name] = factorize
+    if matrix_classes is None:
+        return
+    for c in matrix_classes:
+        assert (c in MATRIX_CLASSES and "unknown matrix class")
+        prefs = _preferences[c]
+        if name in prefs:
+            prefs.remove(name)
+        if priority is None:
+            prefs.append(name)
+        else:
+            prefs.insert(priority, name)
+
+
+register_sparse_solver("umfpack", _umfpack_factorize)
+register_sparse_solver("superlu", _superlu_factorize)
+register_sparse_solver("splu_spd", _splu_spd_factorize)
+register_sparse_solver("cholmod", _cholmod_factorize)
+
+
+def sparse_factorize(A, matrix_class="general", solver=None):
+    """
+    Factorizes a sparse matrix with the registered backend best suited to its matrix class,
+    falling back to the next backend in line if one is unavailable or fails.
+
+    Parameters
+    ----------
+    A : (n, n) scipy sparse matrix
+        Matrix to factorize
+    matrix_class : str
+        One of "spd", "symmetric_indefinite" or "general" (default="general")
+    solver : str
+        Name of the backend to use. If None, picks according to matrix_class (default=None)
+
+    Returns
+    -------
+    solve : function
+        Solves A x = b for (n,) or (n, k) right hand sides b
+    name : str
+        Name of the backend that was used
+    """
+    assert (matrix_class in MATRIX_CLASSES and "unknown matrix class")
+    names = [solver] if solver is not None else _preferences[matrix_class]
+    if len(names) == 0:
+        raise RuntimeError("no sparse solver registered for matrix class " + matrix_class)
+
+    for i, name in enumerate(names):
+        start = time.time()
+        try:
+            factor = _solvers[name](A)
+        except Exception as e:
+            if i + 1 < len(names):
+                if name != "cholmod":
+                    warnings.warn("Sparse solver " + name + " failed (" + str(e) + "), trying " + names[i + 1])
+                continue
+            raise
+        _record_timing(name, "factorize", time.time() - start)
+
+        def solve(b, factor=factor, name=name):
+            start = time.time()
+            x = factor(b)
+            _record_timing(name, "solve", time.time() - start)
+            return x
+        return solve, name
+
+
+def sparse_solve(A, b, matrix_class="general", solver=None):
+    """
+    Solves A x = b with the registered backend best suited to the matrix class of A.
+
+    Parameters
+    ----------
+    A : (n, n) scipy sparse matrix
+        Matrix to solve
+    b : (n,) or (n, k) float numpy array
+        Right hand side(s)
+    matrix_class : str
+        One of "spd", "symmetric_indefinite" or "general" (default="general")
+    solver : str
+        Name of the backend to use. If None, picks according to matrix_class (default=None)
+
+    Returns
+    -------
+    x : (n,) or (n, k) float numpy array
+        Solution to A x = b
+    """
+    [solve, name] = sparse_factorize(A, matrix_class=matrix_class, solver=solver)
+    return solve(b)
+
+
+def sparse_solver_timings(reset=False):
+    """
+    Returns the accumulated factorization and solve timings of each backend.
+
+    Parameters
+    ----------
+    reset : bool
+        Whether to clear the timings after reading them (default=False)
+
+    Returns
+    -------
+    timings : dict
+        Maps backend name to a dict with "factorize", "solve" (seconds), "factorize_calls" and "solve_calls"
+    """
+    timings = {name: dict(t) for name, t in _timings.items()}
+    if reset:
+        _timings.clear()
+    return timings
@@ -0,0 +1,177 @@
+import os
+import json
+import struct
+
+import numpy as np
+
+STEP_RECORDING_MAGIC = b"FCDSTEP\0"
+STEP_RECORDING_END = b"FCDEND\0\0"
+STEP_RECORDING_VERSION = 2
+_HEADER = struct.Struct("<8sIIIII")
+
+
+class step_recorder():
+    """
+    Records the exact inputs of a sequence of simulation steps to a compact binary file, to replay them later
+    through a fresh simulation (see read_step_recording and benchmarks/step_replay.py).
+
+    The file is a header with the sizes, the simulation configuration as JSON and the initial simulation state,
+    followed by one float64 record per step with the rig parameters p, optionally the external force f_ext, and
+    the constraint rhs bc if the simulation has constraints. Steps are streamed to disk as they are
+    recorded, so a recording that was never closed (e.g. a crashed app) is still readable up to its last
+    complete step. Steps from a different state object than the previous one (e.g. an app restarting its
+    animation) are replayed from that state's snapshot, kept in a trailer written by close.
+    """
+    def __init__(self, path, num_p, m, num_f=0, num_bc=0, config=None):
+        """
+        Opens a recording
+
+        Parameters
+        ----------
+        path : str
+            File to write the recording to, overwritten if it exists
+        num_p : int
+            Number of rig parameters 12b
+        m : int
+            Dimension of the reduced secondary motion
+        num_f : int
+            Dimension of the recorded external force, m to record it or 0 not to (default=0)
+        num_bc : int
+            Number of constraints c, whose rhs bc is recorded with every step (default=0)
+        config : dict
+            JSON serializable configuration of the simulation, e.g. its mu, rho, h and solver parameters, for the
+            replay to build the same simulation from (default=None)
+        """
+        assert (num_f in [0, m] and "the external force is either recorded in full or not at all")
+        dirname = os.path.dirname(path)
+        if dirname != "":
+            os.makedirs(dirname, exist_ok=True)
+        self.path = path
+        self.num_p = num_p
+        self.m = m
+        self.num_f = num_f
+        self.num_bc = num_bc
+        self.num_frames = 0
+        config = json.dumps({} if config is None else config).encode("utf-8")
+        # padded with spaces, so that the float64 records stay 8 byte aligned
+        config += b" " * (-len(config) % 8)
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(STEP_RECORDING_MAGIC, STEP_RECORDING_VERSION, num_p, m, num_f, num_bc))
+        self._file.write(struct.pack("<I", len(config)))
+        self._file.write(config)
+        self._record = np.zeros(num_p + num_f + num_bc)
+        self._state = None
+        self._resets = []
+
+    def _snapshot(self, state):
+        return np.concatenate([np.ravel(state.z_curr), np.ravel(state.z_prev),
+                               np.ravel(state.p_curr), np.ravel(state.p_prev)]).astype(np.float64)
+
+    def record(self, p, state, f_ext=None, bc=None):
+        """
+        Records one step, before it is taken
+
+        Parameters
+        ----------
+        p : (12b, 1) float numpy array
+            Rig parameters the step is taken to
+        state : fast_cd_state
+            State the step is taken from
+        f_ext : (m, 1) float numpy array
+            External force of the step. Recorded as 0 if None (default=None)
+        bc : (c, 1) float numpy array
+            Constraint rhs of the step. Recorded as 0 if None (default=None)
+        """
+        if self._state is not state:
+            if self._state is None:
+                # the initial state is part of the header
+                self._file.write(self._snapshot(state).tobytes())
+            else:
+                self._resets.append((self.num_frames, self._snapshot(state)))
+            self._state = state
+        self._record[:self.num_p] = np.ravel(p)
+        if self.num_f > 0:
+            self._record[self.num_p:self.num_p + self.num_f] = 0.0 if f_ext is None else np.ravel(f_ext)
+        if self.num_bc > 0:
+            self._record[self.num_p + self.num_f:] = 0.0 if bc is None else np.ravel(bc)
+        self._file.write(self._record.tobytes())
+        self.num_frames += 1
+
+    def close(self):
+        """
+        Writes the trailer and closes the file
+        """
+        if self._file is None:
+            return
+        if self._state is None:
+            self._file.write(np.zeros(2 * (self.m + self.num_p)).tobytes())
+        for [frame, snapshot] in self._resets:
+            self._file.write(struct.pack("<q", frame))
+            self._file.write(snapshot.tobytes())
+        self._file.write(struct.pack("<q", len(self._resets)))
+        self._file.write(STEP_RECORDING_END)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_step_recording(path):
+    """
+    Reads a recording written by step_recorder
+
+    Parameters
+    ----------
+    path : str
+        Recording file
+
+    Returns
+    -------
+    recording : dict
+        P, the (12b, frames) rig parameters of every step, one column per step, F, the (m, frames) external
+        force of every step or None if it wasn't recorded, bc, the (c, frames) constraint rhs of every step or
+        None if the simulation had no constraints, config, the configuration of the simulation, and states,
+        the frames at which the replay has to start from a new state, the first one being frame 0, each with
+        the (z_curr, p_curr, z_prev, p_prev) to build it from
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    [magic, version, num_p, m, num_f, num_bc] = _HEADER.unpack_from(data, 0)
+    assert (magic == STEP_RECORDING_MAGIC and "not a step recording")
+    assert (version == STEP_RECORDING_VERSION and "step recording written by an incompatible version")
+    [config_size] = struct.unpack_from("<I", data, _HEADER.size)
+    config_start = _HEADER.size + 4
+    config = json.loads(data[config_start:config_start + config_size].decode("utf-8"))
+
+    snapshot_start = config_start + config_size
+    snapshot_size = 8 * 2 * (m + num_p)
+    record_size = num_p + num_f + num_bc
+    frame_size = 8 * record_size
+    start = snapshot_start + snapshot_size
+    end = len(data)
+    resets = []
+    if data[-8:] == STEP_RECORDING_END:
+        [num_resets] = struct.unpack_from("<q", data, len(data) - 16)
+        end = len(data) - 16 - num_resets * (8 + snapshot_size)
+        for i in range(num_resets):
+            offset = end + i * (8 + snapshot_size)
+            [frame] = struct.unpack_from("<q", data, offset)
+            resets.append((frame, np.frombuffer(data, np.float64, 2 * (m + num_p), offset + 8)))
+    num_frames = (end - start) // frame_size
+
+    records = np.frombuffer(data, np.float64, num_frames * record_size, start).reshape(num_frames, record_size)
+    P = np.array(records[:, :num_p].T, order="F")
+    F = np.array(records[:, num_p:num_p + num_f].T, order="F") if num_f > 0 else None
+    bc = np.array(records[:, num_p + num_f:].T, order="F") if num_bc > 0 else None
+
+    def unpack(s):
+        return (s[:m].reshape(-1, 1).copy(), s[2 * m:2 * m + num_p].reshape(-1, 1).copy(),
+                s[m:2 * m].reshape(-1, 1).copy(), s[2 * m + num_p:].reshape(-1, 1).copy())
+
+    initial = np.frombuffer(data, np.float64, 2 * (m + num_p), snapshot_start)
+    states = [(0, unpack(initial))] + [(frame, unpack(s)) for [frame, s] in resets]
+    return dict(P=P, F=F, bc=bc, config=config, states=states)
@@ -1,6 +1,6 @@
 import numpy as np
-import cvxopt
-import cvxopt.umfpack
+
+from .sparse_solver import sparse_solve
 
 def umfpack_lu_solve(A, b):
     """
@@ -9,18 +9,13 @@ def umfpack_lu_solve(A, b):
     ----------
     A : (n, n) float numpy array
         Matrix to solve
-    b : (n, ) float numpy array
-        Right hand side
+    b : (n, ) or (n, k) float numpy array
+        Right hand side(s)
 
     Returns
     -------
-    x : (n, ) float numpy array
-        Solution to Ax = b
+    x : (n, 1) or (n, k) float numpy array
+        Solution to Ax = b, a column for a (n, ) right hand side like cvxopt returns it
     """
-    [I, J] = A.nonzero()
-    v = A.data
-    Ac= cvxopt.spmatrix(v, I, J, A.shape)
-    bc = cvxopt.matrix(b)
-    cvxopt.umfpack.linsolve(Ac, bc)
-    cnp = np.array(bc)
-    return cnp
\ No newline at end of file
+    x = sparse_solve(A, b, solver="umfpack")
+    return x.reshape(-1, 1) if np.ndim(b) == 1 else x
@@ -0,0 +1,57 @@
+import os
+import tempfile
+
+from .context import fast_cody as fcd
+from .context import unittest
+from .context import numpy as np
+from .context import igl
+from .test_fast_cd_sim import tet_grid, swing
+
+
+class TestExportDeformedMeshes(unittest.TestCase):
+    def setUp(self):
+        [self.V, self.T] = tet_grid(2)
+        self.Wp = np.ones((self.V.shape[0], 1))
+        # monomial weights, whose products with [x, y, z, 1] in B are all distinct, so B has full rank
+        self.Ws = np.column_stack((self.V ** 2, np.prod(self.V, axis=1)))
+        self.J = fcd.lbs_jacobian(self.V, self.Wp)
+        self.B = fcd.lbs_jacobian(self.V, self.Ws)
+        self.sim = fcd.linear_cd_sim(self.V, self.T, self.B, self.J, mu=10, rho=1, h=1e-2)
+        self.P = swing(10)
+
+    def test_npy(self):
+        path = os.path.join(tempfile.mkdtemp(), "clip.npy")
+        report = fcd.export_deformed_meshes(self.sim, self.V, self.T, self.Wp, self.Ws, self.P, path, chunk_size=3)
+        U = np.load(path)
+        F = np.load(report["faces_file"])
+        self.assertEqual(report["frames"], 10)
+        # every boundary vertex of the 2x2x2 grid, and 2 triangles per face of its 4x6 boundary squares
+        self.assertEqual(U.shape, (10, 26, 3))
+        self.assertEqual(F.shape, (48, 3))
+
+        # same clip, simulated in one go and reconstructed with the full space jacobians
+        m = self.B.shape[1]
+        Z = fcd.linear_cd_sim(self.V, self.T, self.B, self.J, mu=10, rho=1, h=1e-2).step_sequence(
+            self.P, fcd.linear_cd_state(np.zeros(m), self.P[:, 0]))
+        self.assertFalse(np.allclose(Z, 0))
+        U0 = (self.J @ self.P + self.B @ Z).reshape(3, -1, 10).transpose(2, 1, 0)
+        # the exported vertices are the boundary ones, in the order the faces index them
+        I = np.unique(igl.boundary_facets(self.T))
+        self.assertTrue(np.allclose(U, U0[:, I]))
+
+    def test_npy_num_frames(self):
+        path = os.path.join(tempfile.mkdtemp(), "clip.npy")
+        frames = (self.P[:, i] for i in range(10))
+        with self.assertRaises(AssertionError):
+            fcd.export_deformed_meshes(self.sim, self.V, self.T, self.Wp, self.Ws, frames, path, num_frames=12)
+
+    def test_ply_sequence_from_generator(self):
+        path = os.path.join(tempfile.mkdtemp(), "frame_{:03d}.ply")
+        frames = (self.P[:, i] for i in range(10))
+        report = fcd.export_deformed_meshes(self.sim, self.V, self.T, self.Wp, self.Ws, frames, path, chunk_size=4)
+        self.assertEqual(report["frames"], 10)
+        self.assertTrue(os.path.isfile(path.format(9)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+from .context import fast_cody as fcd
+from .context import unittest
+from .context import numpy as np
+from .test_fast_cd_sim import tet_grid, swing
+
+
+class TestFastCDCrowdSim(unittest.TestCase):
+    def setUp(self):
+        [V, T] = tet_grid(3)
+        J = fcd.lbs_jacobian(V, np.ones((V.shape[0], 1)))
+        W = np.column_stack((V ** 2, np.prod(V, axis=1)))
+        B = fcd.lbs_jacobian(V, W)
+        centroids = V[T].mean(axis=1)
+        l = ((centroids[:, 0] > 0.5) + 2 * (centroids[:, 1] > 0.5)).astype(np.int32)
+        self.sim = lambda: fcd.fast_cd_sim(V, T, B, l, J, mu=1e3)
+        # the same swing, offset in time for every instance
+        P = swing(16)
+        self.P = np.stack([P[:, i:i + 12] for i in [0, 2, 4]], axis=1)
+
+    def test_matches_independent_sims(self):
+        crowd = fcd.fast_cd_crowd_sim(self.sim(), 3, p0=self.P[:, :, 0])
+        Z = np.stack([crowd.step(self.P[:, :, f]).copy() for f in range(12)], axis=2)
+        self.assertFalse(np.allclose(Z, 0))
+        for i in range(3):
+            sim = self.sim()
+            m = Z.shape[0]
+            st = fcd.fast_cd_state(np.zeros((m, 1)), self.P[:, [i], 0])
+            Zi = sim.step_sequence(self.P[:, i, :], st)
+            self.assertTrue(np.allclose(Z[:, i, :], Zi))
+
+    def test_reset(self):
+        crowd = fcd.fast_cd_crowd_sim(self.sim(), 3, p0=self.P[:, :, 0])
+        for f in range(6):
+            crowd.step(self.P[:, :, f])
+        crowd.reset(1, p=self.P[:, 1, 0])
+        self.assertTrue(np.array_equal(crowd.Z_curr[:, 1], np.zeros(crowd.Z_curr.shape[0])))
+        self.assertTrue(np.array_equal(crowd.P_prev[:, 1], self.P[:, 1, 0]))
+        self.assertFalse(np.allclose(crowd.Z_curr[:, 0], 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+from .context import fast_cody as fcd
+from .context import unittest
+from .context import numpy as np
+from .test_fast_cd_sim import tet_grid, swing
+
+
+class TestFastCDLODSim(unittest.TestCase):
+    def setUp(self):
+        [V, T] = tet_grid(3)
+        J = fcd.lbs_jacobian(V, np.ones((V.shape[0], 1)))
+        W = np.column_stack((V ** 2, np.prod(V, axis=1)))
+        self.P = swing(20)
+        self.lod = fcd.fast_cd_lod_sim(V, T, J, self.P[:, [0]], num_modes=[2, 4], num_clusters=[2, 4], W=W,
+                                       E=np.arange(1.0, 5.0), blend_frames=4, mu=1e3)
+
+    def test_projections(self):
+        lod = self.lod
+        [up, down] = [lod.projections[0][1], lod.projections[1][0]]
+        # the subspaces are nested: going up embeds exactly, and coming back down is the identity
+        self.assertTrue(np.allclose(lod.B[1] @ up, lod.B[0]))
+        self.assertTrue(np.allclose(down @ up, np.eye(up.shape[1])))
+        self.assertTrue(np.allclose(up[lod.columns[0]], np.eye(up.shape[1])))
+
+    def test_switch_doesnt_pop(self):
+        lod = self.lod
+        B = lod.B[-1]
+        for i in range(1, 8):
+            lod.step(self.P[:, [i]])
+        u = B @ lod.z_full
+        self.assertFalse(np.allclose(u, 0))
+        lod.set_level(0)
+        self.assertTrue(np.allclose(B @ lod.z_full, u))
+
+        # the dropped motion fades out linearly over blend_frames steps
+        residual = lod._residual.copy()
+        for i in range(8, 12):
+            lod.step(self.P[:, [i]])
+            z = np.zeros(residual.shape[0])
+            z[lod.columns[0]] = np.ravel(lod.state.z_curr)
+            blend = (11 - i) / 4
+            self.assertTrue(np.allclose(np.ravel(lod.z_full), z + blend * residual))
+        self.assertTrue(lod._blend == 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import tempfile
+
+from .context import fast_cody as fcd
+from .context import unittest
+from .context import numpy as np
+
+
+def tet_grid(n):
+    # unit cube split into n^3 cubes of 6 positively oriented tets each
+    x = np.linspace(0, 1, n + 1)
+    V = np.stack(np.meshgrid(x, x, x, indexing="ij"), axis=-1).reshape(-1, 3)
+    corners = [[0, 1, 3, 7], [0, 3, 2, 7], [0, 2, 6, 7], [0, 6, 4, 7], [0, 4, 5, 7], [0, 5, 1, 7]]
+    T = []
+    for [i, j, k] in np.ndindex(n, n, n):
+        c = [((i + (b & 1)) * (n + 1) + j + ((b >> 1) & 1)) * (n + 1) + k + ((b >> 2) & 1) for b in range(8)]
+        for t in corners:
+            T.append([c[a] for a in t])
+    T = np.array(T, dtype=np.int32)
+    vol = np.einsum("ij,ij->i", np.cross(V[T[:, 1]] - V[T[:, 0]], V[T[:, 2]] - V[T[:, 0]]), V[T[:, 3]] - V[T[:, 0]])
+    T[vol < 0, 0:2] = T[vol < 0, 1::-1]
+    return V, T
+
+
+def swing(frames):
+    # rig parameters of a single affine handle swinging about the z axis
+    P = np.zeros((3, 1, 4, frames))
+    for f in range(frames):
+        a = 0.5 * np.sin(0.3 * f)
+        P[:, 0, :3, f] = [[np.cos(a), -np.sin(a), 0], [np.sin(a), np.cos(a), 0], [0, 0, 1]]
+    return P.reshape(12, frames)
+
+
+class TestFastCDSim(unittest.TestCase):
+    def setUp(self):
+        [self.V, self.T] = tet_grid(3)
+        self.J = fcd.lbs_jacobian(self.V, np.ones((self.V.shape[0], 1)))
+        # monomial weights, whose products with [x, y, z, 1] in B are all distinct
+        W = np.column_stack((self.V ** 2, np.prod(self.V, axis=1)))
+        self.B = fcd.lbs_jacobian(self.V, W)
+        centroids = self.V[self.T].mean(axis=1)
+        self.l = ((centroids[:, 0] > 0.5) + 2 * (centroids[:, 1] > 0.5)).astype(np.int32)
+        self.P = swing(12)
+
+    def sim(self, **kwargs):
+        return fcd.fast_cd_sim(self.V, self.T, self.B, self.l, self.J, **kwargs)
+
+    def step_clip(self, sim, frames, st=None):
+        m = self.B.shape[1]
+        st = fcd.fast_cd_state(np.zeros((m, 1)), self.P[:, [0]]) if st is None else st
+        z = np.zeros((m, 1))
+        Z = np.zeros((m, frames))
+        solves = []
+        for i in range(frames):
+            sim.step_into(self.P[:, [i]], st, out=z)
+            st.update(z, self.P[:, [i]])
+            Z[:, i] = z[:, 0]
+            solves.append(sim.last_solve)
+        return Z, solves
+
+    def test_telemetry_ring_buffer(self):
+        sim = self.sim(mu=1e3)
+        tel = sim.enable_telemetry(capacity=4)
+        [Z, solves] = self.step_clip(sim, 10)
+        stats = tel.stats()
+        self.assertTrue(tel.count == 10)
+        self.assertTrue(np.array_equal(stats["step"], np.arange(6, 10)))
+        self.assertTrue(np.array_equal(stats["iters"], [s[0] for s in solves[6:]]))
+        self.assertTrue(np.allclose(stats["residual"], [s[1] for s in solves[6:]]))
+        self.assertTrue(tel.summary()["steps"] == 4)
+        tel.reset()
+        self.assertTrue(tel.summary()["steps"] == 0)
+
+    def test_telemetry_detailed(self):
+        sim = self.sim(mu=1e3, max_iters=100, threshold=1e-10)
+        tel = sim.enable_telemetry(detailed=True)
+        [Z, solves] = self.step_clip(sim, 4)
+        [Z0, solves0] = self.step_clip(self.sim(mu=1e3, max_iters=100, threshold=1e-10), 4)
+        stats = tel.stats()
+        for i in range(4):
+            history = stats["residual_history"][i]
+            self.assertTrue(np.count_nonzero(~np.isnan(history)) == stats["iters"][i])
+            self.assertTrue(history[stats["iters"][i] - 1] == stats["residual"][i])
+        # one iteration at a time from the previous iterate ends where the full solve does
+        self.assertTrue(np.allclose(Z, Z0, atol=1e-6))
+
+    def test_time_budget(self):
+        sim = self.sim(mu=1e3, max_iters=30, threshold=1e-14, time_budget=0.0)
+        [Z, solves] = self.step_clip(sim, 4)
+        for [iters, res, converged] in solves[1:]:
+            self.assertTrue(iters < 30)
+            self.assertFalse(converged)
+        # every iteration is a single iteration native step
+        self.assertTrue(sim._iter_sim.sol().prev_solve_iters == 1)
+
+    def test_carry_unconverged(self):
+        m = self.B.shape[1]
+        sim = self.sim(mu=1e3, threshold=1e-14, time_budget=0.0, carry_unconverged=True)
+        plain = self.sim(mu=1e3, threshold=1e-14, time_budget=0.0)
+        st = fcd.fast_cd_state(np.zeros((m, 1)), self.P[:, [0]])
+        st_plain = fcd.fast_cd_state(np.zeros((m, 1)), self.P[:, [0]])
+        [z1, z2, z1_plain, z2_plain] = [np.zeros((m, 1)) for i in range(4)]
+
+        sim.step_into(self.P[:, [1]], st, out=z1)
+        plain.step_into(self.P[:, [1]], st_plain, out=z1_plain)
+        self.assertTrue(np.allclose(z1, z1_plain))
+        self.assertFalse(np.allclose(z1, 0))
+        st.update(z1, self.P[:, [1]])
+        st_plain.update(z1_plain, self.P[:, [1]])
+
+        # the unconverged first step started from z = 0, so its increment z1 is carried into the next guess
+        sim.step_into(self.P[:, [2]], st, out=z2)
+        plain.step_into(self.P[:, [2]], st_plain, out=z2_plain, z=2 * z1_plain)
+        self.assertTrue(np.allclose(z2, z2_plain))
+
+    def test_update_parameters(self):
+        sim = self.sim(mu=1e3)
+        sim.update_parameters(mu=1e4)
+        [Z, solves] = self.step_clip(sim, 6)
+        [Z0, solves0] = self.step_clip(self.sim(mu=1e4), 6)
+        self.assertTrue(np.allclose(Z, Z0))
+
+        sim.update_parameters(mu=3e3, rho=2e3)
+        [Z, solves] = self.step_clip(sim, 6)
+        [Z0, solves0] = self.step_clip(self.sim(mu=3e3, rho=2e3), 6)
+        self.assertTrue(np.allclose(Z, Z0))
+        self.assertFalse(np.allclose(Z, self.step_clip(self.sim(mu=1e3), 6)[0]))
+
+    def test_recording_config(self):
+        sim = self.sim(mu=1e3, rho=2e3)
+        sim.update_parameters(h=2e-2)
+        config = sim.recording_config()
+        self.assertEqual([config["mu"], config["rho"], config["h"]], [1e3, 2e3, 2e-2])
+
+    def test_update_parameters_cache_entry(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            sim = self.sim(mu=1e3, cache_dir=cache_dir, read_cache=True, write_cache=True)
+            first_dir = sim.cache_dir
+            sim.update_parameters(mu=1e4, h=2e-2)
+            # the precompute depends on mu, rho and h, so the new parameters get their own entry
+            self.assertTrue(sim.cache_dir != first_dir)
+            self.assertTrue(fcd.read_sim_cache_manifest(first_dir)["mu"] == 1e3)
+            self.assertTrue(fcd.read_sim_cache_manifest(sim.cache_dir)["mu"] == 1e4)
+            self.assertTrue(fcd.read_sim_cache_manifest(sim.cache_dir)["h"] == 2e-2)
+            [Z, solves] = self.step_clip(sim, 6)
+            [Z0, solves0] = self.step_clip(self.sim(mu=1e4, h=2e-2), 6)
+            self.assertTrue(np.allclose(Z, Z0))
+
+            # switching back reads the first entry, and a sim with other parameters doesn't read either
+            sim.update_parameters(mu=1e3, h=1e-2)
+            self.assertTrue(sim.cache_dir == first_dir)
+            [Z, solves] = self.step_clip(sim, 6)
+            [Z0, solves0] = self.step_clip(self.sim(mu=1e3), 6)
+            self.assertTrue(np.allclose(Z, Z0))
+            with self.assertWarns(UserWarning):
+                sim = self.sim(mu=5e3, cache_dir=cache_dir, read_cache=True)
+            self.assertFalse(fcd.read_sim_cache_manifest(sim.cache_dir))
+            [Z, solves] = self.step_clip(sim, 6)
+            [Z0, solves0] = self.step_clip(self.sim(mu=5e3), 6)
+            self.assertTrue(np.allclose(Z, Z0))
+
+if __name__ == '__main__':
+    unittest.main()
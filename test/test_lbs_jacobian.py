@@ -20,6 +20,18 @@ class TestLBSJacobian(unittest.TestCase):
 
         self.assertTrue(np.isclose(X_test, X).all)
 
+    def test_float32(self):
+        X = np.random.rand(100, 3)
+        W = np.random.rand(100, 4)
+        # float64 unless asked otherwise, whatever the inputs
+        self.assertTrue(fcd.lbs_jacobian(X.astype(np.float32), W.astype(np.float32)).dtype == np.float64)
+        J = fcd.lbs_jacobian(X, W)
+        J32 = fcd.lbs_jacobian(X, W, dtype=np.float32)
+        self.assertTrue(J32.dtype == np.float32)
+        p = np.random.rand(J.shape[1])
+        U = J @ p
+        self.assertTrue(np.abs(J32 @ p.astype(np.float32) - U).max() <= 1e-5 * np.abs(U).max())
+
 
 
 if __name__ == '__main__':
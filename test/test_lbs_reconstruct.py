@@ -0,0 +1,40 @@
+from .context import fast_cody as fcd
+from .context import unittest
+from .context import numpy as np
+
+
+class TestLBSReconstruct(unittest.TestCase):
+    def setUp(self):
+        self.V = np.random.rand(50, 3)
+        self.Wp = np.random.rand(50, 2)
+        self.Ws = np.random.rand(50, 3)
+        self.J = fcd.lbs_jacobian(self.V, self.Wp)
+        self.B = fcd.lbs_jacobian(self.V, self.Ws)
+
+    def test_matches_jacobians(self):
+        p = np.random.rand(24, 1)
+        z = np.random.rand(36, 1)
+        U = fcd.lbs_reconstruct(self.V, self.Wp, self.Ws, p, z, chunk_size=16)
+        self.assertTrue(np.allclose(U, np.reshape(self.J @ p + self.B @ z, (50, 3), order="F")))
+
+    def test_frames(self):
+        P = np.random.rand(24, 4)
+        Z = np.random.rand(36, 4)
+        U = fcd.lbs_reconstruct(self.V, self.Wp, self.Ws, P, Z, chunk_size=7)
+        for f in range(4):
+            self.assertTrue(np.allclose(U[f], np.reshape(self.J @ P[:, f] + self.B @ Z[:, f], (50, 3), order="F")))
+        U = fcd.lbs_reconstruct(self.V, self.Wp, None, P)
+        self.assertTrue(np.allclose(U[2], np.reshape(self.J @ P[:, 2], (50, 3), order="F")))
+
+    def test_dtype_and_out(self):
+        # float64 secondary motion isn't truncated by a float32 rig
+        [V, Wp, P] = [self.V.astype(np.float32), self.Wp.astype(np.float32), np.random.rand(24, 2).astype(np.float32)]
+        U = fcd.lbs_reconstruct(V, Wp, self.Ws, P, np.random.rand(36, 2))
+        self.assertTrue(U.dtype == np.float64)
+        out = np.zeros((50, 2, 3)).transpose(1, 0, 2)
+        with self.assertRaises(AssertionError):
+            fcd.lbs_reconstruct(self.V, self.Wp, self.Ws, P, np.random.rand(36, 2), out=out)
+
+
+if __name__ == '__main__':
+    unittest.main()
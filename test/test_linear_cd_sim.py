@@ -0,0 +1,45 @@
+from .context import fast_cody as fcd
+from .context import unittest
+from .context import numpy as np
+
+
+class TestLinearCDSim(unittest.TestCase):
+    def setUp(self):
+        self.V = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1.]])
+        self.T = np.array([[0, 1, 2, 3]])
+        self.J = fcd.lbs_jacobian(self.V, np.ones((4, 1)))
+        self.B = np.random.rand(12, 4)
+        self.sim = fcd.linear_cd_sim(self.V, self.T, self.B, self.J, mu=10, rho=1, h=1e-2)
+
+    def test_rest(self):
+        p = np.eye(3, 4).reshape(-1, 1)
+        st = fcd.linear_cd_state(np.zeros((4, 1)), p)
+        z = self.sim.step(p, st)
+        self.assertTrue(np.allclose(z, 0))
+
+    def test_constant_velocity(self):
+        # a rig translating at constant velocity has no secondary motion
+        P = np.tile(np.eye(3, 4)[:, :, None], (1, 1, 10))
+        P[0, 3, :] = 0.1 * np.arange(10)
+        P = P.reshape(12, 10)
+        st = fcd.linear_cd_state(np.zeros(4), P[:, 0], p_prev=P[:, 0] - (P[:, 1] - P[:, 0]))
+        Z = self.sim.step_sequence(P[:, 1:], st)
+        self.assertTrue(np.allclose(Z, 0))
+
+    def test_float32(self):
+        # a swinging rig, simulated in double and single precision
+        P = np.zeros((3, 4, 20))
+        for f in range(20):
+            a = 0.5 * np.sin(0.3 * f)
+            P[:, :3, f] = [[np.cos(a), -np.sin(a), 0], [np.sin(a), np.cos(a), 0], [0, 0, 1]]
+        P = P.reshape(12, 20)
+        Z = self.sim.step_sequence(P[:, 1:], fcd.linear_cd_state(np.zeros(4), P[:, 0]))
+        sim32 = fcd.linear_cd_sim(self.V, self.T, self.B, self.J, mu=10, rho=1, h=1e-2, dtype=np.float32)
+        Z32 = sim32.step_sequence(P[:, 1:].astype(np.float32),
+                                  fcd.linear_cd_state(np.zeros(4), P[:, 0], dtype=np.float32))
+        self.assertTrue(Z32.dtype == np.float32)
+        self.assertTrue(np.abs(Z32 - Z).max() <= 1e-3 * np.abs(Z).max())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import tempfile
+
+from .context import fast_cody as fcd
+from .context import unittest
+from .context import numpy as np
+class TestPrecomputeGraph(unittest.TestCase):
+    def test_memoized_run(self):
+        calls = []
+        def double(x):
+            calls.append("double")
+            return 2 * x
+        def square(x):
+            calls.append("square")
+            return x * x
+        def add(double, square):
+            calls.append("add")
+            return double + square
+
+        stages = [fcd.precompute_stage("double", double, ["x"]),
+                  fcd.precompute_stage("square", square, ["x"]),
+                  fcd.precompute_stage("add", add, ["double", "square"])]
+        g = fcd.precompute_graph(stages)
+        x = np.arange(5.0)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            out = g.run({"x": x}, ["add"], cache_dir=cache_dir)
+            self.assertTrue(np.allclose(out["add"], 2 * x + x * x))
+            self.assertTrue(sorted(calls) == ["add", "double", "square"])
+
+            # everything is memoized, only the target gets loaded
+            calls.clear()
+            out = g.run({"x": x}, ["add"], cache_dir=cache_dir)
+            self.assertTrue(np.allclose(out["add"], 2 * x + x * x))
+            self.assertTrue(len(calls) == 0)
+            self.assertTrue("double" not in out)
+
+            # new inputs invalidate every stage downstream of them
+            out = g.run({"x": x + 1}, ["add"], cache_dir=cache_dir, executor=None)
+            self.assertTrue(np.allclose(out["add"], 2 * (x + 1) + (x + 1) ** 2))
+            self.assertTrue(len(calls) == 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
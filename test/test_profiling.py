@@ -0,0 +1,47 @@
+from .context import fast_cody as fcd
+from .context import unittest
+from .context import numpy as np
+
+
+class TestProfiling(unittest.TestCase):
+    def tearDown(self):
+        fcd.disable_profiling()
+        fcd.reset_profiling()
+
+    def test_disabled(self):
+        fcd.disable_profiling()
+        fcd.reset_profiling()
+        fcd.lbs_jacobian(np.random.rand(4, 3), np.ones((4, 1)))
+        with fcd.profile_span("block"):
+            pass
+        self.assertEqual(fcd.profiling_spans(), [])
+
+    def test_nested(self):
+        fcd.enable_profiling()
+        with fcd.profile_span("block") as span:
+            J = fcd.lbs_jacobian(np.random.rand(4, 3), np.ones((4, 1)))
+            span.set(size=J.size)
+        spans = fcd.profiling_spans()
+        self.assertEqual([s["name"] for s in spans], ["lbs_jacobian", "block"])
+        self.assertEqual(spans[0]["parent"], "block")
+        self.assertEqual(spans[0]["attrs"]["out"]["shape"], [12, 12])
+        self.assertEqual(spans[1]["attrs"]["size"], 144)
+        self.assertIn("lbs_jacobian", fcd.profiling_table())
+
+    def test_memory(self):
+        fcd.enable_profiling(memory=True)
+        with fcd.profile_span("outer"):
+            kept = np.zeros(2 ** 20)
+            with fcd.profile_span("inner"):
+                np.zeros(4 * 2 ** 20).sum()
+        fcd.disable_profiling()
+        [inner, outer] = [s["memory"] for s in fcd.profiling_spans()]
+        self.assertGreaterEqual(inner["peak_bytes"], 32 * 2 ** 20)
+        self.assertLess(inner["retained_bytes"], 2 ** 20)
+        self.assertGreaterEqual(outer["peak_bytes"], inner["peak_bytes"])
+        self.assertGreaterEqual(outer["retained_bytes"], 8 * 2 ** 20)
+        self.assertIn("outer", fcd.profiling_memory_table())
+
+
+if __name__ == '__main__':
+    unittest.main()
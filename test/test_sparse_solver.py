@@ -0,0 +1,34 @@
+from .context import fast_cody as fcd
+from .context import unittest
+from .context import numpy as np
+from .context import scipy as sp
+class TestSparseSolver(unittest.TestCase):
+    def test_backends_agree_spd(self):
+        n = 50
+        R = sp.sparse.random(n, n, density=0.1, random_state=0)
+        A = (R @ R.T + sp.sparse.identity(n)).tocsc()
+        b = np.random.randn(n, 3)
+
+        x = np.linalg.solve(A.toarray(), b)
+        for solver in ["umfpack", "superlu", "splu_spd"]:
+            x2 = fcd.sparse_solve(A, b, solver=solver)
+            self.assertTrue(np.allclose(x, x2))
+        x2 = fcd.sparse_solve(A, b, matrix_class="spd")
+        self.assertTrue(np.allclose(x, x2))
+
+        timings = fcd.sparse_solver_timings(reset=True)
+        self.assertTrue(timings["umfpack"]["solve_calls"] >= 1)
+        self.assertTrue(len(fcd.sparse_solver_timings()) == 0)
+
+    def test_single_rhs_shape(self):
+        A = sp.sparse.diags(np.arange(1, 11, dtype=float)).tocsc()
+        b = np.ones(10)
+        x = fcd.sparse_solve(A, b, matrix_class="symmetric_indefinite")
+        self.assertTrue(x.shape == (10,))
+        self.assertTrue(np.allclose(A @ x, b))
+        x = fcd.umfpack_lu_solve(A, b)
+        self.assertTrue(x.shape == (10, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
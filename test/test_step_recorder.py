@@ -0,0 +1,52 @@
+import os
+import tempfile
+from types import SimpleNamespace
+
+from .context import fast_cody as fcd
+from .context import unittest
+from .context import numpy as np
+
+
+class TestStepRecorder(unittest.TestCase):
+    def state(self, m, num_p):
+        return SimpleNamespace(z_curr=np.random.rand(m, 1), z_prev=np.random.rand(m, 1),
+                               p_curr=np.random.rand(num_p, 1), p_prev=np.random.rand(num_p, 1))
+
+    def test_roundtrip(self):
+        path = os.path.join(tempfile.mkdtemp(), "rec.fcdrec")
+        P = np.random.rand(12, 5)
+        F = np.random.rand(4, 5)
+        bc = np.random.rand(2, 5)
+        config = dict(num_modes=1, mu=1e4, h=1e-2, warm_start="current", time_budget=None)
+        [st0, st1] = [self.state(4, 12), self.state(4, 12)]
+        with fcd.step_recorder(path, 12, 4, 4, 2, config) as rec:
+            for i in range(5):
+                rec.record(P[:, i], st0 if i < 3 else st1, F[:, [i]], bc[:, [i]])
+        recording = fcd.read_step_recording(path)
+        [P2, F2, bc2, states] = [recording["P"], recording["F"], recording["bc"], recording["states"]]
+        self.assertTrue(np.array_equal(P, P2))
+        self.assertTrue(np.array_equal(F, F2))
+        self.assertTrue(np.array_equal(bc, bc2))
+        self.assertEqual(recording["config"], config)
+        self.assertEqual([s[0] for s in states], [0, 3])
+        self.assertTrue(np.array_equal(states[1][1][0], st1.z_curr))
+        self.assertTrue(np.array_equal(states[1][1][3], st1.p_prev))
+
+    def test_unclosed(self):
+        path = os.path.join(tempfile.mkdtemp(), "rec.fcdrec")
+        P = np.random.rand(12, 3)
+        rec = fcd.step_recorder(path, 12, 4)
+        for i in range(3):
+            rec.record(P[:, i], self.state(4, 12) if i == 0 else rec._state)
+        rec._file.flush()
+        recording = fcd.read_step_recording(path)
+        self.assertTrue(np.array_equal(P, recording["P"]))
+        self.assertIsNone(recording["F"])
+        self.assertIsNone(recording["bc"])
+        self.assertEqual(recording["config"], {})
+        self.assertEqual(len(recording["states"]), 1)
+        rec.close()
+
+
+if __name__ == '__main__':
+    unittest.main()